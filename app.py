@@ -1,24 +1,153 @@
+from boot_timing import BootTimer
 import os
-from flask import Flask, request, jsonify, render_template, url_for, redirect, flash
+import click
+import json
+import time
+import base64
+from collections import defaultdict
+from flask import Flask, Blueprint, Response, current_app, request, jsonify, render_template, url_for, redirect, flash, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin, current_user
+from sqlalchemy import tuple_, event, inspect, text
+from sqlalchemy.orm import joinedload
 from datetime import datetime
+from ranking import score_of, hot_rank, register_sql_functions
+from votes import VoteBuffer, VOTE_VALUES
+from sqlite_profile import DB_PATH, apply_pragmas, engine_options, active_pragmas, print_pragmas
+from response_cache import ResponseCache
+from search import create_search_schema, rebuild_search_index, search
+from image_queue import create_queue_schema, queue_stats
+from image_store import is_hashed, srcset, backfill_uploads
+from post_stats import record_comments, check_comment_counts
+from world_dump import export_world, import_world, DumpError
+from live_feed import LiveFeed
+from frontpage import Frontpage, frontpage_table, create_frontpage_schema, rebuild_frontpage, FRONTPAGE_SORTS
+from auth import PasswordHasher, SessionUserCache, HasherBusy
+from instrumentation import Instrumentation, POPULATOR_STATS_PATH, read_stats_file, stats_file_metrics
+
+db = SQLAlchemy()
+password_hasher = PasswordHasher()
+session_users = SessionUserCache()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+vote_buffer = VoteBuffer()
+response_cache = ResponseCache()
+live_feed = LiveFeed()
+instrumentation = Instrumentation()
+frontpage = Frontpage()
+
+# Vote counts change when the buffer flushes, not when the vote is clicked
+def invalidate_voted(deltas):
+    targets = {target_type for target_type, target_id in deltas}
+    if 'post' in targets:
+        response_cache.invalidate('posts')
+    if 'comment' in targets:
+        response_cache.invalidate('comments')
+
+vote_buffer.on_flush.append(invalidate_voted)
+vote_buffer.on_flush.append(live_feed.publish_votes)
+frontpage.on_rebuild.append(lambda counts: response_cache.invalidate('posts:frontpage'))
+
+# All routes and CLI commands live on this blueprint; create_app() registers it
+main = Blueprint('main', __name__, cli_group=None)
+
+# Importing this module has no side effects: the app, its instance folder and
+# the database engine only come into being when create_app() is called
+def create_app(config=None):
+    app = Flask(__name__, static_folder='static', instance_relative_config=True)
+
+    app.config['SECRET_KEY'] = 'your-secret-key'
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + DB_PATH
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+
+    # Votes are buffered in memory and written in batches: at most every
+    # VOTE_FLUSH_INTERVAL seconds, or as soon as VOTE_BUFFER_SIZE votes are pending
+    app.config['VOTE_FLUSH_INTERVAL'] = 1.0
+    app.config['VOTE_BUFFER_SIZE'] = 500
+
+    # In-process cache for the read-heavy JSON endpoints. Writes made through the
+    # app invalidate it right away; the TTL bounds how long bot posts written by
+    # populate_db.py (another process) can take to show up.
+    app.config['RESPONSE_CACHE_ENABLED'] = True
+    app.config['RESPONSE_CACHE_TTL'] = 10
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 2048
+    app.config['RESPONSE_CACHE_BACKEND'] = None  # or "module:attribute" of a shared backend
+
+    # Passwords are hashed with bcrypt at 2**PASSWORD_HASH_ROUNDS cost, in a pool
+    # of PASSWORD_HASH_WORKERS processes (0 hashes on the request thread).
+    # Changing the rounds rehashes each password at its owner's next login.
+    app.config['PASSWORD_HASH_ROUNDS'] = 12
+    app.config['PASSWORD_HASH_WORKERS'] = 2
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 16
+
+    # Logged-in users are served from memory for this long between lookups
+    app.config['SESSION_USER_TTL'] = 60
+    app.config['SESSION_USER_MAX_ENTRIES'] = 1024
+
+    # /api/stream: how often to look for rows written by other processes, how
+    # many recent events a reconnecting client can catch up on, and how often
+    # an idle stream sends a keepalive
+    app.config['LIVE_POLL_INTERVAL'] = 2.0
+    app.config['LIVE_BACKLOG'] = 1000
+    app.config['LIVE_KEEPALIVE'] = 15
+
+    # Request timing, SQL accounting and /metrics (see instrumentation.py).
+    # Requests and statements slower than these go to the "llmit.slow" logger,
+    # and to SLOW_LOG_PATH as well when it is set.
+    app.config['METRICS_ENABLED'] = True
+    app.config['SLOW_REQUEST_MS'] = 500
+    app.config['SLOW_QUERY_MS'] = 100
+    app.config['SLOW_LOG_PATH'] = None
+    app.config['POPULATOR_STATS_PATH'] = POPULATOR_STATS_PATH
+
+    # The frontpage's top/hot listings are kept in their own table by triggers
+    # (see frontpage.py) and recomputed in full this often, in seconds (0: never)
+    app.config['FRONTPAGE_REBUILD_INTERVAL'] = 300
+
+    # Browser cache lifetime, in seconds, of content-hashed images in
+    # static/uploads; their names change whenever their bytes do
+    app.config['UPLOADS_MAX_AGE'] = 365 * 24 * 3600
+
+    if config:
+        app.config.update(config)
+
+    # Ensure the instance folder exists
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    db.init_app(app)
+    password_hasher.init_app(app)
+    session_users.init_app(app, db, User)
+    login_manager.init_app(app)
+    vote_buffer.init_app(app, db)
+    response_cache.init_app(app)
+    live_feed.init_app(app, db)
+    instrumentation.init_app(app, db)
+    frontpage.init_app(app, db)
+
+    # Apply the shared SQLite profile and make hot_rank() available to SQL on every connection
+    with app.app_context():
+        event.listen(db.engine, 'connect', apply_pragmas)
+        event.listen(db.engine, 'connect', register_sql_functions)
 
-app = Flask(__name__, static_folder='static', instance_relative_config=True)
+    app.register_blueprint(main)
+    return app
 
-app.config['SECRET_KEY'] = 'your-secret-key'
+# Stored instead of a hash for accounts nobody can log into (the bots). A bcrypt
+# hash never starts with '!', so no password can ever match it.
+UNUSABLE_PASSWORD = '!'
 
-# Ensure the instance folder exists
-if not os.path.exists(app.instance_path):
-    os.makedirs(app.instance_path)
+def has_usable_password(user):
+    return not user.password.startswith(UNUSABLE_PASSWORD)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'llmit.db')
+# Number of posts per page in listings, and the most a client may ask for
+POSTS_PER_PAGE = 10
+POSTS_MAX_LIMIT = 100
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+# Default and maximum comment tree limits for /api/posts/<id>/comments
+COMMENT_MAX_DEPTH = 6
+COMMENT_MAX_CHILDREN = 20
+COMMENT_LIMIT_CEILING = 200
 
 # User model
 class User(db.Model, UserMixin):
@@ -46,19 +175,57 @@ class Post(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=True)
     image_url = db.Column(db.String(200), nullable=True)
+    # Thumbnails and WebP/AVIF copies of the image, as JSON (see image_store.py)
+    image_variants = db.Column(db.Text, nullable=True)
     upvotes = db.Column(db.Integer, default=0)
     downvotes = db.Column(db.Integer, default=0)
+    # Stored rankings, kept in step with the vote counts on every write
+    score = db.Column(db.Integer, default=0, nullable=False)
+    hot = db.Column(db.Float, default=0.0, nullable=False)
     is_ai_generated = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Comment summary kept up to date by every comment write (see post_stats.py)
+    comment_count = db.Column(db.Integer, default=0, nullable=False)
+    last_activity_at = db.Column(db.DateTime, nullable=True)
     comments = db.relationship('Comment', backref='post', lazy=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
 
+    # Serve top/hot/new listings and their keyset pages straight from the indexes
+    __table_args__ = (
+        db.Index('ix_posts_group_score', 'group_name', 'score', 'id'),
+        db.Index('ix_posts_group_hot', 'group_name', 'hot', 'id'),
+        db.Index('ix_posts_group_timestamp', 'group_name', 'timestamp', 'id'),
+        db.Index('ix_posts_group_active', 'group_name', 'last_activity_at', 'id'),
+        # The frontpage's new/active listings span every subllmit
+        db.Index('ix_posts_timestamp', 'timestamp', 'id'),
+        db.Index('ix_posts_active', 'last_activity_at', 'id'),
+    )
+
+# Full-text search tables, the frontpage table, their sync triggers and the
+# image job queue are created alongside the models
+@event.listens_for(db.metadata, 'after_create')
+def create_extra_tables(target, connection, **kw):
+    create_search_schema(connection)
+    create_frontpage_schema(connection)
+    create_queue_schema(connection)
+
+# Recompute the stored rankings whenever a post is written through the ORM
+@event.listens_for(Post, 'before_insert')
+@event.listens_for(Post, 'before_update')
+def update_post_ranking(mapper, connection, post):
+    if post.timestamp is None:
+        post.timestamp = datetime.utcnow()
+    if post.last_activity_at is None:
+        post.last_activity_at = post.timestamp
+    post.score = score_of(post.upvotes, post.downvotes)
+    post.hot = hot_rank(post.score, post.timestamp)
+
 # Comment model
 class Comment(db.Model):
     __tablename__ = 'comments'
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
-    parent_comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False, index=True)
+    parent_comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=True, index=True)
     content = db.Column(db.Text, nullable=False)
     upvotes = db.Column(db.Integer, default=0)
     downvotes = db.Column(db.Integer, default=0)
@@ -67,27 +234,48 @@ class Comment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     children = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy=True)
 
+    # Pages of a post's comments under one parent (or at the top level), in id order
+    __table_args__ = (
+        db.Index('ix_comments_post_parent', 'post_id', 'parent_comment_id', 'id'),
+    )
+
+# Vote ledger: one row per user and target, so a vote can be changed but not repeated
+class Vote(db.Model):
+    __tablename__ = 'votes'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    target_type = db.Column(db.String(10), primary_key=True)  # 'post' or 'comment'
+    target_id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False)  # 1 upvote, -1 downvote, 0 cleared
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Changed or deleted users are dropped from the session user cache straight away
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_session_user(mapper, connection, user):
+    session_users.invalidate(user.id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return session_users.load(int(user_id))
 
 # Initialize the database and create tables
-def create_tables():
+def create_tables(app):
     with app.app_context():
         db.create_all()
 
-@app.route('/')
+@main.route('/')
 def index():
-    posts = Post.query.order_by(Post.timestamp.desc()).all()
-    comments = Comment.query.all()
-    comment_tree = [build_comment_tree(comment, {c.id: c for c in comments}) for comment in comments if comment.parent_comment_id is None]
-    return render_template('index.html', posts=posts, comment_tree=comment_tree)
+    # Render only the first page of the frontpage feed; script.js takes over from there
+    sort = 'top'
+    posts, next_cursor = fetch_posts_page('frontpage', sort, POSTS_PER_PAGE)
+    return render_template('index.html', posts=[serialize_post(post) for post in posts],
+                           group='frontpage', sort=sort, page=1, next_cursor=next_cursor)
 
 # Registration route
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     if request.method == 'POST':
         username = request.form['username']
@@ -96,134 +284,340 @@ def register():
         goal = request.form.get('goal', 'No goal set')
         user_type = request.form.get('user_type', 'human')
 
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        try:
+            hashed_password = password_hasher.generate_password_hash(password)
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment.', 'danger')
+            return render_template('register.html'), 503
 
         user = User(username=username, password=hashed_password, background=background, goal=goal, user_type=user_type)
         db.session.add(user)
         db.session.commit()
         flash('Registration successful. Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html')
 
 
 # Login route
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
 
         user = User.query.filter_by(username=username).first()
-        if user and bcrypt.check_password_hash(user.password, password):
+        try:
+            valid = user and has_usable_password(user) and password_hasher.check_password_hash(user.password, password)
+            # Upgrade hashes made with an older work factor while the password is at hand
+            if valid and password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.generate_password_hash(password)
+                db.session.commit()
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+
+        if valid:
             login_user(user)
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         else:
             flash('Invalid credentials', 'danger')
 
     return render_template('login.html')
 
 # Create Subllmit route
-@app.route('/create_subllmit', methods=['GET', 'POST'])
+@main.route('/create_subllmit', methods=['GET', 'POST'])
 @login_required
 def create_subllmit():
     if request.method == 'POST':
         subllmit_name = request.form['subllmit_name'].strip()
         if not subllmit_name:
             flash('Subllmit name cannot be empty', 'danger')
-            return redirect(url_for('create_subllmit'))
+            return redirect(url_for('main.create_subllmit'))
 
         existing_subllmit = Subllmit.query.filter_by(name=subllmit_name).first()
         if existing_subllmit:
             flash('Subllmit already exists', 'danger')
-            return redirect(url_for('create_subllmit'))
+            return redirect(url_for('main.create_subllmit'))
 
         new_subllmit = Subllmit(name=subllmit_name)
         db.session.add(new_subllmit)
         db.session.commit()
+        response_cache.invalidate('subllmits', 'posts:frontpage')
         flash(f'Subllmit {subllmit_name} created successfully', 'success')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     return render_template('create_subllmit.html')
 
 # Logout route
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-# API Endpoint: Load posts for specific group or frontpage
-@app.route('/api/posts', methods=['GET'])
-@app.route('/api/posts', methods=['GET'])
-def api_get_posts():
-    group = request.args.get('group', 'frontpage')
-    sort = request.args.get('sort', 'top')
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 10))
-
-    offset = (page - 1) * limit
-
-    if group == 'frontpage':
-        subllmits = Subllmit.query.limit(10).all()
-        group_names = [s.name for s in subllmits]
-        posts = Post.query.filter(Post.group_name.in_(group_names))
-    else:
-        posts = Post.query.filter_by(group_name=group)
+# Opaque continuation tokens handed to clients for "load more" requests
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
 
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+# Keyset column per sort mode; listings are ordered by (key desc, id desc)
+def post_sort_key(sort):
     if sort == 'new':
-        posts = posts.order_by(Post.timestamp.desc())
+        return Post.timestamp
+    if sort == 'active':
+        return Post.last_activity_at
+    if sort == 'hot':
+        return Post.hot
+    return Post.score
+
+def post_cursor(post, sort, tier=None, rank=None):
+    # Frontpage top/hot listings are keyed by (tier, rank, id), the rest by (key, id)
+    if tier is not None:
+        return encode_cursor([sort, tier, rank, post.id])
+    if sort == 'new':
+        key = post.timestamp.isoformat()
+    elif sort == 'active':
+        # NULL on rows from before the column existed that no upgrade has filled yet
+        key = (post.last_activity_at or post.timestamp).isoformat()
+    elif sort == 'hot':
+        key = post.hot
     else:
-        posts = posts.order_by((Post.upvotes - Post.downvotes).desc())
-
-    # Apply pagination using offset and limit
-    posts = posts.offset(offset).limit(limit).all()
+        key = post.score
+    return encode_cursor([sort, key, post.id])
+
+def is_frontpage_listing(group, sort):
+    return group == 'frontpage' and sort in FRONTPAGE_SORTS
+
+def decode_post_cursor(token, sort, group=None):
+    values = decode_cursor(token)
+    tiered = is_frontpage_listing(group, sort)
+    if len(values) != (4 if tiered else 3) or values[0] != sort:
+        raise ValueError('Cursor does not match this listing')
+    if tiered:
+        _, tier, rank, post_id = values
+        return int(tier), float(rank), int(post_id)
+    _, key, post_id = values
+    if sort in ('new', 'active'):
+        key = datetime.fromisoformat(key)
+    elif sort == 'hot':
+        key = float(key)
+    else:
+        key = int(key)
+    return key, int(post_id)
+
+# Shared listing query used by /api/posts and the server-rendered index page.
+# Frontpage top/hot rows are (post, tier, rank), which go into the cursor;
+# every other listing yields plain posts.
+def query_posts(group, sort, after=None):
+    if is_frontpage_listing(group, sort):
+        # One range read of the materialized listing, joined to posts by id,
+        # dealt out a round (tier) at a time so no subllmit crowds a page
+        frontpage.ensure_ready()
+        entry = frontpage_table.c
+        posts = (Post.query.join(frontpage_table, entry.post_id == Post.id)
+                 .filter(entry.sort == sort).add_columns(entry.tier, entry.rank))
+        keys = (entry.tier, entry.rank, entry.post_id)
+    else:
+        # new/active frontpages read every subllmit's posts from the global indexes
+        posts = Post.query if group == 'frontpage' else Post.query.filter_by(group_name=group)
+        keys = (post_sort_key(sort), Post.id)
+
+    if after is not None:
+        # Seek past the last row of the previous page instead of counting rows with OFFSET
+        posts = posts.filter(tuple_(*keys) < tuple_(*after))
+
+    return posts.options(joinedload(Post.author)).order_by(*(key.desc() for key in keys))
+
+def fetch_posts_page(group, sort, limit, after=None):
+    # Fetch one extra row to learn whether another page exists
+    rows = query_posts(group, sort, after).limit(limit + 1).all()
+    if is_frontpage_listing(group, sort):
+        posts = [post for post, _, _ in rows]
+        if len(rows) > limit:
+            post, tier, rank = rows[limit - 1]
+            next_cursor = post_cursor(post, sort, tier, rank)
+        else:
+            next_cursor = None
+    else:
+        posts = rows
+        next_cursor = post_cursor(posts[limit - 1], sort) if len(posts) > limit else None
+    return posts[:limit], next_cursor
 
-    return jsonify([{
+def serialize_post(post):
+    return {
         "id": post.id,
         "group": post.group_name,
         "title": post.title,
         "content": post.content,
         "image_url": post.image_url,
+        "image_srcset": srcset(post.image_url, post.image_variants),
         "upvotes": post.upvotes,
         "downvotes": post.downvotes,
+        "score": post.score,
         "is_ai_generated": post.is_ai_generated,
         "timestamp": post.timestamp.isoformat(),
+        "comment_count": post.comment_count,
+        "last_activity_at": post.last_activity_at.isoformat() if post.last_activity_at else None,
         "author": post.author.username if post.author else "Anonymous"
-    } for post in posts])
+    }
+
+# API Endpoint: Load posts for specific group or frontpage
+# Clients passing ?cursor= (empty for the first page) get keyset pages with a
+# next_cursor; the older ?page= form still returns a plain list.
+@main.route('/api/posts', methods=['GET'])
+@response_cache.cached(lambda: ['posts', f"posts:{request.args.get('group', 'frontpage')}"])
+def api_get_posts():
+    group = request.args.get('group', 'frontpage')
+    sort = request.args.get('sort', 'top')
+    try:
+        limit = max(1, min(int(request.args.get('limit', POSTS_PER_PAGE)), POSTS_MAX_LIMIT))
+        page = int(request.args.get('page', 1))
+        cursor = request.args.get('cursor')
+        after = decode_post_cursor(cursor, sort, group) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+
+    if cursor is not None:
+        posts, next_cursor = fetch_posts_page(group, sort, limit, after)
+        return jsonify({
+            "posts": [serialize_post(post) for post in posts],
+            "next_cursor": next_cursor
+        })
+
+    # Legacy page numbers still use offset and limit
+    offset = (max(page, 1) - 1) * limit
+    posts = query_posts(group, sort).offset(offset).limit(limit).all()
+    if is_frontpage_listing(group, sort):
+        posts = [post for post, _, _ in posts]
+
+    return jsonify([serialize_post(post) for post in posts])
 
 
+def comment_limit_arg(name, default):
+    value = int(request.args.get(name, default))
+    return max(1, min(value, COMMENT_LIMIT_CEILING))
+
 # API Endpoint: Load comments for specific post
-@app.route('/api/posts/<int:post_id>/comments', methods=['GET'])
+@main.route('/api/posts/<int:post_id>/comments', methods=['GET'])
+@response_cache.cached(lambda: ['comments', f"comments:{request.view_args['post_id']}"])
 def api_get_comments(post_id):
-    comments = Comment.query.filter_by(post_id=post_id).all()
-    comments_by_id = {comment.id: comment for comment in comments}
-    comment_tree = [build_comment_tree(comment, comments_by_id) for comment in comments if comment.parent_comment_id is None]
+    try:
+        max_depth = comment_limit_arg('max_depth', COMMENT_MAX_DEPTH)
+        max_children = comment_limit_arg('max_children', COMMENT_MAX_CHILDREN)
+        parent_id, offset, level = None, 0, 0
+        cursor = request.args.get('cursor')
+        if cursor:
+            parent_id, offset, level = decode_cursor(cursor)
+            offset, level = int(offset), int(level)
+            # A cursor is the client's to edit: parent_id keys a dict below
+            if not (parent_id is None or type(parent_id) is int) or offset < 0 or level < 0:
+                raise ValueError(cursor)
+    except (ValueError, TypeError):
+        return jsonify({"message": "Invalid comment tree parameters"}), 400
+
+    # Only the requested page of the parent's replies and, below each of them,
+    # the first max_children replies per comment down to the depth limit
+    params = {'post_id': post_id, 'parent_id': parent_id, 'offset': offset,
+              'max_children': max_children, 'max_depth': max_depth}
+    rows = db.session.execute(COMMENT_SUBTREE, params).all()
+    replies = dict(rows)
+    replies[parent_id] = db.session.execute(COMMENT_SIBLINGS, params).scalar()
+    comments = (Comment.query
+                .options(joinedload(Comment.author))
+                .filter(Comment.id.in_(list(replies.keys() - {parent_id})))
+                .order_by(Comment.id)
+                .all()) if rows else []
+    children_by_parent = defaultdict(list)
+    for comment in comments:
+        children_by_parent[comment.parent_comment_id].append(comment)
+
+    comment_tree = build_comment_tree(children_by_parent, replies, parent_id, post_id, level,
+                                      level + max_depth, max_children, offset)
     return jsonify(comment_tree)
 
-def build_comment_tree(comment, comments_by_id, level=0):
-    children = [
-        build_comment_tree(child_comment, comments_by_id, level + 1)
-        for child_comment in comments_by_id.values() if child_comment.parent_comment_id == comment.id
-    ]
-    return {
-        "id": comment.id,
-        "post_id": comment.post_id,
-        "content": comment.content,
-        "upvotes": comment.upvotes,
-        "downvotes": comment.downvotes,
-        "is_ai_generated": comment.is_ai_generated,
-        "timestamp": comment.timestamp.isoformat(),
-        "author": comment.author.username if comment.author else "Anonymous",
-        "children": children,
+# One page of a parent's replies (parent_id NULL: the post's top-level comments)
+# and the fetched part of the subtree below it, with how many replies each
+# comment has in all. The page is a range read of ix_comments_post_parent, every
+# level below it one of ix_comments_parent_comment_id.
+COMMENT_SUBTREE = text('''
+    WITH RECURSIVE tree(id, depth) AS (
+        SELECT id, 0 FROM (
+            SELECT id FROM comments
+            WHERE post_id = :post_id AND parent_comment_id IS :parent_id
+            ORDER BY id LIMIT :max_children OFFSET :offset
+        )
+        UNION ALL
+        SELECT c.id, tree.depth + 1
+        FROM tree
+        JOIN comments AS c ON c.id IN (
+            SELECT id FROM comments WHERE parent_comment_id = tree.id ORDER BY id LIMIT :max_children
+        )
+        WHERE tree.depth + 1 < :max_depth
+    )
+    SELECT tree.id, (SELECT COUNT(*) FROM comments WHERE parent_comment_id = tree.id) AS replies
+    FROM tree
+''')
+
+COMMENT_SIBLINGS = text(
+    'SELECT COUNT(*) FROM comments WHERE post_id = :post_id AND parent_comment_id IS :parent_id'
+)
+
+def build_comment_tree(children_by_parent, replies, parent_id, post_id, level, depth_limit, max_children, offset=0):
+    # children_by_parent holds the fetched page of each comment's replies,
+    # replies how many it has in all
+    nodes = []
+    for comment in children_by_parent.get(parent_id, []):
+        if level + 1 < depth_limit:
+            children = build_comment_tree(children_by_parent, replies, comment.id, post_id, level + 1,
+                                          depth_limit, max_children)
+        else:
+            # Depth limit reached: hand back a continuation instead of the subtree
+            children = continuation(replies, comment.id, post_id, 0, level + 1)
+        nodes.append({
+            "id": comment.id,
+            "post_id": comment.post_id,
+            "content": comment.content,
+            "upvotes": comment.upvotes,
+            "downvotes": comment.downvotes,
+            "is_ai_generated": comment.is_ai_generated,
+            "timestamp": comment.timestamp.isoformat(),
+            "author": comment.author.username if comment.author else "Anonymous",
+            "children": children,
+            "level": level
+        })
+    # Siblings beyond max_children are left for a "load more" request
+    nodes.extend(continuation(replies, parent_id, post_id, offset + max_children, level))
+    return nodes
+
+def continuation(replies, parent_id, post_id, offset, level):
+    remaining = replies.get(parent_id, 0) - offset
+    if remaining <= 0:
+        return []
+    return [{
+        "type": "more",
+        "post_id": post_id,
+        "parent_comment_id": parent_id,
+        "count": remaining,
+        "cursor": encode_cursor([parent_id, offset, level]),
         "level": level
-    }
+    }]
 
 # API Endpoint: Submit a post
-@app.route('/api/posts', methods=['POST'])
+@main.route('/api/posts', methods=['POST'])
 @login_required
 def api_submit_post():
     try:
@@ -249,6 +643,8 @@ def api_submit_post():
         )
         db.session.add(post)
         db.session.commit()
+        response_cache.invalidate(f'posts:{group_name}', 'posts:frontpage')
+        live_feed.notify_written()
 
         return jsonify({"message": "Post submitted successfully."}), 201
 
@@ -258,7 +654,7 @@ def api_submit_post():
 
 
 # API Endpoint: Submit a comment
-@app.route('/api/comments', methods=['POST'])
+@main.route('/api/comments', methods=['POST'])
 @login_required
 def api_submit_comment():
     data = request.get_json()
@@ -271,79 +667,166 @@ def api_submit_comment():
         content=content,
         parent_comment_id=parent_comment_id,
         is_ai_generated=False,
+        timestamp=datetime.utcnow(),
         user_id=current_user.id
     )
+    # Bump the post's comment summary in the same transaction as the comment
+    groups = record_comments(db.session.connection(), [(post_id, comment.timestamp)])
+    if not groups:
+        db.session.rollback()
+        return jsonify({"message": "Post not found"}), 404
     db.session.add(comment)
     db.session.commit()
+    response_cache.invalidate(f'comments:{post_id}', 'posts:frontpage', *(f'posts:{group}' for group in groups))
+    live_feed.notify_written()
 
     return jsonify({"message": "Comment submitted successfully"})
 
 # API Endpoint: Vote on post
-@app.route('/api/votes/posts', methods=['POST'])
+@main.route('/api/votes/posts', methods=['POST'])
 @login_required
 def api_vote_post():
     data = request.get_json()
     post_id = data.get('post_id')
     vote_type = data.get('vote_type')
 
-    post = Post.query.get(post_id)
-    if not post:
+    if not db.session.query(Post.id).filter_by(id=post_id).first():
         return jsonify({"message": "Post not found"}), 404
 
-    if vote_type == 'upvote':
-        post.upvotes += 1
-    elif vote_type == 'downvote':
-        post.downvotes += 1
-    else:
+    if vote_type not in VOTE_VALUES:
         return jsonify({"message": "Invalid vote type"}), 400
 
-    db.session.commit()
-    return jsonify({"message": "Vote recorded"})
+    # Counts are applied by the vote buffer's next batched flush; a repeat of
+    # the user's current vote changes nothing and is reported as such
+    if not vote_buffer.record(current_user.id, 'post', post_id, VOTE_VALUES[vote_type]):
+        return jsonify({"message": "Vote unchanged", "changed": False})
+    return jsonify({"message": "Vote recorded", "changed": True})
 
 # API Endpoint: Vote on comment
-@app.route('/api/votes/comments', methods=['POST'])
+@main.route('/api/votes/comments', methods=['POST'])
 @login_required
 def api_vote_comment():
     data = request.get_json()
     comment_id = data.get('comment_id')
     vote_type = data.get('vote_type')
 
-    comment = Comment.query.get(comment_id)
-    if not comment:
+    if not db.session.query(Comment.id).filter_by(id=comment_id).first():
         return jsonify({"message": "Comment not found"}), 404
 
-    if vote_type == 'upvote':
-        comment.upvotes += 1
-    elif vote_type == 'downvote':
-        comment.downvotes += 1
-    else:
+    if vote_type not in VOTE_VALUES:
         return jsonify({"message": "Invalid vote type"}), 400
 
-    db.session.commit()
-    return jsonify({"message": "Vote recorded"})
+    if not vote_buffer.record(current_user.id, 'comment', comment_id, VOTE_VALUES[vote_type]):
+        return jsonify({"message": "Vote unchanged", "changed": False})
+    return jsonify({"message": "Vote recorded", "changed": True})
+
+# API Endpoint: Live feed of new posts, new comments and vote changes (Server-Sent Events)
+# ?group= limits it to one subllmit, and/or ?post_id= (repeatable) to given posts
+@main.route('/api/stream', methods=['GET'])
+def api_stream():
+    try:
+        post_ids = [int(post_id) for post_id in request.args.getlist('post_id')]
+    except ValueError:
+        return jsonify({"message": "Invalid post_id"}), 400
+    events = live_feed.stream(
+        group=request.args.get('group'),
+        post_ids=post_ids,
+        last_event_id=request.headers.get('Last-Event-ID')
+    )
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+# Prometheus metrics: request latency, DB time, caches, the image queue and the populator
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    if not instrumentation.enabled:
+        return jsonify({"message": "Metrics are disabled"}), 404
+    with db.engine.connect() as connection:
+        images = queue_stats(connection)
+    caches = {'response': response_cache.stats(), 'session_user': session_users.stats()}
+    extra = [
+        ('llmit_cache_hits_total', 'counter', 'Cache lookups answered from memory.',
+         {(('cache', name),): stats['hits'] for name, stats in caches.items()}),
+        ('llmit_cache_misses_total', 'counter', 'Cache lookups that went to the database.',
+         {(('cache', name),): stats['misses'] for name, stats in caches.items()}),
+        ('llmit_cache_hit_ratio', 'gauge', 'Share of cache lookups that hit.',
+         {(('cache', name),): stats['hit_rate'] for name, stats in caches.items()}),
+        ('llmit_response_cache_not_modified_total', 'counter', 'Cached responses answered with 304.',
+         response_cache.stats()['not_modified']),
+        ('llmit_votes_pending', 'gauge', 'Votes buffered and not yet written.', vote_buffer.pending()),
+        ('llmit_live_streams', 'gauge', 'Open /api/stream connections.', live_feed.stats()['streams']),
+        ('llmit_live_events_total', 'counter', 'Events published to live streams.', live_feed.stats()['published']),
+        ('llmit_frontpage_rebuilds_total', 'counter', 'Full rebuilds of the frontpage table.', frontpage.rebuilds),
+        ('llmit_frontpage_rebuild_seconds', 'gauge', 'Duration of the last frontpage rebuild.',
+         frontpage.last_rebuild_seconds),
+        ('llmit_image_jobs', 'gauge', 'Image jobs by status.',
+         {(('status', status),): images[status] for status in ('queued', 'running', 'done', 'failed')}),
+        ('llmit_image_oldest_queued_seconds', 'gauge', 'Age of the oldest queued image job.',
+         images['oldest_queued_seconds']),
+        ('llmit_image_latency_seconds', 'gauge', 'Average enqueue-to-image time over the last 100 jobs.',
+         images['avg_latency_seconds']),
+    ]
+    extra += stats_file_metrics('llmit_populator', read_stats_file(current_app.config['POPULATOR_STATS_PATH']))
+    return Response(instrumentation.render(extra), mimetype='text/plain; version=0.0.4')
 
 # Search Subllmits
-@app.route('/api/subllmits', methods=['GET'])
+@main.route('/api/subllmits', methods=['GET'])
+@response_cache.cached(lambda: ['subllmits'])
 def api_search_subllmits():
     query = request.args.get('query', '')
-    subllmits = Subllmit.query.filter(Subllmit.name.ilike(f'%{query}%')).all()
+    # Case-insensitive prefix match, served by the NOCASE index on subllmits.name
+    pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    subllmits = (Subllmit.query
+                 .filter(Subllmit.name.like(pattern, escape='\\'))
+                 .order_by(Subllmit.name)
+                 .limit(50)
+                 .all())
 
     return jsonify([{
         "id": subllmit.id,
         "name": subllmit.name
     } for subllmit in subllmits])
 
+# API Endpoint: Full-text search over posts and comments
+@main.route('/api/search', methods=['GET'])
+def api_search():
+    query = request.args.get('q', '')
+    kind = request.args.get('type', 'posts')
+    ai_filter = request.args.get('is_ai_generated')
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = max(1, min(int(request.args.get('limit', POSTS_PER_PAGE)), POSTS_MAX_LIMIT))
+    except ValueError:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    if kind not in ('posts', 'comments'):
+        return jsonify({"message": "type must be 'posts' or 'comments'"}), 400
+
+    results, has_more = search(
+        db.session,
+        query,
+        kind=kind,
+        group=request.args.get('group'),
+        author=request.args.get('author'),
+        is_ai_generated=None if ai_filter is None else ai_filter.lower() in ('1', 'true', 'yes'),
+        limit=limit,
+        offset=(page - 1) * limit
+    )
+    return jsonify({"results": results, "page": page, "has_more": has_more})
+
 # Route to view a specific subllmit
-@app.route('/r/<subllmit_name>')
+@main.route('/r/<subllmit_name>')
 def view_subllmit(subllmit_name):
     subllmit = Subllmit.query.filter_by(name=subllmit_name).first()
     if not subllmit:
         flash('Subllmit not found', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     return render_template('index.html', subllmit_name=subllmit_name)
 
 # API Endpoint: Get all subllmits (for initial load)
-@app.route('/api/subllmits/all', methods=['GET'])
+@main.route('/api/subllmits/all', methods=['GET'])
+@response_cache.cached(lambda: ['subllmits'], ttl=60)
 def api_get_all_subllmits():
     subllmits = Subllmit.query.all()
     return jsonify([{
@@ -351,7 +834,155 @@ def api_get_all_subllmits():
         "name": subllmit.name
     } for subllmit in subllmits])
 
+# Columns added to posts after the first release, for upgrading older databases in place
+ADDED_POST_COLUMNS = {
+    'score': 'INTEGER NOT NULL DEFAULT 0',
+    'hot': 'FLOAT NOT NULL DEFAULT 0',
+    'comment_count': 'INTEGER NOT NULL DEFAULT 0',
+    'last_activity_at': 'DATETIME',
+    'image_variants': 'TEXT',
+}
+
+def add_missing_post_columns(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('posts')}
+    for name, definition in ADDED_POST_COLUMNS.items():
+        if name not in columns:
+            connection.execute(text(f'ALTER TABLE posts ADD COLUMN {name} {definition}'))
+    # A post with no comments was last active when it was posted; also fills
+    # rows left NULL by an upgrade that predates this
+    connection.execute(text('UPDATE posts SET last_activity_at = timestamp WHERE last_activity_at IS NULL'))
+    for index in (*Post.__table__.indexes, *Comment.__table__.indexes):
+        index.create(connection, checkfirst=True)
+
+# CLI: flask --app app backfill-scores
+# Adds the score/hot columns and their indexes to an existing database and fills them in
+@main.cli.command('backfill-scores')
+def backfill_scores_command():
+    with db.engine.begin() as connection:
+        add_missing_post_columns(connection)
+        # Rows written by raw SQL lack the microseconds SQLAlchemy stores, which
+        # would make them compare out of order against keyset cursors
+        connection.execute(text(
+            "UPDATE posts SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"
+        ))
+        connection.execute(text(
+            'UPDATE posts SET score = COALESCE(upvotes, 0) - COALESCE(downvotes, 0)'
+        ))
+        updated = connection.execute(text(
+            'UPDATE posts SET hot = hot_rank(score, COALESCE(timestamp, CURRENT_TIMESTAMP))'
+        )).rowcount
+    print(f"Backfilled score and hot for {updated} posts.")
+
+# CLI: flask --app app rebuild-frontpage
+# Creates the frontpage table and its triggers if missing and recomputes it from posts
+@main.cli.command('rebuild-frontpage')
+def rebuild_frontpage_command():
+    started = time.perf_counter()
+    with db.engine.begin() as connection:
+        add_missing_post_columns(connection)
+        create_frontpage_schema(connection)
+        counts = rebuild_frontpage(connection)
+    response_cache.invalidate('posts:frontpage')
+    print(f"Rebuilt the frontpage in {time.perf_counter() - started:.2f}s: "
+          + ', '.join(f"{count} {sort} posts" for sort, count in counts.items()))
+
+# CLI: flask --app app check-comment-counts [--fix]
+# Recomputes every post's comment_count and last_activity_at from comments in
+# one grouped query and reports (or, with --fix, repairs) the posts that disagree
+@main.cli.command('check-comment-counts')
+@click.option('--fix', is_flag=True, help='Write the recomputed values back to posts.')
+def check_comment_counts_command(fix):
+    with db.engine.begin() as connection:
+        add_missing_post_columns(connection)
+        drift = check_comment_counts(connection, fix=fix)
+    for post_id, stored, actual in drift[:20]:
+        print(f"  post {post_id}: comment_count {stored}, comments {actual}")
+    if len(drift) > 20:
+        print(f"  ... and {len(drift) - 20} more")
+    if not drift:
+        print("Comment counts are consistent.")
+    elif fix:
+        print(f"Fixed {len(drift)} posts.")
+    else:
+        print(f"{len(drift)} posts disagree with their comments; run with --fix to repair them.")
+    if fix:
+        response_cache.invalidate('posts')
+
+# CLI: flask --app app rebuild-search
+# Creates the FTS5 tables and triggers if missing and reindexes every post and comment
+@main.cli.command('rebuild-search')
+def rebuild_search_command():
+    with db.engine.begin() as connection:
+        create_search_schema(connection)
+        rebuild_search_index(connection)
+    print("Search index rebuilt.")
+
+# Generated images, as saved by image_worker.py
+def uploads_dir():
+    return os.path.join(current_app.static_folder, 'uploads')
+
+# Content-hashed images never change under their name, so browsers and proxies
+# may keep them for good and the name itself is the ETag; older names get
+# Flask's defaults. Conditional requests get a 304 and Range requests a 206.
+@main.route('/static/uploads/<path:filename>')
+def serve_upload(filename):
+    immutable = is_hashed(filename)
+    response = send_from_directory(uploads_dir(), filename, conditional=True,
+                                   etag=filename if immutable else True,
+                                   max_age=current_app.config['UPLOADS_MAX_AGE'] if immutable else None)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+# CLI: flask --app app backfill-images [--keep-originals]
+# Renames the files in static/uploads to their content hashes, makes their
+# thumbnails and WebP/AVIF copies, and points the posts at both
+@main.cli.command('backfill-images')
+@click.option('--keep-originals', is_flag=True, help='Leave the files under their old names as well.')
+def backfill_images_command(keep_originals):
+    with db.engine.begin() as connection:
+        add_missing_post_columns(connection)
+    started = time.perf_counter()
+    result = backfill_uploads(db.engine, uploads_dir(), keep_originals=keep_originals)
+    response_cache.invalidate('posts')
+    print(f"Backfilled images in {time.perf_counter() - started:.2f}s: {result['renamed']} files renamed, "
+          f"{result['posts_updated']} posts updated, derivatives: {', '.join(result['formats']) or 'none (needs Pillow)'}.")
+
+# CLI: flask --app app export DUMP_DIR
+# Streams users, subllmits, posts, comments, votes and uploaded images into a
+# directory of gzipped NDJSON files (see world_dump.py)
+@main.cli.command('export')
+@click.argument('dump_dir')
+def export_command(dump_dir):
+    export_world(db.engine, dump_dir, uploads_dir())
+
+# CLI: LLMIT_DB=new.db flask --app app import DUMP_DIR [--resume]
+# Loads a dump into a fresh database; --resume continues an interrupted import
+@main.cli.command('import')
+@click.argument('dump_dir')
+@click.option('--resume', is_flag=True, help='Skip rows already imported by an earlier run.')
+def import_command(dump_dir, resume):
+    db.create_all()
+    try:
+        import_world(db.engine, dump_dir, uploads_dir(), resume=resume)
+    except DumpError as e:
+        raise click.ClickException(str(e))
+    response_cache.invalidate('posts', 'comments', 'subllmits')
+
+# CLI: flask --app app sqlite-pragmas
+# Shows the pragmas actually in effect on a pooled connection
+@main.cli.command('sqlite-pragmas')
+def sqlite_pragmas_command():
+    print(f"Database: {DB_PATH}")
+    with db.engine.connect() as connection:
+        print_pragmas(active_pragmas(connection.connection.dbapi_connection))
+
 if __name__ == '__main__':
+    boot = BootTimer()
+    boot.mark('imports')
+    app = create_app()
+    boot.mark('app')
     with app.app_context():
         db.create_all()
         
@@ -372,5 +1003,7 @@ if __name__ == '__main__':
             )
             db.session.add(sample_post)
             db.session.commit()
+    boot.mark('database')
+    boot.report()
     
     app.run(debug=True)
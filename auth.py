@@ -0,0 +1,148 @@
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import bcrypt
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from response_cache import LocalCacheBackend
+
+# Keeps authentication off the request hot path.
+#
+# PasswordHasher runs bcrypt in a small pool of worker processes, so a burst
+# of logins costs the web process a wait rather than hundreds of milliseconds
+# of CPU per request. At most PASSWORD_HASH_MAX_PENDING hashes may be queued;
+# beyond that HasherBusy is raised and the login is turned away instead of
+# piling up. Hashes made with a different PASSWORD_HASH_ROUNDS are flagged by
+# needs_rehash(), so a changed work factor is rolled out at each user's next
+# login.
+#
+# SessionUserCache keeps the column values of recently seen session users for
+# SESSION_USER_TTL seconds, so flask-login's user_loader does not query the
+# users table on every authenticated request. Call invalidate() when a user
+# changes (app.py does it from an after_update listener).
+
+# bcrypt only ever looks at the first 72 bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+
+def _hash_password(password, rounds):
+    secret = password.encode('utf-8')[:BCRYPT_MAX_BYTES]
+    return bcrypt.hashpw(secret, bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check_password(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8')[:BCRYPT_MAX_BYTES], pw_hash.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash at all
+        return False
+
+def hash_rounds(pw_hash):
+    # "$2b$12$..." -> 12
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 2
+        self.max_pending = 16
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('PASSWORD_HASH_ROUNDS', self.rounds)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        atexit.register(self.close)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked, so workers don't inherit the app's
+                # threads or open database connections
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password checks in progress')
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def generate_password_hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(_check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        rounds = hash_rounds(pw_hash)
+        return rounds is not None and rounds != self.rounds
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SessionUserCache:
+    def __init__(self, app=None, db=None, user_model=None):
+        self.db = None
+        self.User = None
+        self.ttl = 60
+        self.backend = LocalCacheBackend(1024)
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app, db, user_model)
+
+    def init_app(self, app, db, user_model):
+        self.db = db
+        self.User = user_model
+        self.ttl = app.config.get('SESSION_USER_TTL', self.ttl)
+        self.backend = LocalCacheBackend(app.config.get('SESSION_USER_MAX_ENTRIES', 1024))
+
+    def load(self, user_id):
+        values = self.backend.get(user_id)
+        if values is None:
+            self.misses += 1
+            user = self.db.session.get(self.User, user_id)
+            if user is not None:
+                self.backend.set(user_id, {
+                    attribute.key: getattr(user, attribute.key)
+                    for attribute in inspect(self.User).column_attrs
+                }, self.ttl)
+            return user
+
+        self.hits += 1
+        # Rebuild the user as if it had been loaded earlier, and attach a copy
+        # to this request's session without querying
+        user = self.User(**values)
+        make_transient_to_detached(user)
+        return self.db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,215 @@
+import atexit
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from ranking import score_of, hot_rank
+from image_queue import enqueue
+from post_stats import record_comments
+
+# Collects generated subllmits, posts, comments and image jobs in memory and writes them
+# with bulk INSERTs, one transaction per batch. A batch is flushed once it
+# holds max_rows rows or its oldest row is max_age seconds old, and always on
+# close(), so a stopped populator keeps everything it generated.
+#
+# add_post() returns a PendingPost straight away. Comments can be attached to
+# it (and image jobs can reference it) before the post has an id; the flush
+# inserts posts first (with RETURNING) and fills in their post_id inside the
+# same transaction. add_comment() likewise returns a PendingComment that
+# later comments can reply to, and add_comments() queues a whole thread at
+# once so it is never split between two batches; parents are inserted before
+# their replies, one INSERT per level of nesting.
+
+
+class PendingPost:
+    __slots__ = ('row', 'id')
+
+    def __init__(self, row):
+        self.row = row
+        self.id = None
+
+
+class PendingComment:
+    __slots__ = ('post', 'parent', 'row', 'id')
+
+    def __init__(self, post, parent, row):
+        self.post = post
+        self.parent = parent
+        self.row = row
+        self.id = None
+
+
+def resolved(item):
+    # The id of a PendingPost/PendingComment, or the plain id (or None) given instead
+    return item.id if isinstance(item, (PendingPost, PendingComment)) else item
+
+
+def inserted_ids(connection, model, rows):
+    # Inserts rows with multi-row INSERT ... RETURNING id and returns the ids
+    # in the order of rows. SQLite hands out a statement's rowids in VALUES
+    # order but promises no order for RETURNING, so the ids are sorted.
+    # (sort_by_parameter_order=True would make SQLAlchemy fall back to one
+    # INSERT per row on SQLite.)
+    ids = sorted(connection.execute(insert(model).returning(model.id), rows).scalars().all())
+    if len(ids) != len(rows):
+        raise ValueError(f"Inserted {len(rows)} rows but got {len(ids)} ids back")
+    return ids
+
+
+class BatchWriter:
+    def __init__(self, engine, post_model, comment_model, subllmit_model, max_rows=200, max_age=2.0):
+        self.engine = engine
+        self.Post = post_model
+        self.Comment = comment_model
+        self.Subllmit = subllmit_model
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.subllmits = []
+        self.posts = []
+        self.comments = []
+        self.image_jobs = []
+        self.oldest = None
+        self.flushes = 0
+        self.rows_written = 0
+        atexit.register(self.close)
+
+    def pending(self):
+        return len(self.subllmits) + len(self.posts) + len(self.comments) + len(self.image_jobs)
+
+    def _added(self):
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.maybe_flush()
+
+    def add_subllmit(self, name):
+        self.subllmits.append({'name': name})
+        self._added()
+
+    def add_post(self, group_name, title, content, user_id, upvotes=0, downvotes=0,
+                 is_ai_generated=True, timestamp=None):
+        timestamp = timestamp or datetime.utcnow()
+        score = score_of(upvotes, downvotes)
+        post = PendingPost({
+            'group_name': group_name,
+            'title': title,
+            'content': content,
+            'image_url': None,
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'score': score,
+            'hot': hot_rank(score, timestamp),
+            'is_ai_generated': is_ai_generated,
+            'timestamp': timestamp,
+            'comment_count': 0,
+            'last_activity_at': timestamp,
+            'user_id': user_id
+        })
+        self.posts.append(post)
+        self._added()
+        return post
+
+    def _comment(self, post, content, user_id, upvotes=0, downvotes=0, is_ai_generated=True,
+                 parent=None, timestamp=None):
+        comment = PendingComment(post, parent, {
+            'content': content,
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'is_ai_generated': is_ai_generated,
+            'timestamp': timestamp or datetime.utcnow(),
+            'user_id': user_id
+        })
+        self.comments.append(comment)
+        return comment
+
+    def add_comment(self, post, content, user_id, upvotes=0, downvotes=0, is_ai_generated=True,
+                    parent=None, timestamp=None):
+        # post is a PendingPost or a plain post id; parent a PendingComment, a comment id or None
+        comment = self._comment(post, content, user_id, upvotes, downvotes, is_ai_generated, parent, timestamp)
+        self._added()
+        return comment
+
+    def add_comments(self, post, comments):
+        # A thread for one post: dicts of add_comment() arguments, where 'parent'
+        # may also be the index of an earlier comment in the list. All of them
+        # land in the same batch.
+        added = []
+        for comment in comments:
+            parent = comment.get('parent')
+            if isinstance(parent, int) and not isinstance(parent, bool) and 0 <= parent < len(added):
+                comment = dict(comment, parent=added[parent])
+            added.append(self._comment(post, **comment))
+        if added:
+            self._added()
+        return added
+
+    def add_image_job(self, post, prompt):
+        # Queued for image_worker.py in the same transaction as the post itself
+        self.image_jobs.append((post, prompt))
+        self._added()
+
+    def maybe_flush(self):
+        if self.oldest is None:
+            return False
+        if self.pending() >= self.max_rows or time.monotonic() - self.oldest >= self.max_age:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.pending():
+            return 0
+        subllmits, posts, comments, image_jobs = self.subllmits, self.posts, self.comments, self.image_jobs
+        self.subllmits, self.posts, self.comments, self.image_jobs = [], [], [], []
+        self.oldest = None
+
+        try:
+            with self.engine.begin() as connection:
+                if subllmits:
+                    connection.execute(insert(self.Subllmit).prefix_with('OR IGNORE'), subllmits)
+                if posts:
+                    ids = inserted_ids(connection, self.Post, [post.row for post in posts])
+                    for post, post_id in zip(posts, ids):
+                        post.id = post_id
+                if comments:
+                    self._insert_comments(connection, comments)
+                    # One comment_count/last_activity_at update per post in the batch
+                    record_comments(connection, [(resolved(comment.post), comment.row['timestamp'])
+                                                 for comment in comments])
+                if image_jobs:
+                    enqueue(connection, [(resolved(post), prompt) for post, prompt in image_jobs])
+        except Exception as e:
+            # Keep the batch (e.g. after "database is locked") and retry on the next flush
+            for item in posts + comments:
+                item.id = None
+            self.subllmits[:0], self.posts[:0], self.comments[:0], self.image_jobs[:0] = \
+                subllmits, posts, comments, image_jobs
+            self.oldest = time.monotonic()
+            print(f"Error writing batch, will retry: {e}")
+            return 0
+
+        written = len(subllmits) + len(posts) + len(comments) + len(image_jobs)
+        self.flushes += 1
+        self.rows_written += written
+        print(f"Wrote batch: {len(posts)} posts, {len(comments)} comments, "
+              f"{len(subllmits)} subllmits, {len(image_jobs)} image jobs")
+        return written
+
+    def _insert_comments(self, connection, comments):
+        # Top-level comments and replies to already written ones first, then
+        # replies to those, and so on; the RETURNING ids feed the next level
+        remaining = comments
+        while remaining:
+            level = [comment for comment in remaining
+                     if not isinstance(comment.parent, PendingComment) or comment.parent.id is not None]
+            if not level:
+                raise ValueError("Reply to a comment that was never queued")
+            ids = inserted_ids(connection, self.Comment,
+                               [dict(comment.row, post_id=resolved(comment.post), parent_comment_id=resolved(comment.parent))
+                                for comment in level])
+            for comment, comment_id in zip(level, ids):
+                comment.id = comment_id
+            remaining = [comment for comment in remaining if comment.id is None]
+
+    def close(self):
+        self.flush()
+        if self.pending():
+            print(f"Warning: {self.pending()} generated rows could not be written.")
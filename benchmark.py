@@ -0,0 +1,297 @@
+import os
+import json
+import random
+import sqlite3
+import argparse
+import platform
+import subprocess
+import time
+from datetime import datetime
+from sqlalchemy import event
+from app import (create_app, db, password_hasher, vote_buffer, add_missing_post_columns,
+                 query_posts, post_cursor, POSTS_PER_PAGE, User, Post, Subllmit)
+from seed_db import SIZES, WORDS, seed
+from sqlite_profile import BASE_DIR
+
+# Repeatable performance numbers for the web app.
+#
+# For each dataset size (see seed_db.SIZES) a synthetic world is seeded once
+# into DATA_DIR/<size>-seed<seed>.db and kept; every run works on a fresh copy
+# of it, so votes cast by one run never change what the next one measures.
+# The app runs in-process behind Flask's test client, which leaves out the
+# network and the server but keeps routing, the ORM, SQLite and JSON encoding.
+#
+# Each scenario is sent WARMUP times unmeasured and then REQUESTS times one
+# after another, recording per-request latency and the number of SQL
+# statements executed. The response cache is off unless --cache is given, so
+# by default the numbers are for the work behind a cache miss.
+#
+# Results go to a JSON file that is stable across runs with the same settings,
+# so two of them can be diffed, or compared with:
+#
+#   python benchmark.py --compare before.json after.json
+
+RESULTS_VERSION = 1
+REQUESTS = 200
+WARMUP = 10
+DATA_DIR = os.path.join(BASE_DIR, 'instance', 'benchmark')
+
+# How far into the busiest subllmit's top listing the "deep page" scenarios
+# start, or half way into it on datasets where it is shorter. The frontpage
+# itself is no good for this: its top listing is a table of at most
+# frontpage.PER_SUBLLMIT posts per subllmit (see frontpage.py).
+DEEP_OFFSET = 500
+
+BENCH_USERNAME = 'benchmark'
+BENCH_PASSWORD = 'benchmark'
+
+
+class QueryCounter:
+    # before_cursor_execute listener: counts every statement sent to SQLite
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def seeded_dataset(size, seed_value, data_dir, reseed=False):
+    # Path to the pristine seeded database for this size, seeding it if needed
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'{size}-seed{seed_value}.db')
+    if reseed:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    if os.path.exists(path):
+        return path, None
+
+    print(f"Seeding the {size} dataset into {path}...")
+    app = bench_app(path, cache=False)
+    with app.app_context():
+        db.create_all()
+        result = seed(db.engine, seed=seed_value, progress=False, **SIZES[size])
+        db.engine.dispose()
+    print(f"Seeded {result['posts']} posts and {result['comments']} comments in {result['seconds']}s")
+    return path, result['seconds']
+
+def working_copy(path):
+    # Copies the pristine database (WAL included) with SQLite's backup API
+    target = path[:-len('.db')] + '.run.db'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    source, destination = sqlite3.connect(path), sqlite3.connect(target)
+    source.backup(destination)
+    source.close()
+    destination.close()
+    return target
+
+def bench_app(path, cache):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'RESPONSE_CACHE_ENABLED': cache,
+        # Votes stay buffered until the run is over, so no flush lands inside a measurement
+        'VOTE_FLUSH_INTERVAL': 3600,
+        'VOTE_BUFFER_SIZE': 10 ** 9,
+        # Only the benchmark user logs in; no need for a production work factor
+        'PASSWORD_HASH_ROUNDS': 4,
+        'PASSWORD_HASH_WORKERS': 0,
+    })
+
+def bench_user_id():
+    user = User.query.filter_by(username=BENCH_USERNAME).first()
+    if user is None:
+        user = User(username=BENCH_USERNAME, password=password_hasher.generate_password_hash(BENCH_PASSWORD),
+                    background='Benchmark account', goal='Vote on things', user_type='human')
+        db.session.add(user)
+        db.session.commit()
+    return user.id
+
+def plan_scenarios(rng):
+    # (name, method, request factory) for this dataset; factories return (url, json body)
+    busiest_group, busiest_posts = (db.session.query(Post.group_name, db.func.count())
+                                    .group_by(Post.group_name)
+                                    .order_by(db.func.count().desc())
+                                    .first())
+    threads = [row[0] for row in db.session.query(Post.id).order_by(Post.comment_count, Post.id)]
+    typical_thread, largest_thread = threads[len(threads) // 2], threads[-1]
+    deep_offset = min(DEEP_OFFSET, busiest_posts // 2 // POSTS_PER_PAGE * POSTS_PER_PAGE)
+    deep_post = query_posts(busiest_group, 'top').offset(deep_offset - 1).first() if deep_offset else None
+    if deep_post is None:
+        raise RuntimeError(f"'{busiest_group}' has too few posts ({busiest_posts}) for the deep page scenarios")
+    deep_cursor = post_cursor(deep_post, 'top')
+    deep_page = deep_offset // POSTS_PER_PAGE + 1
+    prefixes = sorted({name[:2] for (name,) in db.session.query(Subllmit.name)})
+    post_ids = threads
+
+    return [
+        ('index', 'GET', lambda: ('/', None)),
+        ('posts_top', 'GET', lambda: ('/api/posts?sort=top&cursor=', None)),
+        ('posts_new', 'GET', lambda: ('/api/posts?sort=new&cursor=', None)),
+        ('posts_hot_busiest_group', 'GET', lambda: (f'/api/posts?group={busiest_group}&sort=hot&cursor=', None)),
+        ('posts_top_busiest_group_deep_cursor', 'GET',
+         lambda: (f'/api/posts?group={busiest_group}&sort=top&cursor={deep_cursor}', None)),
+        ('posts_top_busiest_group_deep_page', 'GET',
+         lambda: (f'/api/posts?group={busiest_group}&sort=top&page={deep_page}', None)),
+        ('comments_typical_thread', 'GET', lambda: (f'/api/posts/{typical_thread}/comments', None)),
+        ('comments_largest_thread', 'GET', lambda: (f'/api/posts/{largest_thread}/comments', None)),
+        ('subllmit_search', 'GET', lambda: (f'/api/subllmits?query={rng.choice(prefixes)}', None)),
+        ('full_text_search', 'GET', lambda: (f'/api/search?q={rng.choice(WORDS)}', None)),
+        ('vote', 'POST', lambda: ('/api/votes/posts', {
+            'post_id': rng.choice(post_ids),
+            'vote_type': rng.choice(('upvote', 'downvote'))
+        })),
+    ]
+
+def measure(client, counter, method, make_request, requests, warmup):
+    for _ in range(warmup):
+        url, body = make_request()
+        client.open(url, method=method, json=body)
+
+    latencies, queries, errors = [], 0, 0
+    for _ in range(requests):
+        url, body = make_request()
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        latencies.append(time.perf_counter() - started)
+        queries += counter.count
+        if response.status_code >= 400:
+            errors += 1
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(total / requests * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "throughput_rps": round(requests / total, 1),
+        "queries_per_request": round(queries / requests, 2),
+    }
+
+def run_dataset(size, args):
+    pristine, seed_seconds = seeded_dataset(size, args.seed, args.data_dir, args.reseed)
+    path = working_copy(pristine)
+    app = bench_app(path, args.cache)
+    rng = random.Random(args.seed)
+    counter = QueryCounter()
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            # Datasets seeded by an older checkout may lack newer columns
+            add_missing_post_columns(connection)
+        bench_user_id()
+        rows = {
+            "users": User.query.count(),
+            "subllmits": Subllmit.query.count(),
+            "posts": Post.query.count(),
+            "comments": db.session.execute(db.text('SELECT COUNT(*) FROM comments')).scalar(),
+        }
+        scenarios = plan_scenarios(rng)
+        db.session.remove()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f"Could not log in as {BENCH_USERNAME} (status {response.status_code})")
+
+    print(f"{size}: {rows['posts']} posts, {rows['comments']} comments")
+    results = {}
+    for name, method, make_request in scenarios:
+        if args.only and name not in args.only:
+            continue
+        result = measure(client, counter, method, make_request, args.requests, args.warmup)
+        results[name] = result
+        print(f"  {name:<26} p50 {result['p50_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   "
+              f"{result['throughput_rps']:8.1f} req/s   {result['queries_per_request']:6.2f} queries")
+
+    # Write out the buffered votes before the next dataset rebinds the extensions
+    vote_buffer.flush()
+    with app.app_context():
+        event.remove(db.engine, 'before_cursor_execute', counter)
+        db.engine.dispose()
+    return {"rows": rows, "seed_seconds": seed_seconds, "scenarios": results}
+
+def compare(before_path, after_path):
+    with open(before_path, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_path, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"{before.get('git_commit')} -> {after.get('git_commit')}")
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+
+    for size, dataset in after["datasets"].items():
+        old_scenarios = before["datasets"].get(size, {}).get("scenarios", {})
+        print(f"{size}:")
+        for name, new in dataset["scenarios"].items():
+            old = old_scenarios.get(name)
+            if old is None:
+                print(f"  {name:<26} (new)")
+                continue
+            print(f"  {name:<26} p50 {old['p50_ms']:.2f} -> {new['p50_ms']:.2f} ms ({change(old['p50_ms'], new['p50_ms'])})   "
+                  f"p99 {old['p99_ms']:.2f} -> {new['p99_ms']:.2f} ms ({change(old['p99_ms'], new['p99_ms'])})   "
+                  f"queries {old['queries_per_request']} -> {new['queries_per_request']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the LLMit web app against seeded datasets.")
+    parser.add_argument('--sizes', default='small,medium', help=f"Comma-separated dataset sizes ({', '.join(SIZES)}).")
+    parser.add_argument('--requests', type=int, default=REQUESTS, help="Measured requests per scenario.")
+    parser.add_argument('--warmup', type=int, default=WARMUP, help="Unmeasured requests per scenario first.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the datasets and the request mix.")
+    parser.add_argument('--only', help="Comma-separated scenario names to run (default: all).")
+    parser.add_argument('--cache', action='store_true', help="Leave the response cache on.")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Where seeded datasets are kept between runs.")
+    parser.add_argument('--reseed', action='store_true', help="Seed the datasets again even if they exist.")
+    parser.add_argument('--output', default='benchmark-results.json', help="JSON file to write the results to.")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files and exit.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        raise SystemExit(0)
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    args.only = set(args.only.split(',')) if args.only else None
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.utcnow().isoformat(timespec='seconds'),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "settings": {"requests": args.requests, "warmup": args.warmup, "seed": args.seed, "cache": args.cache},
+        "datasets": {},
+    }
+    for size in sizes:
+        results["datasets"][size] = run_dataset(size, args)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+    print(f"Results written to {args.output}")
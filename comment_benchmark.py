@@ -0,0 +1,145 @@
+import io
+import json
+import random
+import argparse
+import threading
+import time
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from openai import OpenAI
+import populate_db
+from generation_engine import GenerationEngine, Job
+from llm_stub_server import make_server
+from world_state import Bot
+
+# Compares populate_db.py's two ways of generating comments, against the stub
+# server so the numbers don't depend on a model being loaded:
+#
+#   single   one request per comment (the default)
+#   batched  one request per post for all of its comments (--batched-comments),
+#            optionally with replies to each other (--comment-replies)
+#
+# Both modes get the same posts, the same commenters and the same number of
+# comments per post, and run through the same GenerationEngine at the same
+# concurrency. For each mode it reports requests, prompt and completion
+# tokens per comment, and the wall time. Tokens are counted the way the stub
+# counts them, in words: prompt words as sent, completion words as the stub
+# actually streamed or returned them.
+#
+#   python comment_benchmark.py --posts 50 --latency 0.2 --token-latency 0.01
+
+POSTS = 50
+MAX_COMMENTS = 10
+PERSONAS = 40
+
+
+class CountingClient:
+    # Stands in for an OpenAI client and counts requests and prompt words
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_words = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        words = sum(len(str(message.get('content', '')).split()) for message in request['messages'])
+        with self._lock:
+            self.requests += 1
+            self.prompt_words += words
+        return self._client.chat.completions.create(**request)
+
+
+def plan_posts(rng, posts, max_comments, personas):
+    bots = [Bot(n, f"bot{n}", f"Loves topic number {n} and talks about it a lot.", f"To win every argument about topic {n}.")
+            for n in range(1, personas + 1)]
+    return [(f"Thoughts on topic {n}", rng.choice(('science', 'funny', 'books', 'space')),
+             [rng.choice(bots) for _ in range(rng.randint(1, max_comments))])
+            for n in range(posts)]
+
+def run_mode(mode, plan, base_url, server_state, concurrency):
+    counting = CountingClient(OpenAI(base_url=base_url, api_key="stub"))
+    populate_db.client = counting
+    jobs = []
+    for title, group_name, commenters in plan:
+        if mode == 'single':
+            jobs += [Job('comment', populate_db.generate_comment_for_post, (title, group_name, commenter))
+                     for commenter in commenters]
+        else:
+            jobs.append(Job('comments', populate_db.generate_comments_for_post,
+                            (title, group_name, commenters, mode == 'threaded')))
+    queued = iter(jobs)
+    engine = GenerationEngine(concurrency, lambda: next(queued, None))
+
+    tokens_before = server_state.tokens_sent
+    started = time.perf_counter()
+    comments = replies = failed = 0
+    with redirect_stdout(io.StringIO()):  # the generators' debugging output
+        for job, result, error in engine.results():
+            if error is not None or not result:
+                failed += 1
+            elif job.kind == 'comment':
+                comments += 1
+            else:
+                comments += len(result)
+                replies += sum(1 for _, _, parent in result if parent is not None)
+    elapsed = time.perf_counter() - started
+    engine.shutdown()
+
+    completion_words = server_state.tokens_sent - tokens_before
+    per_comment = lambda value: value / comments if comments else 0.0
+    return {
+        "mode": mode,
+        "comments": comments,
+        "replies": replies,
+        "failed_requests": failed,
+        "requests": counting.requests,
+        "requests_per_comment": per_comment(counting.requests),
+        "prompt_words_per_comment": per_comment(counting.prompt_words),
+        "completion_words_per_comment": per_comment(completion_words),
+        "seconds": elapsed,
+        "comments_per_second": comments / elapsed if elapsed else 0.0,
+    }
+
+def print_results(results):
+    print(f"{'mode':<10}{'comments':>9}{'replies':>8}{'requests':>9}{'req/cmt':>9}"
+          f"{'prompt/cmt':>11}{'compl/cmt':>10}{'seconds':>9}{'cmt/s':>8}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['comments']:>9}{r['replies']:>8}{r['requests']:>9}{r['requests_per_comment']:>9.2f}"
+              f"{r['prompt_words_per_comment']:>11.1f}{r['completion_words_per_comment']:>10.1f}"
+              f"{r['seconds']:>9.2f}{r['comments_per_second']:>8.1f}")
+    single = results[0]
+    for r in results[1:]:
+        if r['requests'] and r['prompt_words_per_comment']:
+            print(f"{r['mode']}: {single['requests_per_comment'] / r['requests_per_comment']:.1f}x fewer requests, "
+                  f"{single['prompt_words_per_comment'] / r['prompt_words_per_comment']:.1f}x fewer prompt words "
+                  f"per comment, {single['seconds'] / r['seconds']:.1f}x the speed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-comment and batched comment generation on the stub server.")
+    parser.add_argument('--posts', type=int, default=POSTS, help=f"Posts to comment on (default: {POSTS})")
+    parser.add_argument('--max-comments', type=int, default=MAX_COMMENTS,
+                        help=f"Comments per post are 1 to this many (default: {MAX_COMMENTS})")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight at once (default: 4)")
+    parser.add_argument('--latency', type=float, default=0.2, help="Stub seconds per request (default: 0.2)")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="Stub seconds per streamed word")
+    parser.add_argument('--port', type=int, default=1236, help="Port for the in-process stub server")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    server = make_server('127.0.0.1', args.port, args.latency, args.token_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+
+    plan = plan_posts(random.Random(args.seed), args.posts, args.max_comments, PERSONAS)
+    results = [run_mode(mode, plan, base_url, server.RequestHandlerClass.state, args.concurrency)
+               for mode in ('single', 'batched', 'threaded')]
+    server.shutdown()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
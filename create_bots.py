@@ -1,52 +1,41 @@
 import os
-import sqlite3
+import time
 import random
-import json
-import re
+import argparse
 from openai import OpenAI
-from flask_bcrypt import Bcrypt  # Import Bcrypt for password hashing
+from app import UNUSABLE_PASSWORD, create_app, create_tables
+from sqlite_profile import DB_PATH, connect
+from generation_engine import GenerationEngine, Job
+from llm_cache import LLMCache, cached_client, add_cache_arguments
+from structured_output import StructuredStats, generate_json, RETRIES
 
-# Database for the main application
-DB_NAME = "instance/llmit.db"
+# Database for the main application (path and pragmas come from sqlite_profile.py)
+DB_NAME = DB_PATH
 
-# Initialize OpenAI client
-client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+# Initialize OpenAI client (LM Studio by default; --base-url points it elsewhere)
+LLM_BASE_URL = os.environ.get('LLMIT_LLM_BASE_URL', "http://localhost:1234/v1")
+client = OpenAI(base_url=LLM_BASE_URL, api_key="lm-studio")
 
-# Initialize Bcrypt
-bcrypt = Bcrypt()
+# Answers can be recorded and replayed (see llm_cache.py); live by default
+llm_cache = LLMCache()
 
-def initialize_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Drop the users table if it exists (for reinitialization)
-    cursor.execute('DROP TABLE IF EXISTS users')
-    
-    # Create the users table if it doesn't exist
-    cursor.execute(''' 
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            background TEXT NOT NULL,
-            goal TEXT NOT NULL,
-            user_type TEXT NOT NULL DEFAULT 'bot'  -- To differentiate between bots and humans
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print(f"{DB_NAME} initialized successfully.")
+# Tokens, retries and parse failures of the profile generations
+structured_stats = StructuredStats()
 
-def extract_json(response_text):
-    try:
-        # Use regex to find a JSON object in the response
-        json_str = re.search(r'\{.*?\}', response_text, re.DOTALL).group()
-        return json.loads(json_str)
-    except Exception as e:
-        print(f"Error extracting JSON: {e}")
-        print(f"Response text was: {response_text}")
-        return None
+# Extra attempts at a profile whose JSON doesn't parse or misses a field (--json-retries)
+json_retries = RETRIES
+
+# Bots are written in batches of this many rows, one executemany per batch
+SAVE_BATCH_SIZE = 200
+
+def prepare_db():
+    # Creates whatever tables are missing, the same way the app does, and
+    # leaves existing users, posts and bots alone: every run adds to the roster
+    create_tables(create_app())
+    conn = connect(DB_NAME)
+    bots = conn.execute("SELECT COUNT(*) FROM users WHERE user_type = 'bot'").fetchone()[0]
+    conn.close()
+    print(f"{DB_NAME} ready, {bots} bots already in it.")
 
 def generate_user_profile():
     # Vary the seed randomly
@@ -74,21 +63,19 @@ def generate_user_profile():
     ]
 
     try:
-        completion = client.chat.completions.create(
+        # Streamed and cut off at the closing brace, so "do not ramble" no longer has to be obeyed
+        profile_data = generate_json(
+            client, structured_stats, required=('username', 'background', 'goal'), retries=json_retries,
             model="unsloth/Llama-3.2-3B-Instruct-GGUF",
             messages=history,
             temperature=0.7,
             max_tokens=500,
             timeout=90  # Set a timeout directly in the API call
         )
+        print(f"AI Response: {profile_data}")  # For debugging
 
-        response_content = completion.choices[0].message.content.strip()
-        print(f"AI Response: {response_content}")  # For debugging
-
-        profile_data = extract_json(response_content)
-
-        if profile_data and 'username' in profile_data and 'background' in profile_data and 'goal' in profile_data:
-            return profile_data['username'], profile_data['background'], profile_data['goal']
+        if profile_data:
+            return str(profile_data['username']), str(profile_data['background']), str(profile_data['goal'])
         else:
             print("Failed to create a valid user profile.")
     except Exception as e:
@@ -96,31 +83,88 @@ def generate_user_profile():
 
     return None, None, None
 
-def save_bot_user(username, background, goal):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Generate a random password and hash it
-    random_password = os.urandom(16).hex()  # Generates a random 32-character hex string
-    hashed_password = bcrypt.generate_password_hash(random_password).decode('utf-8')
-    
+def save_bot_users(conn, profiles):
+    # Bots never log in, so they get the unusable password marker instead of a bcrypt hash
+    cursor = conn.executemany(
+        'INSERT OR IGNORE INTO users (username, password, background, goal, user_type) '
+        'VALUES (?, ?, ?, ?, "bot")',
+        [(username, UNUSABLE_PASSWORD, background, goal) for username, background, goal in profiles]
+    )
+    conn.commit()
+    return cursor.rowcount
+
+def create_bots(count, concurrency):
+    # Profiles are generated `concurrency` at a time; this loop alone talks to the database
+    conn = connect(DB_NAME)
+    usernames = {row[0] for row in conn.execute('SELECT username FROM users')}
+    pending = []
+    saved = attempts = duplicates = failed = 0
+    # Stop asking after this many generations, in case the model keeps repeating itself
+    max_attempts = count * 3
+    progress_every = max(1, count // 20)
+
+    def next_profile_job():
+        nonlocal attempts
+        accepted = saved + len(pending)
+        in_flight = attempts - accepted - duplicates - failed
+        # Never have more generations running than bots still missing
+        if accepted + in_flight >= count or attempts >= max_attempts:
+            return None
+        attempts += 1
+        return Job('profile', generate_user_profile)
+
+    engine = GenerationEngine(concurrency, next_profile_job)
+    started_at = time.monotonic()
     try:
-        cursor.execute('INSERT INTO users (username, password, background, goal, user_type) VALUES (?, ?, ?, ?, "bot")', (username, hashed_password, background, goal))
-        conn.commit()
-        print(f"Bot user '{username}' saved to database.")
-    except sqlite3.IntegrityError:
-        print(f"Username '{username}' already exists in {DB_NAME}. Skipping this entry.")
+        for job, result, error in engine.results():
+            username, background, goal = result if error is None else (None, None, None)
+            if not (username and background and goal):
+                failed += 1
+                print("User profile creation failed, moving on to the next user.")
+                continue
+            if username in usernames:
+                duplicates += 1
+                print(f"Username '{username}' already taken. Skipping this entry.")
+                continue
+            usernames.add(username)
+            pending.append((username, background, goal))
+
+            if len(pending) >= SAVE_BATCH_SIZE:
+                saved += save_bot_users(conn, pending)
+                pending = []
+            accepted = saved + len(pending)
+            if accepted % progress_every == 0:
+                elapsed = time.monotonic() - started_at
+                print(f"{accepted}/{count} bots ({accepted / max(elapsed, 1e-9):.1f} bots/s, {saved} saved)")
     finally:
+        engine.shutdown()
+        if pending:
+            saved += save_bot_users(conn, pending)
         conn.close()
+        elapsed = time.monotonic() - started_at
+        print(f"Created {saved} bots in {elapsed:.1f}s ({saved / max(elapsed, 1e-9):.1f} bots/s, "
+              f"{attempts} generations, {duplicates} duplicate usernames, {failed} failed).")
+        print(structured_stats.summary())
+        print(llm_cache.summary())
+    return saved
 
 if __name__ == "__main__":
-    # Initialize the main database
-    initialize_db()
-
-    # Create initial users (50 users)
-    for _ in range(50):  
-        username, background, goal = generate_user_profile()
-        if username and background and goal:
-            save_bot_user(username, background, goal)
-        else:
-            print("User profile creation failed, moving on to the next user.")
+    parser = argparse.ArgumentParser(description="Create the bot roster.")
+    parser.add_argument('--count', type=int, default=50, help="Number of bots to create (default: 50)")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="Profile generations kept in flight at once (default: 4)")
+    parser.add_argument('--base-url', default=LLM_BASE_URL,
+                        help="OpenAI-compatible server, e.g. llm_stub_server.py for testing")
+    parser.add_argument('--json-retries', type=int, default=RETRIES,
+                        help=f"Extra attempts at a profile whose JSON is unusable (default: {RETRIES})")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    json_retries = args.json_retries
+
+    llm_cache = LLMCache(args.llm_cache, args.llm_cache_path, args.llm_cache_max_mb)
+    client = cached_client(OpenAI(base_url=args.base_url, api_key="lm-studio"), llm_cache)
+
+    # Make sure the tables exist, without touching what is already there
+    prepare_db()
+
+    create_bots(args.count, args.concurrency)
@@ -0,0 +1,191 @@
+import time
+import threading
+from sqlalchemy import text, Table, Column, MetaData, Integer, String, Float
+
+# The frontpage's top and hot listings, materialized.
+#
+# The frontpage table holds, for each of 'top' and 'hot', the best
+# PER_SUBLLMIT posts of every subllmit. Each row carries the post's score (or
+# hot) as its rank, and its tier: PER_SUBLLMIT for the best post of its
+# subllmit, one less for the next, and so on. The listing is ordered by tier,
+# then rank, so it deals out posts in rounds: every subllmit's best post,
+# then every subllmit's second best, and so on. However busy a subllmit is,
+# it gets one post per round. A page therefore shows at most two of its
+# posts while at least a page's worth of subllmits still have posts in the
+# round; only past the end of the quieter subllmits does a busy one fill
+# pages alone. The listing is one range read of ix_frontpage_rank, joined to
+# posts by primary key, however many subllmits and posts there are.
+#
+# Like the search index, it is kept up to date by triggers on posts, so every
+# writer keeps it in step. A new post, or a changed score or hot, is
+# upserted, its subllmit is trimmed back to PER_SUBLLMIT, and the
+# subllmit's tiers are renumbered. That touches at most PER_SUBLLMIT rows,
+# and writes only those whose tier changed. For posts that are only ever
+# added or voted up, that is exact. What the triggers can't do is promote a
+# post that was trimmed earlier once a member falls below it after downvotes,
+# so rebuild_frontpage() recomputes the whole table and the app does that
+# every FRONTPAGE_REBUILD_INTERVAL seconds. Stored hot ranks don't change as
+# posts age (newer posts simply rank higher), so that is the only drift the
+# rebuild has to correct.
+#
+# A cap on the whole list as well would cost a scan of the list on every
+# insert; the table stays small without one (PER_SUBLLMIT rows per
+# subllmit and sort).
+
+FRONTPAGE_SORTS = {'top': 'score', 'hot': 'hot'}
+PER_SUBLLMIT = 25
+REBUILD_INTERVAL = 300
+
+frontpage_table = Table(
+    'frontpage', MetaData(),
+    Column('sort', String, primary_key=True),
+    Column('post_id', Integer, primary_key=True),
+    Column('group_name', String, nullable=False),
+    Column('rank', Float, nullable=False),
+    Column('tier', Integer, nullable=False),
+)
+
+
+def renumber_statement(sort, group_name):
+    # Trigger statement: recompute the tiers of one subllmit's rows in a listing
+    return f'''
+        UPDATE frontpage SET tier = ranked.tier
+        FROM (SELECT post_id, {PER_SUBLLMIT + 1} - row_number() OVER (ORDER BY rank DESC, post_id DESC) AS tier
+              FROM frontpage WHERE sort = '{sort}' AND group_name = {group_name}) AS ranked
+        WHERE frontpage.sort = '{sort}' AND frontpage.post_id = ranked.post_id AND frontpage.tier != ranked.tier;'''
+
+def upsert_statements():
+    # Trigger body: upsert new.* into each listing, drop whatever that pushed
+    # past its subllmit's PER_SUBLLMIT, and renumber the subllmit's tiers
+    return ''.join(f'''
+        INSERT INTO frontpage (sort, post_id, group_name, rank, tier) VALUES ('{sort}', new.id, new.group_name, new.{column}, 0)
+            ON CONFLICT (sort, post_id) DO UPDATE SET rank = excluded.rank;
+        DELETE FROM frontpage WHERE sort = '{sort}' AND group_name = new.group_name
+            AND (rank, post_id) < (SELECT rank, post_id FROM frontpage
+                                   WHERE sort = '{sort}' AND group_name = new.group_name
+                                   ORDER BY rank DESC, post_id DESC LIMIT 1 OFFSET {PER_SUBLLMIT - 1});'''
+                   + renumber_statement(sort, 'new.group_name')
+                   for sort, column in FRONTPAGE_SORTS.items())
+
+FRONTPAGE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS frontpage (
+        sort TEXT NOT NULL,  -- 'top' or 'hot'
+        post_id INTEGER NOT NULL,
+        group_name TEXT NOT NULL,
+        rank REAL NOT NULL,  -- the post's score or hot
+        tier INTEGER NOT NULL,  -- PER_SUBLLMIT for its subllmit's best post, then one less for each next
+        PRIMARY KEY (sort, post_id)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS ix_frontpage_rank ON frontpage (sort, tier, rank, post_id)',
+    'CREATE INDEX IF NOT EXISTS ix_frontpage_group ON frontpage (sort, group_name, rank, post_id)',
+    f'''CREATE TRIGGER IF NOT EXISTS frontpage_insert AFTER INSERT ON posts BEGIN{upsert_statements()}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS frontpage_update AFTER UPDATE OF score, hot ON posts
+    WHEN new.score IS NOT old.score OR new.hot IS NOT old.hot BEGIN{upsert_statements()}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS frontpage_delete AFTER DELETE ON posts BEGIN
+        DELETE FROM frontpage WHERE post_id = old.id;{''.join(renumber_statement(sort, 'old.group_name') for sort in FRONTPAGE_SORTS)}
+    END''',
+]
+
+FRONTPAGE_TRIGGERS = ['frontpage_insert', 'frontpage_update', 'frontpage_delete']
+
+# The best PER_SUBLLMIT posts of every subllmit, an index range read each
+REBUILD_SORT = '''
+    INSERT INTO frontpage (sort, post_id, group_name, rank, tier)
+    SELECT '{sort}', p.id, p.group_name, p.{column},
+           :per_subllmit + 1 - row_number() OVER (PARTITION BY p.group_name ORDER BY p.{column} DESC, p.id DESC)
+    FROM subllmits AS s
+    JOIN posts AS p ON p.id IN (
+        SELECT id FROM posts WHERE group_name = s.name ORDER BY {column} DESC, id DESC LIMIT :per_subllmit
+    )
+'''
+
+
+def create_frontpage_schema(connection):
+    # A table from before tiers is dropped and rebuilt; it holds nothing
+    # that can't be recomputed from posts
+    columns = [row[1] for row in connection.execute(text('PRAGMA table_info(frontpage)'))]
+    if columns and 'tier' not in columns:
+        drop_frontpage_triggers(connection)
+        connection.execute(text('DROP TABLE frontpage'))
+    for statement in FRONTPAGE_SCHEMA:
+        connection.execute(text(statement))
+
+def drop_frontpage_triggers(connection):
+    # For bulk loads: insert without the per-row triggers, then
+    # create_frontpage_schema() and rebuild_frontpage() once at the end
+    for trigger in FRONTPAGE_TRIGGERS:
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+
+def rebuild_frontpage(connection):
+    # Returns the number of rows per sort
+    connection.execute(text('DELETE FROM frontpage'))
+    counts = {}
+    for sort, column in FRONTPAGE_SORTS.items():
+        counts[sort] = connection.execute(text(REBUILD_SORT.format(sort=sort, column=column)),
+                                          {'per_subllmit': PER_SUBLLMIT}).rowcount
+    return counts
+
+
+class Frontpage:
+    # Makes sure the table exists the first time the frontpage is read, and
+    # rebuilds it every FRONTPAGE_REBUILD_INTERVAL seconds on a daemon thread
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.rebuild_interval = REBUILD_INTERVAL
+        self.rebuilds = 0
+        self.last_rebuild_seconds = None
+        self.on_rebuild = []
+        self._ready = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.rebuild_interval = app.config.get('FRONTPAGE_REBUILD_INTERVAL', self.rebuild_interval)
+
+    def ensure_ready(self):
+        # Called before each frontpage read; does real work only the first time
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                with self.db.engine.begin() as connection:
+                    create_frontpage_schema(connection)
+                    empty = connection.execute(text('SELECT 1 FROM frontpage LIMIT 1')).first() is None
+                if empty:
+                    self.rebuild()
+                self._ready = True
+        self._ensure_thread()
+
+    def rebuild(self):
+        started = time.perf_counter()
+        with self.db.engine.begin() as connection:
+            counts = rebuild_frontpage(connection)
+        self.rebuilds += 1
+        self.last_rebuild_seconds = time.perf_counter() - started
+        for callback in self.on_rebuild:
+            callback(counts)
+        return counts
+
+    def _ensure_thread(self):
+        if self._thread is not None or not self.rebuild_interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='frontpage-rebuild', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._wake.wait(self.rebuild_interval):
+            try:
+                with self.app.app_context():
+                    self.rebuild()
+            except Exception as e:
+                print(f"Error rebuilding the frontpage: {e}")
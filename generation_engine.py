@@ -0,0 +1,81 @@
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Keeps up to `concurrency` LLM generations in flight on a thread pool and hands
+# their results back, one at a time, to the single thread that writes to the
+# database. Nothing in here touches the database: jobs only talk to the
+# inference server, and the caller's loop stays the one and only DB writer.
+#
+# Jobs queued with add() (e.g. comments for a post that was just saved) run
+# before new work is pulled from next_job, so threads get finished before new
+# ones are started.
+
+
+class Job:
+    __slots__ = ('kind', 'fn', 'args', 'context')
+
+    def __init__(self, kind, fn, args=(), context=None):
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.context = context
+
+
+class GenerationEngine:
+    def __init__(self, concurrency, next_job=None):
+        self.concurrency = max(1, concurrency)
+        self.next_job = next_job
+        self.backlog = deque()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._results = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='generate')
+
+    def add(self, job):
+        self.backlog.append(job)
+
+    def _run_job(self, job):
+        try:
+            self._results.put((job, job.fn(*job.args), None))
+        except Exception as e:
+            self._results.put((job, None, e))
+
+    def _fill(self):
+        while self.in_flight < self.concurrency:
+            if self.backlog:
+                job = self.backlog.popleft()
+            elif self.next_job is not None:
+                job = self.next_job()
+                if job is None:
+                    break
+            else:
+                break
+            self.in_flight += 1
+            self._executor.submit(self._run_job, job)
+
+    def results(self, poll_interval=None):
+        # Yields (job, result, error) until the backlog and next_job run dry.
+        # With a poll_interval, yields (None, None, None) whenever nothing has
+        # finished for that long, so the caller can do periodic work.
+        while True:
+            self._fill()
+            if self.in_flight == 0:
+                return
+            try:
+                job, result, error = self._results.get(timeout=poll_interval)
+            except queue.Empty:
+                yield None, None, None
+                continue
+            self.in_flight -= 1
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+            yield job, result, error
+
+    def shutdown(self):
+        self.backlog.clear()
+        self.next_job = None
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+# SQLite-backed queue of image-generation jobs.
+#
+# populate_db.py enqueues a job (post id + prompt) in the same transaction
+# that writes the post, and image_worker.py leases jobs in batches, renders
+# them and attaches image_url to the post. A lease expires after
+# lease_seconds, so jobs held by a worker that died are picked up again;
+# after max_attempts a job is marked failed instead of retried forever.
+
+QUEUE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS image_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER NOT NULL,
+        prompt TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done or failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_until DATETIME,
+        worker TEXT,
+        error TEXT,
+        created_at DATETIME NOT NULL,
+        started_at DATETIME,
+        finished_at DATETIME,
+        FOREIGN KEY (post_id) REFERENCES posts (id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_image_jobs_status ON image_jobs (status, id)',
+]
+
+ENQUEUE = text('''
+    INSERT INTO image_jobs (post_id, prompt, status, attempts, created_at)
+    VALUES (:post_id, :prompt, 'queued', 0, :created_at)
+''')
+
+# One statement, so two workers can never lease the same job
+LEASE = text('''
+    UPDATE image_jobs
+    SET status = 'running', attempts = attempts + 1, worker = :worker,
+        lease_until = :lease_until, started_at = :now
+    WHERE id IN (
+        SELECT id FROM image_jobs
+        WHERE (status = 'queued' OR (status = 'running' AND lease_until < :now))
+          AND attempts < :max_attempts
+        ORDER BY id
+        LIMIT :batch_size
+    )
+    RETURNING id, post_id, prompt, attempts
+''')
+
+COMPLETE = text('''
+    UPDATE image_jobs
+    SET status = 'done', finished_at = :now, lease_until = NULL, error = NULL
+    WHERE id = :job_id
+''')
+
+ATTACH_IMAGE = text('UPDATE posts SET image_url = :image_url, image_variants = :image_variants WHERE id = :post_id')
+
+FAIL = text('''
+    UPDATE image_jobs
+    SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'queued' END,
+        error = :error, lease_until = NULL, finished_at = :now
+    WHERE id = :job_id
+''')
+
+# Jobs that ran out of attempts while their lease was still running
+EXPIRE = text('''
+    UPDATE image_jobs SET status = 'failed', error = 'lease expired too many times'
+    WHERE status = 'running' AND lease_until < :now AND attempts >= :max_attempts
+''')
+
+def create_queue_schema(connection):
+    for statement in QUEUE_SCHEMA:
+        connection.execute(text(statement))
+
+def enqueue(connection, jobs):
+    # jobs: iterable of (post_id, prompt)
+    now = datetime.utcnow()
+    rows = [{'post_id': post_id, 'prompt': prompt, 'created_at': now} for post_id, prompt in jobs]
+    if rows:
+        connection.execute(ENQUEUE, rows)
+    return len(rows)
+
+def lease(engine, worker, batch_size, lease_seconds=600, max_attempts=3):
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(EXPIRE, {'now': now, 'max_attempts': max_attempts})
+        rows = connection.execute(LEASE, {
+            'worker': worker,
+            'now': now,
+            'lease_until': now + timedelta(seconds=lease_seconds),
+            'max_attempts': max_attempts,
+            'batch_size': batch_size
+        }).mappings().all()
+    return sorted((dict(row) for row in rows), key=lambda row: row['id'])
+
+def complete(engine, job_id, post_id, image_url, image_variants=None):
+    with engine.begin() as connection:
+        connection.execute(ATTACH_IMAGE, {'image_url': image_url, 'image_variants': image_variants,
+                                          'post_id': post_id})
+        connection.execute(COMPLETE, {'job_id': job_id, 'now': datetime.utcnow()})
+
+def fail(engine, job_id, error, max_attempts=3):
+    with engine.begin() as connection:
+        connection.execute(FAIL, {'job_id': job_id, 'error': str(error)[:500],
+                                  'max_attempts': max_attempts, 'now': datetime.utcnow()})
+
+def queue_stats(connection):
+    counts = dict(connection.execute(text(
+        'SELECT status, COUNT(*) FROM image_jobs GROUP BY status'
+    )).all())
+    oldest = connection.execute(text(
+        "SELECT MIN(created_at) FROM image_jobs WHERE status = 'queued'"
+    )).scalar()
+    # Latency = time from enqueue to image attached, over the last 100 finished jobs
+    latencies = [row[0] for row in connection.execute(text('''
+        SELECT (julianday(finished_at) - julianday(created_at)) * 86400.0
+        FROM image_jobs WHERE status = 'done'
+        ORDER BY id DESC LIMIT 100
+    ''')).all()]
+    oldest_age = None
+    if oldest is not None:
+        oldest_age = (datetime.utcnow() - datetime.fromisoformat(str(oldest))).total_seconds()
+    return {
+        "queued": counts.get('queued', 0),
+        "running": counts.get('running', 0),
+        "done": counts.get('done', 0),
+        "failed": counts.get('failed', 0),
+        "oldest_queued_seconds": oldest_age,
+        "avg_latency_seconds": sum(latencies) / len(latencies) if latencies else None,
+        "max_latency_seconds": max(latencies) if latencies else None
+    }
@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import mimetypes
+from sqlalchemy import text
+
+# Content-addressed storage for post images, plus smaller and lighter copies.
+#
+# An image is stored as static/uploads/<hash>.<ext>, where the hash is the
+# first 32 hex digits of the file's sha256. A name therefore never points at
+# different bytes, and the app serves these files with immutable far-future
+# caching (see serve_upload in app.py). Next to each original go its
+# derivatives: one per DERIVATIVE_WIDTHS in WebP, and in AVIF when Pillow can
+# write it, named <hash>-<width>.<format>. Which ones exist is recorded on
+# the post (posts.image_variants, JSON like {"webp": [256, 512]}), so the API
+# can hand out a srcset without looking at the disk.
+#
+# Derivatives are made by image_worker.py right after it renders an image,
+# and by `flask --app app backfill-images` for files already in the uploads
+# directory, never while serving a request. They need Pillow; without it,
+# images are still stored under their hash and served as the original alone.
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
+UPLOAD_URL = '/static/uploads/'
+DERIVATIVE_WIDTHS = (256, 512)
+QUALITY = {'avif': 55, 'webp': 80}
+
+# Best first: a browser takes the first <source> type it understands
+CONTENT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+# <hash>.<ext> for originals, <hash>-<width>.<format> for derivatives
+HASHED_NAME = re.compile(r'^([0-9a-f]{32})(?:-(\d+))?\.([a-z0-9]+)$')
+
+HASH_CHUNK = 1024 * 1024
+
+UPLOADED_IMAGES = text(f"SELECT id, image_url, image_variants FROM posts WHERE image_url LIKE '{UPLOAD_URL}%'")
+
+SET_IMAGE = text('UPDATE posts SET image_url = :image_url, image_variants = :image_variants WHERE id = :id')
+
+for extension, content_type in CONTENT_TYPES.items():
+    mimetypes.add_type(content_type, f'.{extension}')
+
+
+def is_hashed(name):
+    return HASHED_NAME.match(name) is not None
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+def store_file(path, upload_dir=UPLOAD_DIR, move=True):
+    # Files path under its content hash in upload_dir and returns the new name.
+    # An identical file already stored is kept and path is dropped (if move).
+    extension = os.path.splitext(path)[1].lower() or '.png'
+    name = file_hash(path) + extension
+    target = os.path.join(upload_dir, name)
+    if os.path.abspath(path) == os.path.abspath(target):
+        return name
+    if os.path.exists(target):
+        if move:
+            os.remove(path)
+    elif move:
+        os.replace(path, target)
+    else:
+        shutil.copyfile(path, target + '.tmp')
+        os.replace(target + '.tmp', target)
+    return name
+
+def store_image(image, upload_dir=UPLOAD_DIR, extension='png'):
+    # image is anything with .save(path) (a PIL image, image_worker.StubImage)
+    os.makedirs(upload_dir, exist_ok=True)
+    temporary = os.path.join(upload_dir, f'.incoming-{os.getpid()}-{id(image)}.{extension}')
+    image.save(temporary)
+    return store_file(temporary, upload_dir)
+
+def derivative_formats():
+    # The formats of CONTENT_TYPES this Pillow can write; none without Pillow
+    try:
+        from PIL import features
+    except ImportError:
+        return []
+    formats = []
+    for name in CONTENT_TYPES:
+        try:
+            if features.check(name):
+                formats.append(name)
+        except ValueError:  # a Pillow too old to know the format at all
+            pass
+    return formats
+
+def make_derivatives(name, upload_dir=UPLOAD_DIR, formats=None):
+    # Writes whichever derivatives of the original `name` are missing and
+    # returns {format: [widths]} of those that exist, or None if there are none
+    formats = derivative_formats() if formats is None else formats
+    if not formats:
+        return None
+    from PIL import Image
+
+    stem = HASHED_NAME.match(name).group(1)
+    with Image.open(os.path.join(upload_dir, name)) as original:
+        # Never scaled up; an original narrower than every width gets one copy at its own width
+        widths = [width for width in DERIVATIVE_WIDTHS if width <= original.width] or [original.width]
+        variants = {}
+        for image_format in formats:
+            for width in widths:
+                target = os.path.join(upload_dir, f'{stem}-{width}.{image_format}')
+                if not os.path.exists(target):
+                    height = max(1, round(original.height * width / original.width))
+                    resized = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+                    if width != original.width:
+                        resized = resized.resize((width, height), Image.LANCZOS)
+                    resized.save(target + '.tmp', format=image_format.upper(), quality=QUALITY[image_format])
+                    os.replace(target + '.tmp', target)
+                variants.setdefault(image_format, []).append(width)
+    return variants
+
+def srcset(image_url, image_variants):
+    # [{"type": "image/avif", "srcset": "... 256w, ... 512w"}, ...], best format first
+    if not image_url or not image_variants:
+        return None
+    variants = json.loads(image_variants) if isinstance(image_variants, str) else image_variants
+    stem = image_url.rsplit('.', 1)[0]
+    return [{
+        "type": CONTENT_TYPES[image_format],
+        "srcset": ', '.join(f'{stem}-{width}.{image_format} {width}w' for width in variants[image_format])
+    } for image_format in CONTENT_TYPES if variants.get(image_format)]
+
+def variants_json(variants):
+    return json.dumps(variants, sort_keys=True, separators=(',', ':')) if variants else None
+
+def backfill_uploads(engine, upload_dir=UPLOAD_DIR, keep_originals=False):
+    # Renames every image in upload_dir to its content hash, makes missing
+    # derivatives and points the posts at both. Old files are removed only
+    # once the posts that used them have been updated.
+    if not os.path.isdir(upload_dir):
+        return {"renamed": 0, "posts_updated": 0, "formats": derivative_formats()}
+    with engine.connect() as connection:
+        posts = connection.execute(UPLOADED_IMAGES).all()
+    posts_by_name = {}
+    for post_id, image_url, image_variants in posts:
+        posts_by_name.setdefault(image_url[len(UPLOAD_URL):], []).append((post_id, image_variants))
+
+    formats = derivative_formats()
+    renamed, replaced, updates = 0, [], []
+    for entry in sorted(os.scandir(upload_dir), key=lambda entry: entry.name):
+        match = HASHED_NAME.match(entry.name)
+        if not entry.is_file() or entry.name.startswith('.') or (match and match.group(2)):
+            continue  # directories, temporary files and derivatives
+        name = entry.name
+        if not match:
+            try:
+                name = store_file(entry.path, upload_dir, move=False)
+            except OSError as e:
+                print(f"Skipping {entry.name}: {e}")
+                continue
+            replaced.append(entry.path)
+            renamed += 1
+        variants = None
+        if formats:
+            try:
+                variants = variants_json(make_derivatives(name, upload_dir, formats))
+            except Exception as e:  # not an image Pillow can read
+                print(f"No derivatives for {entry.name}: {e}")
+        for post_id, image_variants in posts_by_name.get(entry.name, []):
+            # Without Pillow, whatever derivatives a post already has are kept
+            new_variants = variants if formats else image_variants
+            if name != entry.name or image_variants != new_variants:
+                updates.append({'id': post_id, 'image_url': UPLOAD_URL + name, 'image_variants': new_variants})
+
+    if updates:
+        with engine.begin() as connection:
+            connection.execute(SET_IMAGE, updates)
+    if not keep_originals:
+        for path in replaced:
+            os.remove(path)
+    return {"renamed": renamed, "posts_updated": len(updates), "formats": formats}
@@ -0,0 +1,188 @@
+from boot_timing import BootTimer  # First, so the import phase is timed too
+import os
+import sys
+import time
+import zlib
+import struct
+import random
+import socket
+import argparse
+from app import create_app, db
+from image_queue import create_queue_schema, lease, complete, fail, queue_stats
+from image_store import UPLOAD_DIR, UPLOAD_URL, store_image, make_derivatives, derivative_formats, variants_json
+
+# Renders the images queued by populate_db.py, in a process of its own so text
+# generation never waits on Stable Diffusion:
+#
+#   python image_worker.py                 # Stable Diffusion 2-1, batches of 4
+#   python image_worker.py --stub --once   # placeholder images, no model weights
+#   python image_worker.py --stats         # queue depth and latency
+
+class StubImage:
+    # A flat-colour PNG written with zlib alone, so --stub needs neither torch nor Pillow
+    def __init__(self, width, height, color):
+        self.width = width
+        self.height = height
+        self.color = color
+
+    def save(self, path):
+        row = b'\x00' + bytes(self.color) * self.width
+        raw = zlib.compress(row * self.height, 9)
+
+        def chunk(kind, data):
+            body = kind + data
+            return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', raw) + chunk(b'IEND', b''))
+
+
+class StubPipeline:
+    # Same call shape as StableDiffusionPipeline: pipe(prompt=[...]).images
+    def __call__(self, prompt, height=512, width=512, **kwargs):
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        images = []
+        for text_prompt in prompts:
+            rng = random.Random(text_prompt)
+            images.append(StubImage(width, height, [rng.randint(0, 255) for _ in range(3)]))
+        return type('StubOutput', (), {'images': images})()
+
+
+def load_pipeline():
+    # Set environment variables before importing any dependent libraries
+    cache_directory = os.path.join(os.getcwd(), "huggingface")  # Use current working directory
+    os.environ['HF_HOME'] = cache_directory  # Alternatively, you can use 'TRANSFORMERS_CACHE'
+    os.environ['PYTORCH_CUDA_ALLOC_CONF'] = "max_split_size_mb:128"  # Helps with fragmentation
+    os.makedirs(cache_directory, exist_ok=True)
+
+    import torch
+    from diffusers import StableDiffusionPipeline
+
+    # Initialize the device to GPU if available
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"Using device: {device}")
+    if device.type == 'cuda':
+        torch.cuda.empty_cache()
+
+    pipe = StableDiffusionPipeline.from_pretrained(
+        "stabilityai/stable-diffusion-2-1",
+        cache_dir=cache_directory,
+        torch_dtype=torch.float16,
+        revision="fp16"
+    )
+    pipe.to(device)
+    print("Model loaded successfully.")
+    return pipe
+
+class LazyPipeline:
+    # Loads the model on the first batch, so --stats and an empty queue never import torch
+    def __init__(self, loader):
+        self.loader = loader
+        self.pipe = None
+
+    def __call__(self, *args, **kwargs):
+        if self.pipe is None:
+            started = time.perf_counter()
+            try:
+                self.pipe = self.loader()
+            except Exception as e:
+                # Leased jobs go back to the queue once their lease runs out
+                print("An unexpected error occurred while loading the model:", e)
+                sys.exit(1)
+            print(f"Model loaded in {time.perf_counter() - started:.1f}s")
+        return self.pipe(*args, **kwargs)
+
+
+def process_batch(pipe, jobs, max_attempts, formats=()):
+    try:
+        # One pipeline call renders the whole batch
+        images = pipe(prompt=[job['prompt'] for job in jobs], guidance_scale=7.5,
+                      num_inference_steps=20, height=512, width=512).images
+    except Exception as e:
+        print(f"Error generating images for jobs {[job['id'] for job in jobs]}: {e}")
+        for job in jobs:
+            fail(db.engine, job['id'], e, max_attempts)
+        return 0
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    done = 0
+    for job, image in zip(jobs, images):
+        try:
+            # Stored under its content hash, with its thumbnails and WebP/AVIF copies beside it
+            image_filename = store_image(image, UPLOAD_DIR)
+            variants = make_derivatives(image_filename, UPLOAD_DIR, formats)
+            complete(db.engine, job['id'], job['post_id'], UPLOAD_URL + image_filename, variants_json(variants))
+            print(f"Generated image for post {job['post_id']}")
+            done += 1
+        except Exception as e:
+            print(f"Error saving image for post {job['post_id']}: {e}")
+            fail(db.engine, job['id'], e, max_attempts)
+    return done
+
+def print_stats():
+    with db.engine.connect() as connection:
+        stats = queue_stats(connection)
+    print(f"Image queue: {stats['queued']} queued, {stats['running']} running, "
+          f"{stats['done']} done, {stats['failed']} failed")
+    if stats['oldest_queued_seconds'] is not None:
+        print(f"  oldest queued job waiting {stats['oldest_queued_seconds']:.0f}s")
+    if stats['avg_latency_seconds'] is not None:
+        print(f"  enqueue-to-image latency: avg {stats['avg_latency_seconds']:.1f}s, "
+              f"max {stats['max_latency_seconds']:.1f}s (last 100 jobs)")
+
+def run_worker(pipe, batch_size, poll_interval, lease_seconds, max_attempts, once=False):
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    rendered = 0
+    started_at = time.monotonic()
+    formats = derivative_formats()
+    if formats:
+        print(f"Derivatives: {', '.join(formats)}")
+    else:
+        print("Warning: Pillow with WebP support is not installed (pip install -r requirements.txt); "
+              "images get no thumbnails or WebP/AVIF copies and are served full size.")
+    while True:
+        jobs = lease(db.engine, worker, batch_size, lease_seconds, max_attempts)
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        batch_started = time.monotonic()
+        rendered += process_batch(pipe, jobs, max_attempts, formats)
+        print(f"Batch of {len(jobs)} in {time.monotonic() - batch_started:.1f}s "
+              f"({rendered} images in {time.monotonic() - started_at:.0f}s)")
+        print_stats()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render queued post images.")
+    parser.add_argument('--batch-size', type=int, default=4, help="Prompts per pipeline call (default: 4)")
+    parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds between checks of an empty queue")
+    parser.add_argument('--lease-seconds', type=int, default=900,
+                        help="How long a worker may hold a batch before others can retry it")
+    parser.add_argument('--max-attempts', type=int, default=3, help="Attempts before a job is marked failed")
+    parser.add_argument('--stub', action='store_true', help="Use flat placeholder images instead of Stable Diffusion")
+    parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    parser.add_argument('--stats', action='store_true', help="Print queue depth and latency, then exit")
+    args = parser.parse_args()
+    boot = BootTimer()
+    boot.mark('imports')
+
+    app = create_app()
+    boot.mark('app')
+    with app.app_context():
+        with db.engine.begin() as connection:
+            create_queue_schema(connection)
+
+        if args.stats:
+            print_stats()
+            sys.exit(0)
+        boot.mark('database')
+        boot.report()
+
+        pipe = StubPipeline() if args.stub else LazyPipeline(load_pipeline)
+        try:
+            run_worker(pipe, args.batch_size, args.poll_interval, args.lease_seconds,
+                       args.max_attempts, args.once)
+        except KeyboardInterrupt:
+            print("Stopping.")
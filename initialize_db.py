@@ -1,18 +1,25 @@
 import os
-import sqlite3
-from flask_bcrypt import Bcrypt
+import bcrypt
+from datetime import datetime
+from sqlite_profile import DB_PATH, connect
+from search import SEARCH_SCHEMA
+from image_queue import QUEUE_SCHEMA
+from frontpage import FRONTPAGE_SCHEMA
+from ranking import hot_rank
 
-# Database for the main application
-DB_NAME = "instance/llmit.db"
-
-# Initialize Bcrypt for password hashing
-bcrypt = Bcrypt()
+# Database for the main application (path and pragmas come from sqlite_profile.py)
+DB_NAME = DB_PATH
 
 def initialize_db():
-    conn = sqlite3.connect(DB_NAME)
+    conn = connect(DB_NAME)
     cursor = conn.cursor()
     
     # Drop tables if they exist (for reinitialization)
+    cursor.execute('DROP TABLE IF EXISTS posts_fts')
+    cursor.execute('DROP TABLE IF EXISTS comments_fts')
+    cursor.execute('DROP TABLE IF EXISTS image_jobs')
+    cursor.execute('DROP TABLE IF EXISTS frontpage')
+    cursor.execute('DROP TABLE IF EXISTS votes')
     cursor.execute('DROP TABLE IF EXISTS comments')
     cursor.execute('DROP TABLE IF EXISTS posts')
     cursor.execute('DROP TABLE IF EXISTS subllmits')
@@ -46,10 +53,15 @@ def initialize_db():
             title TEXT NOT NULL,
             content TEXT,
             image_url TEXT,
+            image_variants TEXT,  -- thumbnails and WebP/AVIF copies, see image_store.py
             upvotes INTEGER DEFAULT 0,
             downvotes INTEGER DEFAULT 0,
+            score INTEGER NOT NULL DEFAULT 0,  -- upvotes - downvotes, kept in step by the app
+            hot FLOAT NOT NULL DEFAULT 0,  -- time-decayed ranking, see ranking.py
             is_ai_generated BOOLEAN DEFAULT FALSE,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            timestamp DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now')),  -- same format SQLAlchemy writes
+            comment_count INTEGER NOT NULL DEFAULT 0,  -- kept in step with comments, see post_stats.py
+            last_activity_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now')),  -- newest of post and its comments
             user_id INTEGER,
             FOREIGN KEY (group_name) REFERENCES subllmits (name),
             FOREIGN KEY (user_id) REFERENCES users (id)
@@ -74,6 +86,44 @@ def initialize_db():
         )
     ''')
     
+    # Create votes ledger: one row per user and target, so votes can change but not repeat
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            user_id INTEGER NOT NULL,
+            target_type TEXT NOT NULL,  -- 'post' or 'comment'
+            target_id INTEGER NOT NULL,
+            value INTEGER NOT NULL,  -- 1 upvote, -1 downvote, 0 cleared
+            updated_at DATETIME,
+            PRIMARY KEY (user_id, target_type, target_id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Serve top/hot/new/active listings and their keyset pages from indexes
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_posts_group_score ON posts (group_name, score, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_posts_group_hot ON posts (group_name, hot, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_posts_group_timestamp ON posts (group_name, timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_posts_group_active ON posts (group_name, last_activity_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_posts_timestamp ON posts (timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_posts_active ON posts (last_activity_at, id)')
+
+    # Index comment lookups by post and by parent for thread loading
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_comments_post_id ON comments (post_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_comments_parent_comment_id ON comments (parent_comment_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_comments_post_parent ON comments (post_id, parent_comment_id, id)')
+
+    # Create the full-text search tables and the triggers that keep them in sync
+    for statement in SEARCH_SCHEMA:
+        cursor.execute(statement)
+
+    # Create the frontpage's top/hot table and the triggers that keep it in sync
+    for statement in FRONTPAGE_SCHEMA:
+        cursor.execute(statement)
+
+    # Create the image job queue worked by image_worker.py
+    for statement in QUEUE_SCHEMA:
+        cursor.execute(statement)
+
     # Insert some default subllmits for testing
     cursor.execute('''
         INSERT INTO subllmits (name) VALUES
@@ -81,7 +131,7 @@ def initialize_db():
     ''')
 
     # Insert a sample user for testing (username: admin, password: admin)
-    hashed_password = bcrypt.generate_password_hash('admin').decode('utf-8')
+    hashed_password = bcrypt.hashpw(b'admin', bcrypt.gensalt()).decode('utf-8')
     cursor.execute('''
         INSERT INTO users (username, password, background, goal, user_type)
         VALUES ('admin', ?, 'Administrator account', 'Manage the platform', 'human')
@@ -90,10 +140,12 @@ def initialize_db():
     # Insert a sample post if the posts table is empty
     cursor.execute('SELECT COUNT(*) FROM posts')
     if cursor.fetchone()[0] == 0:
+        # hot as the app would rank it, or it sinks below every real post
+        now = datetime.utcnow()
         cursor.execute('''
-            INSERT INTO posts (group_name, title, content, is_ai_generated, user_id)
-            VALUES ('general', 'Welcome to LLMit', 'This is a sample post to get you started!', 0, 1)
-        ''')
+            INSERT INTO posts (group_name, title, content, is_ai_generated, user_id, timestamp, hot)
+            VALUES ('general', 'Welcome to LLMit', 'This is a sample post to get you started!', 0, 1, ?, ?)
+        ''', (now.strftime('%Y-%m-%d %H:%M:%S.%f'), hot_rank(0, now)))
 
     conn.commit()
     conn.close()
@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlite_profile import BASE_DIR
+
+# Per-request timing, SQL accounting, a slow log and Prometheus metrics.
+#
+# SQLAlchemy's before/after_cursor_execute events time every statement and
+# charge it to the route being served (or to "background" for the vote
+# flusher, live feed poller and other threads). Flask's before/after_request
+# hooks time the request itself, record it in a per-route latency histogram
+# and add a Server-Timing header with the request's query count and DB time.
+#
+# A request slower than SLOW_REQUEST_MS is logged to the "llmit.slow" logger
+# with its query count and its most repeated statement, which is how N+1 lazy
+# loads show up. A statement slower than SLOW_QUERY_MS is logged with its
+# EXPLAIN QUERY PLAN; a slow write whose plan is a plain primary key lookup
+# was waiting on the database lock.
+#
+# With METRICS_ENABLED off, init_app registers no hooks and no listeners, so
+# requests and statements run exactly as they would without this module.
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Written by populate_db.py, read back by /metrics
+POPULATOR_STATS_PATH = os.environ.get('LLMIT_POPULATOR_STATS', os.path.join(BASE_DIR, 'instance', 'populator_stats.json'))
+
+# Statements not worth explaining
+UNEXPLAINED = ('PRAGMA', 'EXPLAIN', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'ANALYZE', 'CREATE', 'DROP', 'ALTER')
+
+slow_log = logging.getLogger('llmit.slow')
+
+
+def one_line(statement, limit=300):
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+def label_text(labels):
+    if not labels:
+        return ''
+    escaped = (name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+               for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+def number(value):
+    # Counts stay exact; durations keep microsecond precision
+    return str(value) if isinstance(value, int) else repr(round(float(value), 6))
+
+def metric_lines(name, kind, help_text, samples):
+    # Prometheus text format for one metric; samples is a number or {labels: number}
+    # with labels a tuple of (name, value) pairs. None values are left out.
+    if not isinstance(samples, dict):
+        samples = {(): samples}
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples.items():
+        if value is not None:
+            lines.append(f'{name}{label_text(labels)} {number(value)}')
+    return lines
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        lines = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'{name}_bucket{label_text(labels + (("le", le),))} {cumulative}')
+        lines.append(f'{name}_sum{label_text(labels)} {number(self.sum)}')
+        lines.append(f'{name}_count{label_text(labels)} {self.count}')
+        return lines
+
+
+class RequestStats:
+    __slots__ = ('route', 'started', 'queries', 'db_seconds', 'statements')
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+class Instrumentation:
+    def __init__(self, app=None, db=None):
+        self.enabled = False
+        self.slow_request = 0.5
+        self.slow_query = 0.1
+        self._lock = threading.Lock()
+        self._requests = Counter()  # (route, method, status) -> count
+        self._latency = defaultdict(Histogram)  # (route, method) -> Histogram
+        self._queries = Counter()  # route -> statements
+        self._query_seconds = defaultdict(float)  # route -> seconds in SQLite
+        self._lock_errors = 0
+        self._slow_requests = 0
+        self._slow_queries = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+        self.slow_request = app.config.get('SLOW_REQUEST_MS', 500) / 1000
+        self.slow_query = app.config.get('SLOW_QUERY_MS', 100) / 1000
+        path = app.config.get('SLOW_LOG_PATH')
+        if path and not any(getattr(handler, 'baseFilename', None) == os.path.abspath(path)
+                            for handler in slow_log.handlers):
+            handler = logging.FileHandler(path)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_log.addHandler(handler)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(db.engine, 'handle_error', self._handle_error)
+
+    def _start_request(self):
+        g._request_stats = RequestStats(request.url_rule.rule if request.url_rule else 'unmatched')
+
+    def _finish_request(self, response):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        slow = elapsed >= self.slow_request
+        with self._lock:
+            self._requests[(stats.route, request.method, response.status_code)] += 1
+            self._latency[(stats.route, request.method)].observe(elapsed)
+            if slow:
+                self._slow_requests += 1
+        response.headers['Server-Timing'] = (f'app;dur={elapsed * 1000:.1f}, '
+                                             f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"')
+        if slow:
+            message = (f"Slow request {request.method} {request.full_path.rstrip('?')} {elapsed * 1000:.1f} ms, "
+                       f"status {response.status_code}, {stats.queries} queries in {stats.db_seconds * 1000:.1f} ms")
+            if stats.statements:
+                statement, count = stats.statements.most_common(1)[0]
+                if count > 1:
+                    message += f"; {count} x {one_line(statement, 150)}"
+            slow_log.warning(message)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = g.get('_request_stats') if has_request_context() else None
+        route = stats.route if stats is not None else 'background'
+        slow = elapsed >= self.slow_query
+        with self._lock:
+            self._queries[route] += 1
+            self._query_seconds[route] += elapsed
+            if slow:
+                self._slow_queries += 1
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            stats.statements[statement] += 1
+        if slow:
+            self._log_slow_query(cursor, statement, parameters, executemany, elapsed, route)
+
+    def _handle_error(self, context):
+        # The query-started entry of a failed statement is never popped by after_cursor_execute
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+        if isinstance(context.original_exception, sqlite3.OperationalError) and \
+                'locked' in str(context.original_exception):
+            with self._lock:
+                self._lock_errors += 1
+
+    def _log_slow_query(self, cursor, statement, parameters, executemany, elapsed, route):
+        message = f"Slow query {elapsed * 1000:.1f} ms ({route}): {one_line(statement)}"
+        if not executemany and not statement.lstrip().upper().startswith(UNEXPLAINED):
+            try:
+                # A separate cursor on the same connection, so the caller's results are untouched
+                plan = cursor.connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+                message += '\n  plan: ' + '\n        '.join(row[3] for row in plan)
+            except sqlite3.Error as e:
+                message += f"\n  plan unavailable: {e}"
+        slow_log.warning(message)
+
+    def render(self, extra=()):
+        # Prometheus text exposition of everything recorded, plus extra
+        # (name, kind, help, samples) metrics supplied by the caller
+        with self._lock:
+            requests = dict(self._requests)
+            latency = {key: histogram for key, histogram in self._latency.items()}
+            queries = dict(self._queries)
+            query_seconds = dict(self._query_seconds)
+            lock_errors, slow_requests, slow_queries = self._lock_errors, self._slow_requests, self._slow_queries
+            lines = metric_lines('llmit_http_requests_total', 'counter', 'Requests served.', {
+                (('route', route), ('method', method), ('status', status)): count
+                for (route, method, status), count in requests.items()
+            })
+            lines += ['# HELP llmit_http_request_duration_seconds Time to build a response.',
+                      '# TYPE llmit_http_request_duration_seconds histogram']
+            for (route, method), histogram in latency.items():
+                lines += histogram.lines('llmit_http_request_duration_seconds', (('route', route), ('method', method)))
+        lines += metric_lines('llmit_db_queries_total', 'counter', 'SQL statements executed, by route.',
+                              {(('route', route),): count for route, count in queries.items()})
+        lines += metric_lines('llmit_db_query_seconds_total', 'counter', 'Time spent in SQLite, by route.',
+                              {(('route', route),): seconds for route, seconds in query_seconds.items()})
+        lines += metric_lines('llmit_db_lock_errors_total', 'counter',
+                              'Statements that failed with "database is locked".', lock_errors)
+        lines += metric_lines('llmit_slow_requests_total', 'counter', 'Requests over SLOW_REQUEST_MS.', slow_requests)
+        lines += metric_lines('llmit_slow_queries_total', 'counter', 'Statements over SLOW_QUERY_MS.', slow_queries)
+        for name, kind, help_text, samples in extra:
+            lines += metric_lines(name, kind, help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+class StatsFile:
+    # Lets a separate process (populate_db.py) publish counters for /metrics:
+    # a small JSON file, replaced atomically at most every `interval` seconds
+    def __init__(self, path=POPULATOR_STATS_PATH, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self._written_at = 0.0
+
+    def maybe_write(self, stats):
+        if time.monotonic() - self._written_at >= self.interval:
+            self.write(stats)
+
+    def write(self, stats):
+        self._written_at = time.monotonic()
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(dict(stats, pid=os.getpid(), updated_at=time.time()), f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Could not write stats to {self.path}: {e}")
+
+def read_stats_file(path=POPULATOR_STATS_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def stats_file_metrics(prefix, stats):
+    # Numeric entries become metrics: *_total as counters, the rest as gauges
+    if not stats:
+        return []
+    metrics = [(f'{prefix}_last_update_age_seconds', 'gauge', 'Seconds since the stats file was written.',
+                time.time() - stats.get('updated_at', 0))]
+    for key, value in sorted(stats.items()):
+        if key in ('pid', 'updated_at') or isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        kind = 'counter' if key.endswith('_total') else 'gauge'
+        metrics.append((f'{prefix}_{key}', kind, f'{key.replace("_", " ")} (from the stats file).', value))
+    return metrics
@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+from collections import deque
+from sqlalchemy import text
+from image_store import srcset
+
+# Live updates for /api/stream (Server-Sent Events).
+#
+# EventBus keeps the last LIVE_BACKLOG events in memory, numbered in order.
+# Every open stream waits on the bus for events newer than the last one it
+# sent, so publishing costs the same however many clients are listening, and
+# a client that reconnects with Last-Event-ID gets what it missed.
+#
+# New posts and comments are found by a poller thread that remembers the
+# highest post and comment id it has seen and asks for anything above them
+# every LIVE_POLL_INTERVAL seconds. That catches rows written by
+# populate_db.py in its own process; the app's own write paths call
+# notify_written() to have the poller look straight away. Vote deltas are
+# published by the vote buffer when it flushes.
+#
+# An idle stream is a generator blocked on a condition variable. Under the
+# threaded dev server that ties up a thread per client; run serve.py (gevent)
+# to hold thousands of them on greenlets instead.
+
+NEW_POSTS = text('''
+    SELECT p.id, p.group_name, p.title, p.content, p.image_url, p.image_variants, p.score,
+           p.comment_count, p.timestamp, u.username
+    FROM posts p LEFT JOIN users u ON u.id = p.user_id
+    WHERE p.id > :after
+    ORDER BY p.id
+    LIMIT :limit
+''')
+
+NEW_COMMENTS = text('''
+    SELECT c.id, c.post_id, c.parent_comment_id, c.content, c.timestamp,
+           p.group_name, u.username
+    FROM comments c
+    JOIN posts p ON p.id = c.post_id
+    LEFT JOIN users u ON u.id = c.user_id
+    WHERE c.id > :after
+    ORDER BY c.id
+    LIMIT :limit
+''')
+
+POST_GROUPS = text('SELECT id, group_name FROM posts WHERE id IN (SELECT value FROM json_each(:ids))')
+
+COMMENT_POSTS = text('''
+    SELECT c.id, c.post_id, p.group_name
+    FROM comments c JOIN posts p ON p.id = c.post_id
+    WHERE c.id IN (SELECT value FROM json_each(:ids))
+''')
+
+# Rows picked up per table per poll
+POLL_LIMIT = 500
+
+
+def timestamp_text(value):
+    # SQLite hands back timestamps as text; keep the API's isoformat shape
+    return str(value).replace(' ', 'T') if value is not None else None
+
+
+class EventBus:
+    def __init__(self, backlog=1000):
+        # Identifies this process's numbering, so ids from before a restart are not trusted
+        self.epoch = os.urandom(4).hex()
+        self.published = 0
+        self._events = deque(maxlen=backlog)
+        self._seq = 0
+        self._changed = threading.Condition()
+
+    def publish(self, kind, data):
+        with self._changed:
+            self._seq += 1
+            self.published += 1
+            self._events.append((self._seq, kind, data))
+            self._changed.notify_all()
+
+    def last_seq(self):
+        return self._seq
+
+    def parse_event_id(self, event_id):
+        # "<epoch>-<seq>" from Last-Event-ID; None when it belongs to another process
+        epoch, _, seq = (event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return min(int(seq), self._seq)
+
+    def wait(self, after, timeout):
+        # Events numbered above `after`, waiting up to timeout seconds for one
+        with self._changed:
+            if self._seq <= after:
+                self._changed.wait(timeout)
+            newer = []
+            for event in reversed(self._events):
+                if event[0] <= after:
+                    break
+                newer.append(event)
+        newer.reverse()
+        return newer
+
+
+def sse(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class LiveFeed:
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.bus = EventBus()
+        self.poll_interval = 2.0
+        self.keepalive = 15
+        self.streams = 0
+        self._last_post_id = None
+        self._last_comment_id = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.bus = EventBus(app.config.get('LIVE_BACKLOG', 1000))
+        self.poll_interval = app.config.get('LIVE_POLL_INTERVAL', self.poll_interval)
+        self.keepalive = app.config.get('LIVE_KEEPALIVE', self.keepalive)
+
+    def notify_written(self):
+        # Called after the app commits a post or comment: poll now rather than on the next tick
+        self._wake.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                with self.app.app_context():
+                    with self.db.engine.connect() as connection:
+                        # Only rows written from now on are news
+                        self._last_post_id = connection.execute(text('SELECT COALESCE(MAX(id), 0) FROM posts')).scalar()
+                        self._last_comment_id = connection.execute(text('SELECT COALESCE(MAX(id), 0) FROM comments')).scalar()
+                self._thread = threading.Thread(target=self._run, name='live-feed-poller', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling for live updates: {e}")
+
+    def poll(self):
+        with self.app.app_context():
+            with self.db.engine.connect() as connection:
+                posts = connection.execute(NEW_POSTS, {'after': self._last_post_id, 'limit': POLL_LIMIT}).mappings().all()
+                comments = connection.execute(NEW_COMMENTS, {'after': self._last_comment_id, 'limit': POLL_LIMIT}).mappings().all()
+        for row in posts:
+            self.bus.publish('post', {
+                "id": row['id'],
+                "group": row['group_name'],
+                "title": row['title'],
+                "content": row['content'],
+                "image_url": row['image_url'],
+                "image_srcset": srcset(row['image_url'], row['image_variants']),
+                "score": row['score'],
+                "comment_count": row['comment_count'],
+                "timestamp": timestamp_text(row['timestamp']),
+                "author": row['username'] or "Anonymous"
+            })
+            self._last_post_id = row['id']
+        for row in comments:
+            self.bus.publish('comment', {
+                "id": row['id'],
+                "post_id": row['post_id'],
+                "parent_comment_id": row['parent_comment_id'],
+                "group": row['group_name'],
+                "content": row['content'],
+                "timestamp": timestamp_text(row['timestamp']),
+                "author": row['username'] or "Anonymous"
+            })
+            self._last_comment_id = row['id']
+        # A full page means more are waiting
+        if len(posts) == POLL_LIMIT or len(comments) == POLL_LIMIT:
+            self._wake.set()
+
+    def publish_votes(self, deltas):
+        # VoteBuffer.on_flush callback: {(target_type, target_id): [up, down]}
+        if self._thread is None:
+            return
+        post_ids = [target_id for (target_type, target_id), (up, down) in deltas.items()
+                    if target_type == 'post' and (up or down)]
+        comment_ids = [target_id for (target_type, target_id), (up, down) in deltas.items()
+                       if target_type == 'comment' and (up or down)]
+        with self.app.app_context():
+            with self.db.engine.connect() as connection:
+                post_groups = dict(connection.execute(POST_GROUPS, {'ids': json.dumps(post_ids)}).all()) if post_ids else {}
+                comment_posts = {row[0]: row[1:] for row in connection.execute(
+                    COMMENT_POSTS, {'ids': json.dumps(comment_ids)}).all()} if comment_ids else {}
+        for post_id, group_name in post_groups.items():
+            up, down = deltas[('post', post_id)]
+            self.bus.publish('vote', {"target": "post", "id": post_id, "post_id": post_id,
+                                      "group": group_name, "up": up, "down": down})
+        for comment_id, (post_id, group_name) in comment_posts.items():
+            up, down = deltas[('comment', comment_id)]
+            self.bus.publish('vote', {"target": "comment", "id": comment_id, "post_id": post_id,
+                                      "group": group_name, "up": up, "down": down})
+
+    def stream(self, group=None, post_ids=(), last_event_id=None):
+        # Generator of SSE messages for one client. New posts are sent if they
+        # are in `group` (any group on the frontpage); comments and votes if they
+        # are in `group` or about one of `post_ids`, or all of them with neither.
+        self._ensure_thread()
+        group = None if group in (None, '', 'frontpage') else group
+        post_ids = set(post_ids)
+        after = self.bus.parse_event_id(last_event_id)
+        if after is None:
+            after = self.bus.last_seq()
+
+        def wanted(kind, data):
+            if kind == 'post':
+                # A new post is never on the page yet, so post_ids can't match it
+                return group is None or data.get('group') == group
+            if group is None and not post_ids:
+                return True
+            return data.get('group') == group or data.get('post_id', data.get('id')) in post_ids
+
+        with self._lock:
+            self.streams += 1
+        try:
+            yield "retry: 3000\n: connected\n\n"
+            while True:
+                events = self.bus.wait(after, self.keepalive)
+                if not events:
+                    # Keeps proxies from closing the idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                for seq, kind, data in events:
+                    if wanted(kind, data):
+                        yield sse(f"{self.bus.epoch}-{seq}", kind, data)
+                    after = seq
+        finally:
+            with self._lock:
+                self.streams -= 1
+
+    def stats(self):
+        return {"streams": self.streams, "published": self.bus.published}
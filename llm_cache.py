@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from types import SimpleNamespace
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from sqlite_profile import BASE_DIR, BUSY_TIMEOUT_MS, apply_pragmas
+
+# Content-addressed cache of chat completions for populate_db.py and create_bots.py.
+#
+# A request is identified by the sha256 of everything that shapes the answer
+# (model, messages, temperature, max_tokens, ...) plus a sample number: the
+# first time a run sends a given request it is sample 0, the second time
+# sample 1, and so on. Sampling at temperature > 0 gives a different answer
+# each time, and the bots send identical prompts on purpose (every profile
+# request is the same text), so a rerun gets back the same sequence of
+# answers rather than one answer repeated. At temperature 0 every repeat is
+# sample 0.
+#
+# Modes:
+#   live    no cache, every request goes to the server (the default)
+#   record  answers come from the cache when present; misses go to the server
+#           and are stored
+#   replay  answers only come from the cache; a miss raises CacheMiss, so a
+#           recorded run can be repeated with no inference server at all
+#
+# Streamed requests (stream=True, see structured_output.py) are stored the
+# same way: the text the caller read before closing the stream is saved as a
+# completion, and a hit is streamed back from it. A stream closed early is
+# recorded as far as it was read, which is all the caller ever looks at.
+#
+# Responses live in one SQLite file. When it grows past max_bytes the least
+# recently used ones are deleted until it is back under EVICT_TO of that.
+
+MODES = ('live', 'record', 'replay')
+CACHE_PATH = os.environ.get('LLMIT_LLM_CACHE_PATH', os.path.join(BASE_DIR, 'instance', 'llm_cache.db'))
+MAX_MB = 256
+EVICT_TO = 0.9
+
+# Transport options that don't change the answer
+UNKEYED = ('timeout', 'extra_headers', 'extra_query', 'extra_body')
+
+# Replay stops being worth it after this many misses in a row (the recording ran out)
+REPLAY_GIVE_UP = 20
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,  -- sha256 of the request and sample number
+        model TEXT,
+        response TEXT NOT NULL,  -- the completion as returned by the server, JSON
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used_at REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_responses_last_used_at ON responses (last_used_at)',
+]
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def request_key(request, sample):
+    keyed = {name: value for name, value in request.items() if name not in UNKEYED}
+    canonical = json.dumps(keyed, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{canonical}#{sample}'.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, mode='live', path=CACHE_PATH, max_mb=MAX_MB):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        self._consecutive_misses = 0
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        self.size = 0
+        if mode != 'live':
+            self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Shared by the generation threads, one statement at a time under _lock
+        self._connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                                           isolation_level=None, check_same_thread=False)
+        apply_pragmas(self._connection)
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+        self.size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _next_key(self, request):
+        deterministic = request.get('temperature') == 0
+        base = request_key(request, 0)
+        with self._lock:
+            sample = 0 if deterministic else self._samples.get(base, 0)
+            self._samples[base] = sample + 1
+        return base if sample == 0 else request_key(request, sample)
+
+    def lookup(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self._consecutive_misses += 1
+                return None
+            self._connection.execute('UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?',
+                                     (time.time(), key))
+            self.hits += 1
+            self._consecutive_misses = 0
+        return row[0]
+
+    def store(self, key, model, response):
+        size = len(response.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            replaced = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (key, model, response, size, now, now))
+            self.size += size - (replaced[0] if replaced else 0)
+            self.stored += 1
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Least recently used first, down to EVICT_TO of the limit; caller holds _lock
+        target = self.max_bytes * EVICT_TO
+        victims = []
+        for key, size in self._connection.execute('SELECT key, size FROM responses ORDER BY last_used_at'):
+            if self.size <= target:
+                break
+            victims.append((key,))
+            self.size -= size
+        self._connection.execute('BEGIN')
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', victims)
+        self._connection.execute('COMMIT')
+        self.evicted += len(victims)
+
+    def complete(self, client, request):
+        # client.chat.completions.create(**request), through the cache
+        if self.mode == 'live':
+            return client.chat.completions.create(**request)
+
+        key = self._next_key(request)
+        cached = self.lookup(key)
+        if cached is not None:
+            completion = ChatCompletion.model_validate_json(cached)
+            return CachedStream(completion) if request.get('stream') else completion
+        if self.mode == 'replay':
+            raise CacheMiss(f"No recorded response for this {request.get('model')} request (replay mode)")
+
+        if request.get('stream'):
+            return RecordingStream(client.chat.completions.create(**request),
+                                   lambda completion: self.store(key, request.get('model'), completion.model_dump_json()))
+        completion = client.chat.completions.create(**request)
+        self.store(key, request.get('model'), completion.model_dump_json())
+        return completion
+
+    def exhausted(self):
+        # In replay mode: the last REPLAY_GIVE_UP requests all missed
+        return self.mode == 'replay' and self._consecutive_misses >= REPLAY_GIVE_UP
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "evicted": self.evicted,
+            "bytes": self.size,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def summary(self):
+        if self.mode == 'live':
+            return "LLM cache off (live mode)."
+        stats = self.stats()
+        return (f"LLM cache ({self.mode}): {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate), {stats['stored']} stored, {stats['evicted']} evicted, "
+                f"{stats['bytes'] / 1024 / 1024:.1f} MB on disk.")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class RecordingStream:
+    # Passes a live stream through and stores what was read of it on close,
+    # unless the stream failed part way
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._pieces = []
+        self._chunks = 0
+        self._first = None
+        self._finish_reason = None
+        self._failed = False
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                if self._first is None:
+                    self._first = chunk
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta.content:
+                        self._pieces.append(choice.delta.content)
+                        self._chunks += 1
+                    self._finish_reason = choice.finish_reason or self._finish_reason
+                yield chunk
+        except Exception:
+            self._failed = True
+            raise
+        self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stream.close()
+        if self._failed or self._first is None:
+            return
+        self._on_close(ChatCompletion.model_validate({
+            "id": self._first.id,
+            "object": "chat.completion",
+            "created": self._first.created,
+            "model": self._first.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ''.join(self._pieces)},
+                         "finish_reason": self._finish_reason or 'stop'}],
+            # The chunks read, so a replay counts the same tokens as the recording
+            "usage": {"prompt_tokens": 0, "completion_tokens": self._chunks, "total_tokens": self._chunks},
+        }))
+
+
+class CachedStream:
+    # A stored completion played back as a stream, in as many chunks as it had
+    # tokens so the caller counts what the recording counted, then the usage
+    def __init__(self, completion):
+        self._completion = completion
+
+    def __iter__(self):
+        completion = self._completion
+        content = completion.choices[0].message.content or ''
+        pieces = completion.usage.completion_tokens if completion.usage else len(content.split())
+        pieces = max(1, min(pieces, len(content)))
+        for index in range(pieces):
+            piece = content[index * len(content) // pieces:(index + 1) * len(content) // pieces]
+            yield self._chunk({"index": 0, "delta": {"content": piece}, "finish_reason": None})
+        yield self._chunk({"index": 0, "delta": {}, "finish_reason": completion.choices[0].finish_reason},
+                          completion.usage.model_dump() if completion.usage else None)
+
+    def _chunk(self, choice, usage=None):
+        return ChatCompletionChunk.model_validate({
+            "id": self._completion.id,
+            "object": "chat.completion.chunk",
+            "created": self._completion.created,
+            "model": self._completion.model,
+            "choices": [choice],
+            "usage": usage,
+        })
+
+    def close(self):
+        pass
+
+
+def cached_client(client, cache):
+    # Stands in for an OpenAI client: .chat.completions.create(...) goes through the cache
+    create = lambda **request: cache.complete(client, request)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+def add_cache_arguments(parser):
+    parser.add_argument('--llm-cache', choices=MODES, default=os.environ.get('LLMIT_LLM_CACHE', 'live'),
+                        help="live: no cache; record: reuse and store answers; replay: answers from the cache only")
+    parser.add_argument('--llm-cache-path', default=CACHE_PATH, help="SQLite file holding cached answers")
+    parser.add_argument('--llm-cache-max-mb', type=float, default=MAX_MB,
+                        help=f"Evict least recently used answers past this size (default: {MAX_MB})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the LLM response cache.")
+    parser.add_argument('--path', default=CACHE_PATH)
+    parser.add_argument('--clear', action='store_true', help="Delete every cached response.")
+    args = parser.parse_args()
+
+    cache = LLMCache('record', args.path)
+    if args.clear:
+        cache._connection.execute('DELETE FROM responses')
+        cache._connection.execute('VACUUM')
+        print(f"Cleared {args.path}")
+    else:
+        rows = cache._connection.execute(
+            'SELECT model, COUNT(*), SUM(size), SUM(hits) FROM responses GROUP BY model ORDER BY 2 DESC').fetchall()
+        print(f"{args.path}: {sum(row[1] for row in rows)} responses, {cache.size / 1024 / 1024:.1f} MB")
+        for model, count, size, hits in rows:
+            print(f"  {model}: {count} responses, {size / 1024:.0f} KB, served {hits} times")
+    cache.close()
@@ -0,0 +1,198 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A stand-in for LM Studio's OpenAI-compatible /v1/chat/completions endpoint,
+# so populate_db.py and create_bots.py can be exercised without a model:
+#
+#   python llm_stub_server.py --port 1235 --latency 0.5
+#   python populate_db.py --base-url http://localhost:1235/v1 --max-posts 20
+#
+# Replies are canned but shaped like the real prompts expect (post JSON, user
+# profile JSON, a JSON array of comments, a subllmit name or a plain comment),
+# and every request sleeps for --latency seconds to mimic generation time.
+#
+# With "stream": true the reply is sent as server-sent chunks, one word at a
+# time, --token-latency seconds apart, and stops when the client hangs up.
+# --ramble makes that fraction of JSON replies carry on talking after the
+# object, the way small models do, to see what stopping early saves.
+
+WORDS = ('quantum', 'cats', 'coffee', 'robots', 'history', 'space', 'pizza', 'music',
+         'dreams', 'bugs', 'gardens', 'trains', 'mystery', 'science', 'memes', 'rain')
+
+
+RAMBLE = "Hope this helps! Let me know if you want another one. Here is a second version with more detail: "
+
+
+class StubState:
+    def __init__(self, latency, token_latency=0.0, ramble=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.ramble = ramble
+        self.requests = 0
+        self.tokens_sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+def reply_for(prompt, rng):
+    if 'JSON array' in prompt:
+        # Batched comments: one per numbered user, some replying to earlier ones
+        users = len(re.findall(r'^\d+\. ', prompt, re.MULTILINE))
+        comments = []
+        for n in range(1, users + 1):
+            comment = {"user": n, "comment": f"Great point about {words(rng, 6)}!"}
+            if '"reply_to"' in prompt:
+                comment["reply_to"] = rng.randint(1, n - 1) if n > 1 and rng.random() < 0.5 else None
+            comments.append(comment)
+        return json.dumps(comments)
+    if 'user profile' in prompt:
+        return json.dumps({
+            "username": f"bot{rng.randint(0, 10 ** 6)}",
+            "background": f"Loves {words(rng, 3)}.",
+            "goal": f"To talk about {words(rng, 2)}."
+        })
+    if '"title"' in prompt:
+        return json.dumps({
+            "title": f"Thoughts on {words(rng, 3)}",
+            "content": f"Today I learned about {words(rng, 12)}.",
+            "image_prompt": f"A painting of {words(rng, 4)}"
+        })
+    if 'Subllmit name' in prompt:
+        return f"{words(rng, 2).title().replace(' ', '')}{rng.randint(0, 999)}"
+    return f"Great point about {words(rng, 6)}!"
+
+def rambling(content, rng):
+    # The object, then a stream of chatter (and a second object) it should be cut off before
+    return f"{content}\n\n{RAMBLE}{content} {words(rng, 60)}"
+
+def completion_body(content, prompt):
+    return {
+        "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(content.split()),
+            "total_tokens": len(prompt.split()) + len(content.split())
+        }
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        prompt = '\n'.join(str(message.get('content', '')) for message in request.get('messages', []))
+
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            request_number = state.requests
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            time.sleep(state.latency)
+            # Like a real model, repeated prompts get different replies unless the
+            # request pins a seed, in which case identical requests get identical replies
+            seed = request.get('seed', request_number)
+            rng = random.Random(re.sub(r'\s+', ' ', prompt) + f"|{seed}")
+            content = reply_for(prompt, rng)
+            if content.startswith(('{', '[')) and rng.random() < state.ramble:
+                content = rambling(content, rng)
+            if request.get('stream'):
+                self.stream_reply(content, prompt, request)
+                return
+            with state.lock:
+                state.tokens_sent += len(content.split())
+            body = json.dumps(completion_body(content, prompt)).encode('utf-8')
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_reply(self, content, prompt, request):
+        body = completion_body(content, prompt)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        def send(choice, usage=None):
+            chunk = {"id": body["id"], "object": "chat.completion.chunk", "created": body["created"],
+                     "model": body["model"], "choices": [choice] if choice else [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            for piece in re.findall(r'\s*\S+', content):
+                time.sleep(self.state.token_latency)
+                send({"index": 0, "delta": {"content": piece}, "finish_reason": None})
+                with self.state.lock:
+                    self.state.tokens_sent += 1
+            send({"index": 0, "delta": {}, "finish_reason": "stop"})
+            if (request.get('stream_options') or {}).get('include_usage'):
+                send(None, body["usage"])
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading: no more tokens to generate
+        self.close_connection = True
+
+    def do_GET(self):
+        # GET /stats reports how many requests were served and the peak concurrency
+        state = self.state
+        body = json.dumps({"requests": state.requests, "max_in_flight": state.max_in_flight,
+                           "tokens_sent": state.tokens_sent}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host='127.0.0.1', port=1235, latency=0.0, token_latency=0.0, ramble=0.0):
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(latency, token_latency, ramble)})
+    return ThreadingHTTPServer((host, port), handler)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server for testing the populators.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1235)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds each completion takes")
+    parser.add_argument('--token-latency', type=float, default=0.0,
+                        help="Extra seconds per word of a streamed reply")
+    parser.add_argument('--ramble', type=float, default=0.0,
+                        help="Fraction of JSON replies that keep talking after the object (default: 0)")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.token_latency, args.ramble)
+    print(f"Stub LLM server on http://{args.host}:{args.port}/v1 (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,52 +1,58 @@
+from boot_timing import BootTimer  # First, so the import phase is timed too
 import os
 import random
 import time
-import json
-import re
-import sqlite3
+import sys
+import signal
+import argparse
 from datetime import datetime, timedelta
-from app import db, Post, Comment, Subllmit, User, app  # Ensure 'app' is correctly imported
+from app import create_app, db, Post, Comment, Subllmit
+from sqlite_profile import DB_PATH
+from generation_engine import GenerationEngine, Job
+from batch_writer import BatchWriter
+from image_queue import create_queue_schema
+from instrumentation import StatsFile
+from llm_cache import LLMCache, cached_client, add_cache_arguments
+from structured_output import StructuredStats, generate_json, RETRIES
+from world_state import WorldState, REFRESH_INTERVAL
 from openai import OpenAI  # Import OpenAI client
-import torch
-from diffusers import StableDiffusionPipeline
 
-# Path to your database
-DB_NAME = "instance/llmit.db"
+# Path to your database (see sqlite_profile.py)
+DB_NAME = DB_PATH
 
-# Initialize OpenAI client
-client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+# Initialize OpenAI client (LM Studio by default; --base-url points it elsewhere)
+LLM_BASE_URL = os.environ.get('LLMIT_LLM_BASE_URL', "http://localhost:1234/v1")
+MODEL = "unsloth/Llama-3.2-3B-Instruct-GGUF"
+client = OpenAI(base_url=LLM_BASE_URL, api_key="lm-studio")
 
-# Set environment variables before importing any dependent libraries
-cache_directory = os.path.join(os.getcwd(), "huggingface")  # Use current working directory
-os.environ['HF_HOME'] = cache_directory  # Alternatively, you can use 'TRANSFORMERS_CACHE'
-os.environ['PYTORCH_CUDA_ALLOC_CONF'] = "max_split_size_mb:128"  # Helps with fragmentation
+# Answers can be recorded and replayed (see llm_cache.py); live by default
+llm_cache = LLMCache()
 
-# Create cache directory if it doesn't exist
-os.makedirs(cache_directory, exist_ok=True)
+# Tokens, retries and parse failures of the JSON generations
+structured_stats = StructuredStats()
 
-# Clear any existing GPU cache
-torch.cuda.empty_cache()
+# Extra attempts at a post, or a batch of comments, whose JSON doesn't parse or
+# lacks its title or comment fields (--json-retries)
+json_retries = RETRIES
 
-# Initialize the device to GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
+# Batched writer for generated rows; created in __main__ inside the app context
+writer = None
 
-# Initialize the Stable Diffusion Pipeline
-try:
-    pipe = StableDiffusionPipeline.from_pretrained(
-        "stabilityai/stable-diffusion-2-1",
-        cache_dir=cache_directory,
-        torch_dtype=torch.float16,
-        revision="fp16"
-    )
-    pipe.to(device)
-    print("Model loaded successfully.")
-except Exception as e:
-    print("An unexpected error occurred while loading the model:", e)
-    exit(1)
-
-# List of Subllmits
-groups = [
+# Progress counters for the web app's /metrics, written every few seconds
+stats_file = None
+
+# Bots, subllmits and recent posts, loaded once and refreshed incrementally
+world = None
+
+# Whether posts get image jobs queued for image_worker.py (off with --no-images)
+images_enabled = True
+
+# Batched comment prompts describe each commenter by username and the start of
+# their goal, this many words; the full background and goal go into post prompts
+PERSONA_WORDS = 8
+
+# Subllmits every LLMit starts with; the bots add their own as they go
+DEFAULT_SUBLLMITS = [
     'announcements', 'Art', 'AskLLMit', 'askscience', 'atheism', 'aww', 'blog',
     'books', 'creepy', 'dataisbeautiful', 'DIY', 'Documentaries', 'EarthPorn',
     'explainlikeimfive', 'food', 'funny', 'Futurology', 'gadgets', 'gaming',
@@ -58,39 +64,11 @@ groups = [
     'videos', 'worldnews', 'WritingPrompts'
 ]
 
-def extract_json(response_text):
-    try:
-        json_str = re.search(r'\{.*?\}', response_text, re.DOTALL).group()
-        return json.loads(json_str)
-    except Exception as e:
-        print(f"Error parsing JSON: {e}")
-        print(f"Response text was: {response_text}")
-        return None
-
-def generate_image(image_prompt, post):
-    try:
-        image = pipe(prompt=image_prompt, guidance_scale=7.5, num_inference_steps=20, height=512, width=512).images[0]
-
-        # Save the image with a unique filename
-        image_filename = f"{post.group_name}_{post.id}_{random.randint(0, 100000)}.png"
-        image_path = os.path.join('static', 'uploads', image_filename)  # Use relative path
-        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-        image.save(image_path)
-
-        # Update the post with the relative image URL
-        image_url = f"/static/uploads/{image_filename}"
-        post.image_url = image_url
-        db.session.commit()
-
-        print(f"Generated image for post {post.id}: {post.title}")
-
-    except Exception as e:
-        print(f"Error generating image for post {post.id}: {e}")
-
-def generate_post_for_group(group_name, user_profile, post_count):
+def generate_post_for_group(group_name, user_profile):
+    # Runs on a generation thread: talks to the LLM only, never to the database
     try:
         prompt = (
-            f"As a user named {user_profile['username']} with the following background: '{user_profile['background']}' and goal: '{user_profile['goal']}', "
+            f"As a user named {user_profile.username} with the following background: '{user_profile.background}' and goal: '{user_profile.goal}', "
             f"write a typical post for the '{group_name}' Subllmit that fits the theme of this Subllmit. "
             "Respond ONLY with a JSON object in the following format:\n"
             "{\n"
@@ -100,62 +78,68 @@ def generate_post_for_group(group_name, user_profile, post_count):
             "}\n"
         )
 
-        completion = client.chat.completions.create(
-            model="unsloth/Llama-3.2-3B-Instruct-GGUF",
+        # Streamed and cut off at the closing brace; retried if unusable
+        post_data = generate_json(
+            client, structured_stats, required=('title',), retries=json_retries,
+            model=MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=300,
         )
+        print(f"AI Response: {post_data}")  # For debugging
 
-        response_text = completion.choices[0].message.content.strip()
-        print(f"AI Response: {response_text}")  # For debugging
-
-        # Extract JSON from the response
-        post_data = extract_json(response_text)
         if not post_data:
             print(f"Failed to extract JSON for group '{group_name}'. Skipping this post.")
-            return None, None, None
-
-        title = post_data.get('title', '').strip()
-        content = post_data.get('content', '').strip()
-        image_prompt = post_data.get('image_prompt', '').strip()
-
-        # Create the post
-        post = Post(
-            group_name=group_name,
-            title=title,
-            content=content,
-            image_url=None,  # Will be updated if an image is generated
-            upvotes=random.randint(1, 1000),
-            downvotes=random.randint(0, 500),
-            is_ai_generated=True,
-            timestamp=datetime.utcnow(),
-            user_id=user_profile['id']  # Assign user_id here
-        )
-        db.session.add(post)
-        db.session.commit()
+            return None
 
-        print(f"Generated AI post for {group_name}: {title}")
-
-        # Generate an image for every 10th post
-        if post_count % 10 == 0 and image_prompt:  # Use image prompt if exists
-            generate_image(image_prompt, post)
-
-        return post.id, title, image_prompt
+        return {
+            "title": str(post_data['title']).strip(),
+            "content": str(post_data.get('content') or '').strip(),
+            "image_prompt": str(post_data.get('image_prompt') or '').strip()
+        }
 
     except Exception as e:
         print(f"Error generating post for {group_name}: {e}")
-        return None, None, None
+        return None
+
+def save_post(group_name, user_profile, post_data, post_count):
+    # Queue the post for the next batch; comments can attach to it before it has an id
+    post = writer.add_post(
+        group_name=group_name,
+        title=post_data['title'],
+        content=post_data['content'],
+        upvotes=random.randint(1, 1000),
+        downvotes=random.randint(0, 500),
+        is_ai_generated=True,
+        timestamp=datetime.utcnow(),
+        user_id=user_profile.id  # Assign user_id here
+    )
+
+    print(f"Generated AI post for {group_name}: {post_data['title']}")
 
-def generate_comment_for_post(post_id, post_title, group_name, user_profile):
+    # Queue an image for every 10th post; image_worker.py renders it and attaches image_url
+    if images_enabled and post_count % 10 == 0 and post_data['image_prompt']:  # Use image prompt if exists
+        writer.add_image_job(post, post_data['image_prompt'])
+
+    return post
+
+def persona(bot):
+    # Short enough to repeat for every commenter of a batched prompt; users.goal may be NULL
+    goal = (bot.goal or '').split()
+    if not goal:
+        return bot.username
+    return f"{bot.username} (goal: {' '.join(goal[:PERSONA_WORDS])}{'...' if len(goal) > PERSONA_WORDS else ''})"
+
+def generate_comment_for_post(post_title, group_name, user_profile):
+    # Runs on a generation thread: talks to the LLM only, never to the database
     try:
         prompt = (
-            f"As a user named {user_profile['username']}, write a comment in response to the post titled '{post_title}' in the '{group_name}' Subllmit on LLMit. "
+            f"As a user named {user_profile.username}, write a comment in response to the post titled '{post_title}' in the '{group_name}' Subllmit on LLMit. "
             "The comment should be relevant, stay in character, and fit the tone of the Subllmit."
         )
 
         completion = client.chat.completions.create(
-            model="unsloth/Llama-3.2-3B-Instruct-GGUF",
+            model=MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=150,
@@ -163,100 +147,330 @@ def generate_comment_for_post(post_id, post_title, group_name, user_profile):
 
         comment_content = completion.choices[0].message.content.strip()
         print(f"AI Comment Response: {comment_content}")  # For debugging
+        return comment_content
+
+    except Exception as e:
+        print(f"Error generating comment for '{post_title}': {e}")
+        return None
 
-        # Create the comment
-        comment = Comment(
-            post_id=post_id,
-            content=comment_content,
-            is_ai_generated=True,
-            upvotes=random.randint(1, 100),
-            downvotes=random.randint(0, 50),
-            timestamp=datetime.utcnow(),
-            user_id=user_profile['id']  # Assign user_id here
+def save_comment(post, post_title, user_profile, comment_content):
+    # Queue the comment for the next batch
+    writer.add_comment(
+        post,
+        content=comment_content,
+        is_ai_generated=True,
+        upvotes=random.randint(1, 100),
+        downvotes=random.randint(0, 50),
+        timestamp=datetime.utcnow(),
+        user_id=user_profile.id  # Assign user_id here
+    )
+
+    print(f"Generated AI comment for post '{post_title}'")
+
+def generate_comments_for_post(post_title, group_name, commenters, replies=False):
+    # Runs on a generation thread: one request for a comment from each commenter.
+    # Returns (commenter index, content, index of the comment it answers or None) tuples.
+    try:
+        # One short persona line per commenter; the post and the instructions
+        # are sent once for all of them
+        personas = '\n'.join(f"{n}. {persona(bot)}" for n, bot in enumerate(commenters, 1))
+        prompt = (
+            f"Write one comment from each of these users, in order, on the post '{post_title}' in the '{group_name}' Subllmit on LLMit:\n"
+            f"{personas}\n"
+            "Stay relevant, in character and in the Subllmit's tone. Respond ONLY with a JSON array, one object per user:\n"
+            + ('[{"user": 1, "comment": "Text", "reply_to": null}, {"user": 2, "comment": "Text", "reply_to": 1}]\n'
+               '"reply_to" is the 1-based position in the array of an earlier comment this one answers, '
+               "or null for a comment on the post. Let some users reply to each other.\n" if replies else
+               '[{"user": 1, "comment": "Text"}, {"user": 2, "comment": "Text"}]\n')
         )
-        db.session.add(comment)
-        db.session.commit()
 
-        print(f"Generated AI comment for post {post_id}")
+        # One request instead of len(commenters); streamed and cut off at the closing bracket
+        items = generate_json(
+            client, structured_stats, required=('comment',), retries=json_retries, opening='[',
+            model=MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=150 * len(commenters),
+        )
+        print(f"AI Comments Response: {items}")  # For debugging
+        if not items:
+            return None
+
+        comments = []
+        used = set()
+        # Position in the model's array -> index in comments, for reply_to
+        kept = {}
+        for position, item in enumerate(items[:len(commenters)]):
+            if item is None:  # missing its comment; replies to it go on the post instead
+                continue
+            # Trust the model's user number only when it is one we asked for and haven't had yet
+            user = item.get('user')
+            commenter = user - 1 if isinstance(user, int) and 0 < user <= len(commenters) else position
+            if commenter in used:
+                commenter = min(set(range(len(commenters))) - used)
+            used.add(commenter)
+            reply_to = item.get('reply_to') if replies else None
+            parent = kept.get(reply_to - 1) if isinstance(reply_to, int) and 0 < reply_to <= position else None
+            kept[position] = len(comments)
+            comments.append((commenter, str(item['comment']).strip(), parent))
+        return comments
 
     except Exception as e:
-        print(f"Error generating comment for post {post_id}: {e}")
+        print(f"Error generating comments for '{post_title}': {e}")
+        return None
 
-def create_new_subllmit():
+def save_comments(post, post_title, commenters, comments):
+    # Queue the whole thread at once, so it is written in a single transaction
+    writer.add_comments(post, [
+        {
+            'content': content,
+            'is_ai_generated': True,
+            'upvotes': random.randint(1, 100),
+            'downvotes': random.randint(0, 50),
+            'timestamp': datetime.utcnow(),
+            'user_id': commenters[commenter].id,
+            'parent': parent,
+        }
+        for commenter, content, parent in comments
+    ])
+
+    print(f"Generated {len(comments)} AI comments for post '{post_title}'")
+
+def generate_subllmit_name():
+    # Runs on a generation thread: talks to the LLM only, never to the database
     try:
         prompt = (
             "Generate a unique and interesting Subllmit name for LLMit that does not already exist."
         )
 
         completion = client.chat.completions.create(
-            model="unsloth/Llama-3.2-3B-Instruct-GGUF",
+            model=MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.9,
             max_tokens=10,
         )
 
-        subllmit_name = completion.choices[0].message.content.strip()
-        existing_subllmit = Subllmit.query.filter_by(name=subllmit_name).first()
-        if existing_subllmit:
-            print(f"Subllmit '{subllmit_name}' already exists.")
-            return
-
-        # Create new Subllmit
-        new_subllmit = Subllmit(name=subllmit_name)
-        db.session.add(new_subllmit)
-        db.session.commit()
-        print(f"Created new Subllmit: {subllmit_name}")
+        return completion.choices[0].message.content.strip()
 
     except Exception as e:
         print(f"Error creating new Subllmit: {e}")
+        return None
 
-def fetch_bot_users():
-    return User.query.filter_by(user_type='bot').all()
+def create_new_subllmit(subllmit_name):
+    # Known names are skipped without asking the database; new ones can be
+    # posted to straight away (the batch writes subllmits before posts)
+    if not world.subllmits.add(subllmit_name):
+        print(f"Subllmit {subllmit_name} already exists. Skipping.")
+        return
+    writer.add_subllmit(subllmit_name)
+    print(f"Queued new Subllmit: {subllmit_name}")
+
+def populator_stats(engine, saved_posts, saved_comments, running=True):
+    return {
+        "running": int(running),
+        "posts_saved_total": saved_posts,
+        "comments_saved_total": saved_comments,
+        "generations_completed_total": engine.completed,
+        "generations_failed_total": engine.failed,
+        "generations_in_flight": engine.in_flight,
+        "pending_rows": writer.pending(),
+        "batch_flushes_total": writer.flushes,
+        "rows_written_total": writer.rows_written,
+        "llm_cache_hits_total": llm_cache.hits,
+        "llm_cache_misses_total": llm_cache.misses,
+        **structured_stats.stats(),
+    }
+
+def authors_still_exist(job):
+    if job.kind == 'post':
+        return job.context[1] in world.bots
+    if job.kind == 'comment':
+        return job.context[2] in world.bots
+    if job.kind == 'comments':
+        return all(commenter in world.bots for commenter in job.context[2])
+    return True
+
+def run_population(concurrency, max_posts=None, delay=0, seed=None, recent_comments=0,
+                   batched_comments=False, comment_replies=False):
+    # Generation runs on a pool of `concurrency` threads; this loop is the single DB writer
+    total_posts = Post.query.count()  # Fetch the number of posts in the database
+    print(f"Resuming from post number: {total_posts}")
+
+    if not len(world.bots):
+        print("No bot users found. Run create_bots.py first.")
+        return
+
+    started = [0]
+    replay_ran_out = [False]
+
+    def next_post_job():
+        # Keep post generations flowing across subllmits until max_posts have been started
+        if max_posts is not None and started[0] >= max_posts:
+            return None
+        if llm_cache.exhausted():
+            if not replay_ran_out[0]:
+                replay_ran_out[0] = True
+                print("Replay ran out of recorded answers; not starting more posts.")
+            return None
+        if not len(world.bots) or not len(world.subllmits):
+            print("No bots or subllmits left after the database was reset; not starting more posts.")
+            return None
+        started[0] += 1
+        # With a seed, everything that goes into this post's prompts (its author,
+        # its commenters) is drawn from its own generator, so a replayed run asks
+        # the same questions whatever order the answers come back in
+        rng = random.Random(f"{seed}:{started[0]}") if seed is not None else random
+        group_name = world.subllmits.pick(started[0] - 1)
+        user_profile = world.bots.choice(rng)
+        return Job('post', generate_post_for_group, (group_name, user_profile), (group_name, user_profile, rng))
+
+    engine = GenerationEngine(concurrency, next_post_job)
+    started_at = time.monotonic()
+    saved_posts = saved_comments = 0
+    resets_seen = world.resets
+    try:
+        for job, result, error in engine.results(poll_interval=writer.max_age):
+            # Flush a batch that has aged out even when no generation has finished
+            writer.maybe_flush()
+            if world.maybe_refresh() and world.resets != resets_seen:
+                resets_seen = world.resets
+                print(f"The database was reset; reloaded {len(world.bots)} bots and {len(world.subllmits)} subllmits.")
+            stats_file.maybe_write(populator_stats(engine, saved_posts, saved_comments))
+            if job is None or error is not None or not result:
+                continue
+            if not authors_still_exist(job):
+                # The database was reset while this was generating
+                continue
+
+            if job.kind == 'post':
+                group_name, user_profile, rng = job.context
+                post = save_post(group_name, user_profile, result, total_posts)
+                total_posts += 1  # Increment the post count for each post
+                saved_posts += 1
+
+                # Queue comments on the new post; they run ahead of new posts
+                num_comments = rng.randint(0, 10)  # Random comments for each post
+                if batched_comments:
+                    # All of them from one request
+                    commenters = [world.bots.choice(rng) for _ in range(num_comments)]
+                    if commenters:
+                        engine.add(Job('comments', generate_comments_for_post,
+                                       (result['title'], group_name, commenters, comment_replies),
+                                       (post, result['title'], commenters)))
+                else:
+                    for _ in range(num_comments):
+                        commenter_profile = world.bots.choice(rng)
+                        engine.add(Job('comment', generate_comment_for_post,
+                                       (result['title'], group_name, commenter_profile),
+                                       (post, result['title'], commenter_profile)))
+
+                # And a few on posts from the last while, so older threads keep growing
+                if recent_comments and len(world.recent_posts):
+                    for _ in range(rng.randint(0, recent_comments)):
+                        post_id, post_group, post_title = world.recent_posts.choice(rng)
+                        commenter_profile = world.bots.choice(rng)
+                        engine.add(Job('comment', generate_comment_for_post,
+                                       (post_title, post_group, commenter_profile),
+                                       (post_id, post_title, commenter_profile)))
+
+                # Create new Subllmit every 40 posts
+                if total_posts % 40 == 0:
+                    engine.add(Job('subllmit', generate_subllmit_name))
+
+                # Optional pause to simulate natural posting
+                if delay:
+                    time.sleep(delay)
+
+            elif job.kind == 'comment':
+                post, post_title, commenter_profile = job.context
+                save_comment(post, post_title, commenter_profile, result)
+                saved_comments += 1
+
+            elif job.kind == 'comments':
+                post, post_title, commenters = job.context
+                save_comments(post, post_title, commenters, result)
+                saved_comments += len(result)
+
+            elif job.kind == 'subllmit':
+                create_new_subllmit(result)
+    finally:
+        engine.shutdown()
+        writer.close()
+        stats_file.write(populator_stats(engine, saved_posts, saved_comments, running=False))
+        elapsed = time.monotonic() - started_at
+        print(f"Saved {saved_posts} posts and {saved_comments} comments in {elapsed:.1f}s "
+              f"({(saved_posts + saved_comments) / max(elapsed, 1e-9):.2f} generations/s, "
+              f"{engine.failed} failed).")
+        print(structured_stats.summary())
+        print(llm_cache.summary())
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Let the bots populate LLMit.")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="LLM generations kept in flight at once (default: 4)")
+    parser.add_argument('--base-url', default=LLM_BASE_URL,
+                        help="OpenAI-compatible server, e.g. llm_stub_server.py for testing")
+    parser.add_argument('--max-posts', type=int, default=None,
+                        help="Stop after this many posts (default: run forever)")
+    parser.add_argument('--delay', type=float, default=0,
+                        help="Seconds to pause after each saved post")
+    parser.add_argument('--batch-size', type=int, default=200,
+                        help="Rows written per transaction (default: 200)")
+    parser.add_argument('--batch-age', type=float, default=2.0,
+                        help="Longest a generated row waits to be written, in seconds (default: 2)")
+    parser.add_argument('--no-images', action='store_true',
+                        help="Text only: don't queue image prompts for image_worker.py")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Make authors and commenters reproducible, e.g. to replay a recorded run")
+    parser.add_argument('--recent-comments', type=int, default=0,
+                        help="Up to this many extra comments per new post on recent posts (default: 0)")
+    parser.add_argument('--refresh-interval', type=float, default=REFRESH_INTERVAL,
+                        help=f"Seconds between looking for new bots, subllmits and posts (default: {REFRESH_INTERVAL:g})")
+    parser.add_argument('--batched-comments', action='store_true',
+                        help="Generate each post's comments in one request instead of one request per comment")
+    parser.add_argument('--comment-replies', action='store_true',
+                        help="With --batched-comments, let commenters reply to each other (nested threads)")
+    parser.add_argument('--json-retries', type=int, default=RETRIES,
+                        help=f"Extra attempts at a post or comment batch whose JSON is unusable (default: {RETRIES})")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    images_enabled = not args.no_images
+    json_retries = args.json_retries
+    boot = BootTimer()
+    boot.mark('imports')
+
+    llm_cache = LLMCache(args.llm_cache, args.llm_cache_path, args.llm_cache_max_mb)
+    client = cached_client(OpenAI(base_url=args.base_url, api_key="lm-studio"), llm_cache)
+
+    # Exit through the normal shutdown path on SIGTERM so the last batch is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    app = create_app()
+    boot.mark('app')
     with app.app_context():
+        # Databases created before the image queue existed get its table here
+        with db.engine.begin() as connection:
+            create_queue_schema(connection)
+        writer = BatchWriter(db.engine, Post, Comment, Subllmit, args.batch_size, args.batch_age)
+        stats_file = StatsFile(app.config['POPULATOR_STATS_PATH'])
         try:
+            world = WorldState(db.engine, args.refresh_interval)
+            world.refresh()
             # Initialize Subllmits
-            for group_name in groups:
-                existing_subllmit = Subllmit.query.filter_by(name=group_name).first()
-                if not existing_subllmit:
-                    new_subllmit = Subllmit(name=group_name)
-                    db.session.add(new_subllmit)
+            missing = [name for name in DEFAULT_SUBLLMITS if name not in world.subllmits]
+            for group_name in missing:
+                db.session.add(Subllmit(name=group_name))
             db.session.commit()
-            print("Initialized Subllmits.")
-
-            # Get the total number of posts already in the database
-            total_posts = Post.query.count()  # Fetch the number of posts in the database
-            print(f"Resuming from post number: {total_posts}")
-
-            while True:  # Infinite loop to keep generating posts
-                for group_name in groups:
-                    # Fetch a random bot user
-                    bot_users = fetch_bot_users()
-                    if bot_users:
-                        user = random.choice(bot_users)
-                        user_profile = {"id": user.id, "username": user.username, "background": user.background, "goal": user.goal}
-
-                        # Generate posts
-                        post_id, post_title, image_prompt = generate_post_for_group(group_name, user_profile, total_posts)
-
-                        total_posts += 1  # Increment the post count for each post
-
-                        # Generate comments on the posts if posted successfully
-                        if post_id:
-                            num_comments = random.randint(0, 10)  # Random comments for each post
-                            for _ in range(num_comments):
-                                # Fetch another random bot user for the comment
-                                commenter = random.choice(bot_users)
-                                commenter_profile = {"id": commenter.id, "username": commenter.username, "background": commenter.background, "goal": commenter.goal}
-                                generate_comment_for_post(post_id, post_title, group_name, commenter_profile)
-
-                        # Create new Subllmit every 40 posts
-                        if total_posts % 40 == 0:
-                            create_new_subllmit()
+            if missing:
+                world.refresh()
+            print(f"Initialized Subllmits: {len(world.subllmits)} subllmits, {len(world.bots)} bots.")
+            boot.mark('database')
+            boot.report()
 
-                        # Random delay to simulate natural posting
-                        time.sleep(random.randint(1, 5))  # Random sleep between 1 to 5 seconds
+            run_population(args.concurrency, args.max_posts, args.delay, args.seed, args.recent_comments,
+                           args.batched_comments, args.comment_replies)
 
+        except KeyboardInterrupt:
+            print("Stopping.")
         except Exception as e:
             print(f"An unexpected error occurred in the main execution: {e}")
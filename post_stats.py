@@ -0,0 +1,74 @@
+from sqlalchemy import text, bindparam, DateTime
+
+# Per-post comment summaries stored on the posts row itself.
+#
+# comment_count and last_activity_at let listings show and sort by activity
+# without touching the comments table. Every comment write bumps them in the
+# same transaction (api_submit_comment one at a time, the populator's batch
+# writer one UPDATE per post per batch); check_comment_counts() recomputes
+# them from comments with a single grouped query to catch anything that
+# bypassed those paths.
+
+RECORD_COMMENTS = text('''
+    UPDATE posts
+    SET comment_count = comment_count + :count,
+        last_activity_at = MAX(COALESCE(last_activity_at, timestamp), :last_comment_at)
+    WHERE id = :post_id
+    RETURNING group_name
+''').bindparams(bindparam('last_comment_at', type_=DateTime))  # stored in the ORM's timestamp format
+
+# One pass over comments, grouped by post, compared with what posts claim
+COMMENT_SUMMARIES = '''
+    SELECT posts.id AS post_id,
+           COALESCE(summary.count, 0) AS count,
+           MAX(posts.timestamp, COALESCE(summary.last_comment_at, posts.timestamp)) AS last_activity_at
+    FROM posts
+    LEFT JOIN (
+        SELECT post_id, COUNT(*) AS count, MAX(timestamp) AS last_comment_at
+        FROM comments
+        GROUP BY post_id
+    ) AS summary ON summary.post_id = posts.id
+'''
+
+FIND_DRIFT = text(f'''
+    WITH expected AS ({COMMENT_SUMMARIES})
+    SELECT posts.id, posts.comment_count, expected.count
+    FROM posts JOIN expected ON expected.post_id = posts.id
+    WHERE posts.comment_count != expected.count
+       OR posts.last_activity_at IS NOT expected.last_activity_at
+''')
+
+FIX_DRIFT = text(f'''
+    WITH expected AS ({COMMENT_SUMMARIES})
+    UPDATE posts
+    SET comment_count = expected.count, last_activity_at = expected.last_activity_at
+    FROM expected
+    WHERE expected.post_id = posts.id
+      AND (posts.comment_count != expected.count
+           OR posts.last_activity_at IS NOT expected.last_activity_at)
+''')
+
+def record_comments(connection, comments):
+    # comments: iterable of (post_id, timestamp), one per new comment.
+    # Returns the group names of the posts that were touched.
+    summaries = {}
+    for post_id, timestamp in comments:
+        count, last_comment_at = summaries.get(post_id, (0, timestamp))
+        summaries[post_id] = (count + 1, max(last_comment_at, timestamp))
+    groups = set()
+    for post_id, (count, last_comment_at) in summaries.items():
+        group_name = connection.execute(RECORD_COMMENTS, {
+            'post_id': post_id,
+            'count': count,
+            'last_comment_at': last_comment_at
+        }).scalar()
+        if group_name is not None:
+            groups.add(group_name)
+    return groups
+
+def check_comment_counts(connection, fix=False):
+    # Returns [(post_id, stored_count, actual_count)] for posts that had drifted
+    drift = connection.execute(FIND_DRIFT).all()
+    if fix and drift:
+        connection.execute(FIX_DRIFT)
+    return drift
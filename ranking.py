@@ -0,0 +1,28 @@
+import math
+from datetime import datetime
+
+# Reddit-style "hot" ranking: the order of magnitude of the score plus a
+# time bonus, so a post needs 10x the votes to outrank one 12.5 hours newer.
+HOT_EPOCH = datetime(2005, 12, 8, 7, 46, 43)
+HOT_DECAY_SECONDS = 45000
+
+def score_of(upvotes, downvotes):
+    return (upvotes or 0) - (downvotes or 0)
+
+def hot_rank(score, timestamp):
+    order = math.log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    seconds = (timestamp - HOT_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY_SECONDS, 7)
+
+def sql_hot_rank(score, timestamp):
+    # SQLite hands DateTime columns over as text
+    if score is None or timestamp is None:
+        return None
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return hot_rank(score, timestamp)
+
+def register_sql_functions(dbapi_connection, connection_record=None):
+    # Lets UPDATE statements recompute hot in SQL: SET hot = hot_rank(score, timestamp)
+    dbapi_connection.create_function('hot_rank', 2, sql_hot_rank, deterministic=True)
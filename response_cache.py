@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from importlib import import_module
+from flask import request, make_response
+
+# Response cache for the read-heavy JSON endpoints.
+#
+# Entries are keyed on the route, its query args and the current generation of
+# every tag the view declares (e.g. "posts:general"). Writes call invalidate()
+# with the tags they touch, which bumps those generations, so stale entries are
+# never looked up again and simply age out of the LRU. Every cached response
+# carries an ETag; a matching If-None-Match gets a 304 before the view runs.
+#
+# The default backend lives in-process. To share one cache between several
+# workers, point RESPONSE_CACHE_BACKEND at an object (or "module:attribute"
+# path) with the same get/set/incr/generation methods, e.g. one backed by Redis
+# GET/SETEX/INCR.
+
+
+class LocalCacheBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, name):
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            return self._generations[name]
+
+    def generation(self, name):
+        return self._generations.get(name, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.default_ttl = 10
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.default_ttl = app.config.get('RESPONSE_CACHE_TTL', self.default_ttl)
+        backend = app.config.get('RESPONSE_CACHE_BACKEND')
+        if isinstance(backend, str):
+            module_name, attribute = backend.split(':')
+            backend = getattr(import_module(module_name), attribute)
+        self.backend = backend or LocalCacheBackend(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 2048))
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr(f'tag:{tag}')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def _key(self, tags):
+        args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+        generations = ','.join(f'{tag}@{self.backend.generation(f"tag:{tag}")}' for tag in tags)
+        return f'{request.path}?{args}|{generations}'
+
+    # tags is a callable evaluated per request, so it can look at request.args/view_args
+    def cached(self, tags, ttl=None):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                key = self._key(tags())
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        "body": body,
+                        "mimetype": response.mimetype,
+                        "etag": hashlib.sha1(body).hexdigest()
+                    }
+                    self.backend.set(key, entry, ttl or self.default_ttl)
+
+                if request.if_none_match.contains(entry["etag"]):
+                    self.not_modified += 1
+                    response = make_response('', 304)
+                else:
+                    response = make_response(entry["body"])
+                    response.mimetype = entry["mimetype"]
+                response.set_etag(entry["etag"])
+                # Let browsers keep the body but revalidate with If-None-Match every time
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
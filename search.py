@@ -0,0 +1,153 @@
+import re
+from html import escape
+from sqlalchemy import text
+
+# Full-text search over posts and comments with SQLite FTS5.
+#
+# posts_fts and comments_fts are external-content tables: they index the text
+# of posts/comments without storing a second copy, and the triggers below keep
+# them in step with every insert, edit and delete, whichever process writes.
+# Vote updates don't touch title/content, so they never fire the triggers.
+
+SEARCH_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content, content='posts', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+        content, content='comments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+    END''',
+    # Case-insensitive prefix lookups of subllmit names (name LIKE 'q%') read this index
+    'CREATE INDEX IF NOT EXISTS ix_subllmits_name_nocase ON subllmits (name COLLATE NOCASE)',
+]
+
+SEARCH_TRIGGERS = [
+    'posts_fts_insert', 'posts_fts_delete', 'posts_fts_update',
+    'comments_fts_insert', 'comments_fts_delete', 'comments_fts_update',
+]
+
+REBUILD_INDEX = [
+    "INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')",
+    "INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')",
+]
+
+# snippet() wraps matches in these control characters; they are swapped for
+# <mark> tags only after the text itself has been HTML-escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+POST_RESULTS = '''
+    SELECT p.id AS post_id, p.group_name, p.title, p.score, p.timestamp,
+           p.is_ai_generated, u.username,
+           snippet(posts_fts, -1, :start, :end, '...', 16) AS snippet,
+           bm25(posts_fts, 4.0, 1.0) AS rank
+    FROM posts_fts
+    JOIN posts p ON p.id = posts_fts.rowid
+    LEFT JOIN users u ON u.id = p.user_id
+    WHERE posts_fts MATCH :query {filters}
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+'''
+
+COMMENT_RESULTS = '''
+    SELECT c.id AS comment_id, c.post_id, p.group_name, p.title, c.upvotes - c.downvotes AS score,
+           c.timestamp, c.is_ai_generated, u.username,
+           snippet(comments_fts, 0, :start, :end, '...', 16) AS snippet,
+           bm25(comments_fts) AS rank
+    FROM comments_fts
+    JOIN comments c ON c.id = comments_fts.rowid
+    JOIN posts p ON p.id = c.post_id
+    LEFT JOIN users u ON u.id = c.user_id
+    WHERE comments_fts MATCH :query {filters}
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+'''
+
+def create_search_schema(connection):
+    for statement in SEARCH_SCHEMA:
+        connection.execute(text(statement))
+
+def drop_search_triggers(connection):
+    # For bulk loads: insert without the per-row triggers, then
+    # create_search_schema() and rebuild_search_index() once at the end
+    for trigger in SEARCH_TRIGGERS:
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+
+def rebuild_search_index(connection):
+    for statement in REBUILD_INDEX:
+        connection.execute(text(statement))
+
+def fts_query(query):
+    # Quote every word so user input can't inject FTS5 syntax; the last word
+    # is matched as a prefix so results show up while the user is still typing
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def highlight(snippet):
+    return escape(snippet or '').replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+def search(connection, query, kind='posts', group=None, author=None, is_ai_generated=None,
+           limit=10, offset=0):
+    # Returns up to limit results plus whether more exist
+    match = fts_query(query)
+    if match is None:
+        return [], False
+
+    params = {'query': match, 'start': MATCH_START, 'end': MATCH_END,
+              'limit': limit + 1, 'offset': offset}
+    table = 'p' if kind == 'posts' else 'c'
+    filters = []
+    if group:
+        filters.append('AND p.group_name = :group')
+        params['group'] = group
+    if author:
+        filters.append('AND u.username = :author')
+        params['author'] = author
+    if is_ai_generated is not None:
+        filters.append(f'AND {table}.is_ai_generated = :is_ai_generated')
+        params['is_ai_generated'] = is_ai_generated
+
+    statement = POST_RESULTS if kind == 'posts' else COMMENT_RESULTS
+    rows = connection.execute(text(statement.format(filters=' '.join(filters))), params).mappings().all()
+
+    results = []
+    for row in rows[:limit]:
+        result = {
+            "type": "post" if kind == 'posts' else "comment",
+            "post_id": row['post_id'],
+            "group": row['group_name'],
+            "title": row['title'],
+            "snippet": highlight(row['snippet']),
+            "score": row['score'],
+            "is_ai_generated": bool(row['is_ai_generated']),
+            "timestamp": str(row['timestamp']).replace(' ', 'T'),
+            "author": row['username'] or "Anonymous",
+            "rank": row['rank']
+        }
+        if kind == 'comments':
+            result["comment_id"] = row['comment_id']
+        results.append(result)
+    return results, len(rows) > limit
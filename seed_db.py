@@ -0,0 +1,279 @@
+import argparse
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from ranking import score_of, hot_rank
+from search import create_search_schema, drop_search_triggers, rebuild_search_index
+from frontpage import create_frontpage_schema, drop_frontpage_triggers, rebuild_frontpage
+from world_dump import write_batch
+from app import UNUSABLE_PASSWORD, create_app, db
+
+# Synthetic LLMit worlds for benchmarks and local development: users,
+# subllmits, posts and comment threads generated straight into the database,
+# no inference server or diffusion model needed.
+#
+# The shape is meant to look like a busy site rather than a uniform grid:
+# a few subllmits and authors get most of the posts (Zipf weights), comment
+# counts per post are heavy-tailed (log-normal around --comments-per-post),
+# and each comment either starts a new thread or replies to an earlier one,
+# down to --max-depth. Vote counts are drawn per post and comment and the
+# stored score/hot/comment_count/last_activity_at are filled in to match, so
+# every listing and sort order works as if the rows had come through the app.
+# The votes ledger is left empty: it only records who voted, and no seeded
+# user ever votes through the app.
+#
+# Rows are written with executemany, CHUNK_POSTS posts and their comments per
+# transaction, with the full-text search triggers dropped until the end. The
+# same --seed always produces the same world, dated relative to when it runs.
+
+# Presets used by benchmark.py; any of them can be overridden on the command line
+SIZES = {
+    'small': {'users': 200, 'subllmits': 20, 'posts': 2000, 'comments_per_post': 8},
+    'medium': {'users': 2000, 'subllmits': 60, 'posts': 20000, 'comments_per_post': 12},
+    'large': {'users': 10000, 'subllmits': 200, 'posts': 100000, 'comments_per_post': 15},
+}
+
+MAX_DEPTH = 8
+# Share of comments that reply to the post rather than to another comment
+TOP_LEVEL_SHARE = 0.35
+# Spread of comment counts per post; higher means a longer tail of huge threads
+THREAD_SIGMA = 1.1
+DAYS = 30
+CHUNK_POSTS = 1000
+
+WORDS = (
+    'model prompt token context window weights layer attention gradient dataset benchmark '
+    'latency cache query index server client thread queue batch stream vector embedding '
+    'robot cat coffee garden music movie science history space rocket planet ocean '
+    'city train bicycle recipe bread pizza chess puzzle game story poem question answer '
+    'theory experiment result paper review opinion debate news update release bug fix '
+    'feature design pattern language compiler kernel memory disk network packet protocol '
+    'weather winter summer mountain river forest book library museum painting camera photo '
+    'friend family neighbour teacher student doctor engineer artist farmer pilot chef '
+    'strange brilliant tiny enormous quiet loud ancient modern hidden obvious curious '
+    'why how what when really maybe definitely probably honestly basically'
+).split()
+
+TABLE_COLUMNS = {
+    'users': ('id', 'username', 'password', 'background', 'goal', 'user_type'),
+    'subllmits': ('id', 'name'),
+    'posts': ('id', 'group_name', 'title', 'content', 'image_url', 'upvotes', 'downvotes', 'score', 'hot',
+              'is_ai_generated', 'timestamp', 'comment_count', 'last_activity_at', 'user_id'),
+    'comments': ('id', 'post_id', 'parent_comment_id', 'content', 'upvotes', 'downvotes',
+                 'is_ai_generated', 'timestamp', 'user_id'),
+}
+
+
+@contextmanager
+def checked_transaction(engine):
+    # A transaction whose foreign keys are checked when it commits, so a chunk
+    # may reference its own rows in any order and a generator bug can't leave
+    # dangling rows. foreign_keys can't be switched inside a transaction: it is
+    # set before the first INSERT opens one, and turned off again before the
+    # connection goes back to the pool.
+    with engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+        try:
+            connection.exec_driver_sql('PRAGMA defer_foreign_keys = ON')
+            yield connection
+            connection.commit()
+        except BaseException:
+            # A COMMIT that fails the foreign key check leaves SQLite's
+            # transaction open, which SQLAlchemy's rollback doesn't see
+            connection.rollback()
+            connection.connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+            connection.commit()
+
+def insert_statement(table):
+    columns = TABLE_COLUMNS[table]
+    return f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})'
+
+def stored_time(value):
+    # The text format SQLAlchemy writes DateTime columns in; keyset cursors compare against it
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def zipf_weights(count, exponent=1.0):
+    # Cumulative weights for rng.choices: item n is picked in proportion to 1 / (n + 1)**exponent
+    total, cumulative = 0.0, []
+    for rank in range(count):
+        total += 1 / (rank + 1) ** exponent
+        cumulative.append(total)
+    return cumulative
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+def vote_counts(rng, scale):
+    # Mostly a handful of votes, occasionally hundreds
+    upvotes = int((rng.paretovariate(1.3) - 1) * scale)
+    downvotes = int(upvotes * rng.random() * 0.3)
+    return upvotes, downvotes
+
+def thread_size(rng, mean, cap):
+    # Log-normal with the requested mean
+    mu = math.log(max(mean, 0.01)) - THREAD_SIGMA ** 2 / 2
+    return min(int(rng.lognormvariate(mu, THREAD_SIGMA)), cap)
+
+def next_id(connection, table):
+    return connection.exec_driver_sql(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').scalar()
+
+def seed_users(engine, rng, count, first_id):
+    rows = []
+    for user_id in range(first_id, first_id + count):
+        username = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{user_id}"
+        rows.append((user_id, username, UNUSABLE_PASSWORD, sentence(rng, 8, 20), sentence(rng, 4, 10), 'bot'))
+    write_batch(engine, insert_statement('users'), rows)
+    return [row[0] for row in rows]
+
+def seed_subllmits(engine, rng, count, first_id):
+    names = [f"{rng.choice(WORDS)}{first_id + n}" for n in range(count)]
+    write_batch(engine, insert_statement('subllmits'),
+                [(first_id + n, name) for n, name in enumerate(names)])
+    return names
+
+def comment_thread(rng, post_id, post_time, first_id, count, user_ids, user_weights, now, max_depth):
+    # Returns comment rows for one post, parents always before their replies
+    rows, depths = [], []
+    authors = rng.choices(user_ids, cum_weights=user_weights, k=count)
+    timestamp = post_time
+    for n in range(count):
+        parent_index = None
+        if depths and rng.random() > TOP_LEVEL_SHARE:
+            # Later comments are more likely to answer recent ones
+            parent_index = len(depths) - 1 - min(int(rng.expovariate(0.2)), len(depths) - 1)
+            if depths[parent_index] + 1 >= max_depth:
+                parent_index = None
+        timestamp = min(timestamp + timedelta(seconds=rng.expovariate(1 / 600)), now)
+        upvotes, downvotes = vote_counts(rng, 2)
+        rows.append((
+            first_id + n,
+            post_id,
+            rows[parent_index][0] if parent_index is not None else None,
+            sentence(rng, 5, 40),
+            upvotes,
+            downvotes,
+            1,
+            stored_time(timestamp),
+            authors[n],
+        ))
+        depths.append(depths[parent_index] + 1 if parent_index is not None else 0)
+    return rows, timestamp
+
+def seed_posts(engine, rng, count, comments_per_post, group_names, user_ids, first_post_id,
+               first_comment_id, max_depth=MAX_DEPTH, days=DAYS, progress=True):
+    now = datetime.utcnow()
+    group_weights = zipf_weights(len(group_names))
+    user_weights = zipf_weights(len(user_ids), 0.8)
+    # Oldest first, so ids grow with time as they do on the live site
+    post_times = sorted(now - timedelta(seconds=rng.uniform(0, days * 86400)) for _ in range(count))
+    groups = rng.choices(group_names, cum_weights=group_weights, k=count)
+    authors = rng.choices(user_ids, cum_weights=user_weights, k=count)
+    thread_cap = max(int(comments_per_post * 50), 1)
+
+    post_statement, comment_statement = insert_statement('posts'), insert_statement('comments')
+    comment_id = first_comment_id
+    total_comments = 0
+    started = time.monotonic()
+    for chunk_start in range(0, count, CHUNK_POSTS):
+        posts, comments = [], []
+        for n in range(chunk_start, min(chunk_start + CHUNK_POSTS, count)):
+            post_id = first_post_id + n
+            thread, last_activity = comment_thread(
+                rng, post_id, post_times[n], comment_id, thread_size(rng, comments_per_post, thread_cap),
+                user_ids, user_weights, now, max_depth)
+            comment_id += len(thread)
+            comments.extend(thread)
+            upvotes, downvotes = vote_counts(rng, 5)
+            score = score_of(upvotes, downvotes)
+            posts.append((
+                post_id,
+                groups[n],
+                sentence(rng, 3, 12).capitalize(),
+                sentence(rng, 20, 120),
+                None,
+                upvotes,
+                downvotes,
+                score,
+                hot_rank(score, post_times[n]),
+                1,
+                stored_time(post_times[n]),
+                len(thread),
+                stored_time(last_activity),
+                authors[n],
+            ))
+        # A chunk's posts and their comments land in one transaction
+        with checked_transaction(engine) as connection:
+            connection.exec_driver_sql(post_statement, posts)
+            if comments:
+                connection.exec_driver_sql(comment_statement, comments)
+        total_comments += len(comments)
+        if progress:
+            done = chunk_start + len(posts)
+            print(f"  {done}/{count} posts, {total_comments} comments "
+                  f"({done / max(time.monotonic() - started, 1e-9):.0f} posts/s)")
+    return total_comments
+
+def seed(engine, users, subllmits, posts, comments_per_post, seed=1, max_depth=MAX_DEPTH,
+         days=DAYS, progress=True):
+    # Adds a synthetic world to whatever the database already holds; returns row counts
+    rng = random.Random(seed)
+    started = time.monotonic()
+    with engine.connect() as connection:
+        first_ids = {table: next_id(connection, table) for table in TABLE_COLUMNS}
+
+    user_ids = seed_users(engine, rng, users, first_ids['users'])
+    group_names = seed_subllmits(engine, rng, subllmits, first_ids['subllmits'])
+
+    with engine.begin() as connection:
+        drop_search_triggers(connection)
+        drop_frontpage_triggers(connection)
+    try:
+        comments = seed_posts(engine, rng, posts, comments_per_post, group_names, user_ids,
+                              first_ids['posts'], first_ids['comments'], max_depth, days, progress)
+    finally:
+        with engine.begin() as connection:
+            create_search_schema(connection)
+            create_frontpage_schema(connection)
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+        rebuild_frontpage(connection)
+        connection.exec_driver_sql('ANALYZE')
+
+    return {
+        "users": users,
+        "subllmits": subllmits,
+        "posts": posts,
+        "comments": comments,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the LLMit database with synthetic users, posts and comments.")
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help="Preset the other counts start from.")
+    parser.add_argument('--users', type=int, help="Number of users to create.")
+    parser.add_argument('--subllmits', type=int, help="Number of subllmits to create.")
+    parser.add_argument('--posts', type=int, help="Number of posts to create.")
+    parser.add_argument('--comments-per-post', type=float, help="Average comments per post.")
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, help="Deepest reply level in a thread.")
+    parser.add_argument('--days', type=int, default=DAYS, help="Spread post timestamps over this many days.")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed; the same seed gives the same world.")
+    args = parser.parse_args()
+
+    counts = dict(SIZES[args.size])
+    for name in counts:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"Seeding {counts['users']} users, {counts['subllmits']} subllmits and "
+              f"{counts['posts']} posts (~{counts['comments_per_post']} comments each)...")
+        result = seed(db.engine, seed=args.seed, max_depth=args.max_depth, days=args.days, **counts)
+    print(f"Seeded {result['posts']} posts and {result['comments']} comments in {result['seconds']}s.")
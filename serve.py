@@ -0,0 +1,36 @@
+import argparse
+
+# Production-style server for LLMit.
+#
+# With gevent installed (pip install gevent) every request, including each
+# open /api/stream connection, runs on a greenlet, so thousands of idle live
+# feeds cost a little memory each instead of a thread each. Without gevent it
+# falls back to Flask's threaded server, one thread per open tab, which is
+# fine for a few dozen of them (gevent is in requirements.txt).
+#
+#   python serve.py --port 5000
+
+try:
+    # Must run before anything else imports socket, threading or ssl
+    from gevent import monkey
+    monkey.patch_all()
+    from gevent.pywsgi import WSGIServer
+except ImportError:
+    WSGIServer = None
+
+from app import create_app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve LLMit.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_app()
+    if WSGIServer is not None:
+        print(f"Serving LLMit with gevent on http://{args.host}:{args.port}")
+        WSGIServer((args.host, args.port), app).serve_forever()
+    else:
+        print("gevent is not installed; falling back to the threaded server "
+              "(each live feed holds a thread).")
+        app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+from sqlalchemy.pool import QueuePool
+
+# One SQLite connection profile shared by app.py, populate_db.py, create_bots.py
+# and initialize_db.py. WAL lets the web server keep reading instance/llmit.db
+# while the populator writes to it; busy_timeout makes writers queue up instead
+# of failing with "database is locked". Every value can be overridden with an
+# LLMIT_SQLITE_* environment variable.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get('LLMIT_DB', os.path.join(BASE_DIR, 'instance', 'llmit.db'))
+
+BUSY_TIMEOUT_MS = int(os.environ.get('LLMIT_SQLITE_BUSY_TIMEOUT_MS', 10000))
+
+PRAGMAS = {
+    'journal_mode': os.environ.get('LLMIT_SQLITE_JOURNAL_MODE', 'WAL'),
+    'busy_timeout': BUSY_TIMEOUT_MS,
+    'synchronous': os.environ.get('LLMIT_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('LLMIT_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Negative values are KiB rather than pages: -65536 is a 64 MiB page cache
+    'cache_size': int(os.environ.get('LLMIT_SQLITE_CACHE_SIZE', -65536)),
+    'temp_store': os.environ.get('LLMIT_SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# Roughly one connection per server thread, plus a few for background flushes
+POOL_SIZE = int(os.environ.get('LLMIT_SQLITE_POOL_SIZE', 8))
+MAX_OVERFLOW = int(os.environ.get('LLMIT_SQLITE_MAX_OVERFLOW', 8))
+
+def apply_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+def connect(path=DB_PATH):
+    # For the scripts that talk to sqlite3 directly
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    apply_pragmas(connection)
+    return connection
+
+def engine_options():
+    # Passed to Flask-SQLAlchemy as SQLALCHEMY_ENGINE_OPTIONS
+    return {
+        'poolclass': QueuePool,
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': BUSY_TIMEOUT_MS / 1000,
+        'connect_args': {'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+    }
+
+def active_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    active = {name: cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in PRAGMAS}
+    cursor.close()
+    return active
+
+def print_pragmas(active):
+    for name, value in active.items():
+        print(f"{name:>14} = {value}  (configured: {PRAGMAS[name]})")
+
+if __name__ == "__main__":
+    # python sqlite_profile.py: show which pragmas a connection actually ends up with
+    print(f"Database: {DB_PATH}")
+    connection = connect()
+    print_pragmas(active_pragmas(connection))
+    connection.close()
@@ -3,7 +3,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const llmitNavigation = document.getElementById('llmit-navigation');
     const backButton = document.getElementById('back-button');
     const sortTopButton = document.getElementById('sort-top');
+    const sortHotButton = document.getElementById('sort-hot');
     const sortNewButton = document.getElementById('sort-new');
+    const sortActiveButton = document.getElementById('sort-active');
     const searchSubllmitsInput = document.getElementById('search-subllmits');
 
     const createSubllmitBtn = document.getElementById('create-subllmit-btn');
@@ -18,6 +20,10 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentPage = 1;
     let currentSort = 'top';
     const postsPerPage = 10;
+    // pageCursors[n - 1] is the keyset cursor that fetches page n
+    let pageCursors = [''];
+    // Post images are at most 512px wide; narrow screens can make do with the thumbnails
+    const imageSizes = '(max-width: 600px) 100vw, 512px';
 
     function isMainPage() {
         return currentGroup === null || currentGroup === 'frontpage';
@@ -48,17 +54,38 @@ document.addEventListener('DOMContentLoaded', () => {
     function loadSubllmits() {
         fetch('/api/subllmits/all')
             .then(response => response.json())
-            .then(subllmits => {
-                llmitNavigation.innerHTML = '';
-                subllmits.forEach(subllmit => {
-                    const groupItem = document.createElement('li');
-                    groupItem.innerHTML = `<a href="#" data-group="${subllmit.name}">${subllmit.name}</a>`;
-                    llmitNavigation.appendChild(groupItem);
-                });
-            })
+            .then(renderSubllmitLinks)
             .catch(error => console.error('Error loading subllmits:', error));
     }
 
+    function renderSubllmitLinks(subllmits) {
+        llmitNavigation.innerHTML = '';
+        subllmits.forEach(subllmit => {
+            const groupItem = document.createElement('li');
+            groupItem.innerHTML = `<a href="#" data-group="${subllmit.name}">${subllmit.name}</a>`;
+            llmitNavigation.appendChild(groupItem);
+        });
+    }
+
+    // Narrow the navigation to subllmits whose name starts with the search text
+    let searchTimer = null;
+    if (searchSubllmitsInput) {
+        searchSubllmitsInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                const query = searchSubllmitsInput.value.trim();
+                if (!query) {
+                    loadSubllmits();
+                    return;
+                }
+                fetch(`/api/subllmits?query=${encodeURIComponent(query)}`)
+                    .then(response => response.json())
+                    .then(renderSubllmitLinks)
+                    .catch(error => console.error('Error searching subllmits:', error));
+            }, 200);
+        });
+    }
+
     llmitNavigation.addEventListener('click', (event) => {
         if (event.target.tagName === 'A') {
             event.preventDefault();
@@ -74,12 +101,24 @@ document.addEventListener('DOMContentLoaded', () => {
         loadGroupPosts(currentGroup || 'frontpage', currentSort);
     });
 
+    sortHotButton.addEventListener('click', () => {
+        currentSort = 'hot';
+        currentPage = 1;
+        loadGroupPosts(currentGroup || 'frontpage', currentSort);
+    });
+
     sortNewButton.addEventListener('click', () => {
         currentSort = 'new';
         currentPage = 1;
         loadGroupPosts(currentGroup || 'frontpage', currentSort);
     });
 
+    sortActiveButton.addEventListener('click', () => {
+        currentSort = 'active';
+        currentPage = 1;
+        loadGroupPosts(currentGroup || 'frontpage', currentSort);
+    });
+
     backButton.addEventListener('click', () => {
         backButton.style.display = 'none';
         currentPage = 1;
@@ -116,48 +155,30 @@ document.addEventListener('DOMContentLoaded', () => {
     function loadGroupPosts(group, sort = 'top', page = 1) {
         currentGroup = group;
         currentPage = page;
+        if (page === 1) {
+            pageCursors = [''];
+        }
         updateActionButtons();
 
-        let url = `/api/posts?group=${group}&sort=${sort}&page=${page}&limit=${postsPerPage}`;
-        if (sort === 'new') {
-            url += '&order=desc'; // Ensure that the posts are ordered by creation time descending
-        }
+        const cursor = encodeURIComponent(pageCursors[page - 1]);
+        const url = `/api/posts?group=${group}&sort=${sort}&limit=${postsPerPage}&cursor=${cursor}`;
 
         fetch(url)
             .then(response => response.json())
-            .then(posts => {
+            .then(result => {
+                const posts = result.posts;
+                pageCursors[page] = result.next_cursor;
                 postList.innerHTML = '';
                 if (posts.length === 0) {
                     postList.innerHTML = '<p>No posts available for this group.</p>';
-                    updatePaginationButtons(0);
+                    updatePaginationButtons(false);
                     return;
                 }
-                posts.forEach(post => {
-                    const postElement = document.createElement('div');
-                    postElement.className = 'post';
-                    postElement.innerHTML = `
-                        <div class="post-header">
-                            <span class="title">${post.title}</span>
-                            <span class="group">in ${post.group}</span>
-                            <span class="author">by ${post.author}</span>
-                        </div>
-                        <div class="post-body">
-                            ${post.image_url ? `<img src="${post.image_url}" alt="Post Image" class="post-image">` : ''}
-                            <p>${post.content}</p>
-                        </div>
-                        <button class="load-comments-btn" data-post-id="${post.id}">Load Comments</button>
-                        <button class="reply-post-btn" data-post-id="${post.id}">Reply to Post</button>
-                        <div class="comments" id="comments-${post.id}"></div>
-                        <div class="reply-form-container" id="reply-form-${post.id}" style="display: none;">
-                            <textarea class="reply-content" placeholder="Write your reply..."></textarea>
-                            <button class="submit-reply-btn" data-post-id="${post.id}">Submit Reply</button>
-                        </div>
-                    `;
-                    postList.appendChild(postElement);
-                });
+                posts.forEach(post => postList.appendChild(renderPost(post)));
+                connectLiveFeed();
 
                 // Update pagination buttons visibility
-                updatePaginationButtons(posts.length);
+                updatePaginationButtons(Boolean(result.next_cursor));
             })
             .catch(error => {
                 console.error('Error loading posts:', error);
@@ -165,8 +186,44 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
-    function updatePaginationButtons(postCount) {
-        nextPageButton.style.display = postCount === postsPerPage ? 'block' : 'none';
+    // The WebP/AVIF copies listed in image_srcset, with the original as the fallback
+    function renderImage(post) {
+        if (!post.image_url) {
+            return '';
+        }
+        const sources = (post.image_srcset || [])
+            .map(source => `<source type="${source.type}" srcset="${source.srcset}" sizes="${imageSizes}">`)
+            .join('');
+        return `<picture>${sources}<img src="${post.image_url}" alt="Post Image" class="post-image" loading="lazy" decoding="async"></picture>`;
+    }
+
+    function renderPost(post) {
+        const postElement = document.createElement('div');
+        postElement.className = 'post';
+        postElement.innerHTML = `
+            <div class="post-header">
+                <span class="title">${post.title}</span>
+                <span class="group">in ${post.group}</span>
+                <span class="author">by ${post.author}</span>
+                <span class="score" id="score-${post.id}" data-score="${post.score}">${post.score} points</span>
+            </div>
+            <div class="post-body">
+                ${renderImage(post)}
+                <p>${post.content}</p>
+            </div>
+            <button class="load-comments-btn" data-post-id="${post.id}" data-comment-count="${post.comment_count}">Load Comments (${post.comment_count})</button>
+            <button class="reply-post-btn" data-post-id="${post.id}">Reply to Post</button>
+            <div class="comments" id="comments-${post.id}"></div>
+            <div class="reply-form-container" id="reply-form-${post.id}" style="display: none;">
+                <textarea class="reply-content" placeholder="Write your reply..."></textarea>
+                <button class="submit-reply-btn" data-post-id="${post.id}">Submit Reply</button>
+            </div>
+        `;
+        return postElement;
+    }
+
+    function updatePaginationButtons(hasNextPage) {
+        nextPageButton.style.display = hasNextPage ? 'block' : 'none';
         previousPageButton.style.display = currentPage > 1 ? 'block' : 'none';
     }
 
@@ -191,6 +248,7 @@ document.addEventListener('DOMContentLoaded', () => {
             .then(comments => {
                 const commentsContainer = document.getElementById(`comments-${postId}`);
                 commentsContainer.innerHTML = '';
+                commentsContainer.dataset.loaded = 'true';
                 if (comments.length === 0) {
                     commentsContainer.innerHTML = '<p>No comments yet.</p>';
                     return;
@@ -203,10 +261,35 @@ document.addEventListener('DOMContentLoaded', () => {
             .catch(error => console.error('Error loading comments:', error));
     }
 
+    // Continuation nodes stand in for subtrees the server cut off
+    function renderLoadMore(more, depth) {
+        const moreElement = document.createElement('button');
+        moreElement.className = 'load-more-comments-btn';
+        moreElement.style.marginLeft = `${depth * 20}px`;
+        moreElement.textContent = `Load ${more.count} more ${more.count === 1 ? 'reply' : 'replies'}`;
+        moreElement.addEventListener('click', () => {
+            fetch(`/api/posts/${more.post_id}/comments?cursor=${encodeURIComponent(more.cursor)}`)
+                .then(response => response.json())
+                .then(comments => {
+                    const fragment = document.createDocumentFragment();
+                    comments.forEach(comment => fragment.appendChild(renderComment(comment, depth)));
+                    moreElement.replaceWith(fragment);
+                })
+                .catch(error => console.error('Error loading more comments:', error));
+        });
+        return moreElement;
+    }
+
     function renderComment(comment, depth = 0) {
+        if (comment.type === 'more') {
+            return renderLoadMore(comment, depth);
+        }
+
         const commentElement = document.createElement('div');
         commentElement.className = 'comment';
         commentElement.style.marginLeft = `${depth * 20}px`;
+        commentElement.dataset.commentId = comment.id;
+        commentElement.dataset.depth = depth;
 
         commentElement.innerHTML = `
             <p>${comment.content}</p>
@@ -258,6 +341,95 @@ document.addEventListener('DOMContentLoaded', () => {
         .catch(error => console.error('Error submitting comment:', error));
     }
 
+    // Live updates: /api/stream pushes new posts, new comments and vote changes,
+    // which are patched into the page instead of refetching it
+    let liveFeed = null;
+    let unseenPosts = 0;
+    const liveNotice = document.getElementById('live-notice');
+
+    function connectLiveFeed() {
+        if (!window.EventSource) {
+            return;
+        }
+        if (liveFeed) {
+            liveFeed.close();
+        }
+        unseenPosts = 0;
+        liveNotice.style.display = 'none';
+        const params = new URLSearchParams({ group: currentGroup || 'frontpage' });
+        postList.querySelectorAll('.load-comments-btn').forEach(button => {
+            params.append('post_id', button.getAttribute('data-post-id'));
+        });
+        liveFeed = new EventSource(`/api/stream?${params}`);
+        liveFeed.addEventListener('post', event => onLivePost(JSON.parse(event.data)));
+        liveFeed.addEventListener('comment', event => onLiveComment(JSON.parse(event.data)));
+        liveFeed.addEventListener('vote', event => onLiveVote(JSON.parse(event.data)));
+    }
+
+    function onLivePost(post) {
+        if (!isMainPage() && post.group !== currentGroup) {
+            return;
+        }
+        if (currentSort === 'new' && currentPage === 1) {
+            const placeholder = postList.querySelector(':scope > p');
+            if (placeholder) {
+                placeholder.remove();
+            }
+            postList.prepend(renderPost(post));
+        } else {
+            // Other orders would reshuffle the page; offer a refresh instead
+            unseenPosts++;
+            liveNotice.textContent = `${unseenPosts} new ${unseenPosts === 1 ? 'post' : 'posts'} - click to show`;
+            liveNotice.style.display = 'block';
+        }
+    }
+
+    function onLiveComment(comment) {
+        const button = postList.querySelector(`.load-comments-btn[data-post-id="${comment.post_id}"]`);
+        if (!button) {
+            return;
+        }
+        const count = parseInt(button.dataset.commentCount, 10) + 1;
+        button.dataset.commentCount = count;
+        button.textContent = `Load Comments (${count})`;
+
+        const commentsContainer = document.getElementById(`comments-${comment.post_id}`);
+        // Skip comments the container already shows, e.g. after reloading it for our own reply
+        if (commentsContainer.dataset.loaded !== 'true' ||
+            commentsContainer.querySelector(`.comment[data-comment-id="${comment.id}"]`)) {
+            return;
+        }
+        if (comment.parent_comment_id === null) {
+            const placeholder = commentsContainer.querySelector(':scope > p');
+            if (placeholder) {
+                placeholder.remove();
+            }
+            commentsContainer.appendChild(renderComment(comment));
+            return;
+        }
+        const parent = commentsContainer.querySelector(`.comment[data-comment-id="${comment.parent_comment_id}"]`);
+        if (parent) {
+            parent.appendChild(renderComment(comment, parseInt(parent.dataset.depth, 10) + 1));
+        }
+    }
+
+    function onLiveVote(vote) {
+        if (vote.target !== 'post') {
+            return;
+        }
+        const score = document.getElementById(`score-${vote.id}`);
+        if (score) {
+            const value = parseInt(score.dataset.score, 10) + vote.up - vote.down;
+            score.dataset.score = value;
+            score.textContent = `${value} points`;
+        }
+    }
+
+    liveNotice.addEventListener('click', () => {
+        currentPage = 1;
+        loadGroupPosts(currentGroup || 'frontpage', currentSort);
+    });
+
     // Load next page
     if (nextPageButton) {
         nextPageButton.addEventListener('click', () => {
@@ -277,5 +449,17 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     loadSubllmits();
-    loadGroupPosts('frontpage', currentSort);
+
+    // The server renders the first page of the frontpage; only fetch if it did not
+    if (postList.dataset.prerendered === 'true') {
+        currentGroup = postList.dataset.group;
+        currentSort = postList.dataset.sort;
+        currentPage = parseInt(postList.dataset.page, 10);
+        pageCursors[currentPage] = postList.dataset.nextCursor;
+        updateActionButtons();
+        updatePaginationButtons(Boolean(postList.dataset.nextCursor));
+        connectLiveFeed();
+    } else {
+        loadGroupPosts('frontpage', currentSort);
+    }
 });
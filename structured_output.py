@@ -0,0 +1,214 @@
+import json
+import threading
+
+# JSON answers from the model, streamed and cut off as soon as they are complete.
+#
+# The populators ask for a JSON object and used to wait for the whole
+# completion before pulling the object out of it with a regex. A model that
+# keeps talking after the closing brace ("Hope this helps! Here is another
+# one...") spends its whole max_tokens on text that is thrown away, and a
+# regex can't find the end of an object with nested braces or a "}" inside a
+# string anyway.
+#
+# generate_json() streams the completion through a JSONScanner, which tracks
+# string and nesting state character by character and reports the moment the
+# top-level object (or array) closes; the stream is closed right there, so
+# the server stops generating. The value is then checked for its required
+# fields, and an answer that doesn't parse or misses a field is asked for
+# again, up to `retries` more times.
+#
+# Every attempt is counted in a StructuredStats: tokens streamed, tokens
+# spent on answers that were thrown away, parse and validation failures, and
+# how many streams were cut short. Tokens are counted as streamed chunks,
+# which is one token per chunk on llama.cpp and LM Studio; a stream that runs
+# to its end and reports usage is counted from that instead.
+
+RETRIES = 2
+
+
+class JSONScanner:
+    # Incremental matcher for the first top-level JSON value opened with `opening`
+    def __init__(self, opening='{'):
+        self.opening = opening
+        self.closing = '}' if opening == '{' else ']'
+        self.text = ''
+        self.start = None
+        self.end = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        # Returns True once the value is complete; text after it is ignored
+        if self.end is not None:
+            return True
+        offset = len(self.text)
+        self.text += text
+        for index in range(offset, len(self.text)):
+            char = self.text[index]
+            if self.start is None:
+                if char == self.opening:
+                    self.start = index
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = index + 1
+                    return True
+        return False
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    def value_text(self):
+        if self.start is None:
+            return None
+        return self.text[self.start:self.end]
+
+
+class StructuredStats:
+    # Shared by the generation threads
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.succeeded = 0
+        self.gave_up = 0
+        self.parse_failures = 0
+        self.invalid = 0
+        self.early_stops = 0
+        self.tokens = 0
+        self.wasted_tokens = 0
+        self._lock = threading.Lock()
+
+    def record_attempt(self, tokens, outcome, stopped_early):
+        # outcome is 'ok', 'parse' or 'invalid'
+        with self._lock:
+            self.attempts += 1
+            self.tokens += tokens
+            if stopped_early:
+                self.early_stops += 1
+            if outcome == 'parse':
+                self.parse_failures += 1
+            elif outcome == 'invalid':
+                self.invalid += 1
+            if outcome != 'ok':
+                self.wasted_tokens += tokens
+
+    def record_call(self, succeeded):
+        with self._lock:
+            self.calls += 1
+            if succeeded:
+                self.succeeded += 1
+            else:
+                self.gave_up += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "structured_calls_total": self.calls,
+                "structured_attempts_total": self.attempts,
+                "structured_gave_up_total": self.gave_up,
+                "structured_parse_failures_total": self.parse_failures,
+                "structured_invalid_total": self.invalid,
+                "structured_early_stops_total": self.early_stops,
+                "structured_tokens_total": self.tokens,
+                "structured_wasted_tokens_total": self.wasted_tokens,
+            }
+
+    def summary(self):
+        with self._lock:
+            if not self.attempts:
+                return "Structured output: no JSON requests."
+            failures = self.parse_failures + self.invalid
+            return (f"Structured output: {self.succeeded}/{self.calls} calls usable in {self.attempts} attempts, "
+                    f"{self.parse_failures / self.attempts:.0%} unparseable, {self.invalid} missing fields, "
+                    f"{self.tokens} tokens ({self.tokens / self.attempts:.0f} per attempt, "
+                    f"{self.wasted_tokens} wasted on {failures} failed attempts), "
+                    f"{self.early_stops} streams stopped early.")
+
+
+def missing_fields(value, required):
+    # Required fields must be present and, for strings, not blank
+    if not isinstance(value, dict):
+        return list(required) or ['(object)']
+    return [name for name in required
+            if value.get(name) is None or (isinstance(value[name], str) and not value[name].strip())]
+
+
+def stream_value(client, request, opening='{'):
+    # One streamed completion; returns (scanner, tokens, stopped_early)
+    stream = client.chat.completions.create(**request, stream=True)
+    scanner = JSONScanner(opening)
+    tokens = 0
+    usage = None
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                tokens += 1
+                if scanner.feed(content):
+                    # Everything after the closing brace would be thrown away; stop the server now
+                    return scanner, tokens, True
+    finally:
+        stream.close()
+    return scanner, usage if usage is not None else tokens, False
+
+def generate_json(client, stats=None, required=(), retries=RETRIES, opening='{', **request):
+    # client.chat.completions.create(**request) for a JSON object (or, with
+    # opening='[', an array of objects, each checked for `required`), streamed
+    # and stopped at the end of the value. Returns the parsed value, or None
+    # when every attempt failed. In an array, items missing a field come back
+    # as None rather than being left out, so positions the model refers to
+    # (an item answering "the 2nd one") still line up.
+    problem = None
+    for attempt in range(retries + 1):
+        scanner, tokens, stopped_early = stream_value(client, request, opening)
+        value = None
+        if not scanner.complete:
+            outcome = 'parse'
+            problem = (f"no complete JSON value in {tokens} tokens: {scanner.text[:200]!r}"
+                       if scanner.start is not None else f"no JSON in the answer: {scanner.text[:200]!r}")
+        else:
+            try:
+                value = json.loads(scanner.value_text())
+            except ValueError as e:
+                outcome = 'parse'
+                problem = f"{e}: {scanner.value_text()[:200]!r}"
+            else:
+                if opening == '[':
+                    # Unusable items become None; the answer only fails if no item is usable
+                    value = [None if missing_fields(item, required) else item for item in value] \
+                        if isinstance(value, list) else []
+                    missing = [] if any(item is not None for item in value) \
+                        else [f"items with {', '.join(required) or 'content'}"]
+                else:
+                    missing = missing_fields(value, required)
+                outcome = 'invalid' if missing else 'ok'
+                problem = f"missing {', '.join(missing)}: {scanner.value_text()[:200]!r}" if missing else None
+        if stats is not None:
+            stats.record_attempt(tokens, outcome, stopped_early)
+        if outcome == 'ok':
+            if stats is not None:
+                stats.record_call(True)
+            return value
+        print(f"Unusable JSON (attempt {attempt + 1} of {retries + 1}): {problem}")
+    if stats is not None:
+        stats.record_call(False)
+    return None
@@ -0,0 +1,37 @@
+import pytest
+from app import create_app, create_tables, db
+
+# Test apps keep the response cache and the frontpage rebuild thread out of the way
+TEST_CONFIG = {
+    'RESPONSE_CACHE_ENABLED': False,
+    'FRONTPAGE_REBUILD_INTERVAL': 0,
+}
+
+
+@pytest.fixture(scope='session')
+def make_app():
+    # Builds an app with its tables on a file database at `path`; `config` is
+    # applied over TEST_CONFIG
+    def make(path, **config):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}", **TEST_CONFIG, **config})
+        create_tables(app)
+        return app
+    return make
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / 'llmit.db'
+
+@pytest.fixture
+def app_config():
+    # Overridden by test modules that need more settings
+    return {}
+
+@pytest.fixture
+def app(make_app, db_path, app_config):
+    return make_app(db_path, **app_config)
+
+@pytest.fixture
+def engine(app):
+    with app.app_context():
+        return db.engine
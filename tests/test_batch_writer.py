@@ -0,0 +1,81 @@
+import sqlite3
+import pytest
+from sqlalchemy import event
+from app import db, Comment, Post, Subllmit, User
+from batch_writer import BatchWriter
+
+
+@pytest.fixture
+def writer(app):
+    # A writer that only flushes when told to
+    with app.app_context():
+        db.session.add(User(username='bot', password='x'))
+        db.session.commit()
+        return BatchWriter(db.engine, Post, Comment, Subllmit, max_rows=10 ** 6, max_age=3600)
+
+def queue_thread(writer):
+    # A new subllmit and post with a three-level thread, plus a reply to its first comment queued on its own
+    writer.add_subllmit('science')
+    post = writer.add_post('science', 'A post', 'Text', user_id=1)
+    thread = writer.add_comments(post, [
+        {'content': 'top', 'user_id': 1},
+        {'content': 'reply', 'user_id': 1, 'parent': 0},
+        {'content': 'reply to reply', 'user_id': 1, 'parent': 1},
+        {'content': 'second top', 'user_id': 1},
+    ])
+    late = writer.add_comment(post, 'late reply', user_id=1, parent=thread[0])
+    return post, thread + [late]
+
+def stored_thread(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return dict(connection.execute('SELECT content, parent_comment_id FROM comments').fetchall()), \
+               dict(connection.execute('SELECT content, id FROM comments').fetchall())
+
+
+def test_thread_is_inserted_a_level_at_a_time(app, db_path, writer):
+    post, comments = queue_thread(writer)
+
+    comment_inserts = []
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO comments'):
+                comment_inserts.append(statement)
+
+    assert writer.flush() == 7
+    # Top-level comments, their replies, and the reply to a reply
+    assert len(comment_inserts) == 3
+    assert all('RETURNING' in statement for statement in comment_inserts)
+
+    parents, ids = stored_thread(db_path)
+    assert [comment.id for comment in comments] == [ids[comment.row['content']] for comment in comments]
+    assert parents == {
+        'top': None,
+        'reply': ids['top'],
+        'reply to reply': ids['reply'],
+        'second top': None,
+        'late reply': ids['top'],
+    }
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute('SELECT post_id FROM comments').fetchall() == [(post.id,)] * 5
+        assert connection.execute('SELECT comment_count FROM posts').fetchone() == (5,)
+
+
+def test_failed_batch_is_kept_and_rewritten(db_path, writer):
+    post, comments = queue_thread(writer)
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('ALTER TABLE comments RENAME TO comments_away')
+    assert writer.flush() == 0
+    assert writer.pending() == 7
+    # Ids handed out inside the rolled back transaction are forgotten
+    assert post.id is None and all(comment.id is None for comment in comments)
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('ALTER TABLE comments_away RENAME TO comments')
+    assert writer.flush() == 7
+    assert writer.pending() == 0
+    parents, ids = stored_thread(db_path)
+    assert parents['reply to reply'] == ids['reply'] and parents['late reply'] == ids['top']
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM posts').fetchone() == (1,)
@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy import event
+from app import db, encode_cursor, Comment, Post, Subllmit
+
+
+@pytest.fixture
+def thread(app):
+    # Five top-level comments; the first has a four-deep chain of replies.
+    # Returns the post id and {name: comment id}
+    with app.app_context():
+        db.session.add(Subllmit(name='science'))
+        post = Post(group_name='science', title='Discuss')
+        db.session.add(post)
+        db.session.commit()
+        ids = {}
+        for n in range(5):
+            comment = Comment(post_id=post.id, content=f'top {n}')
+            db.session.add(comment)
+            db.session.commit()
+            ids[f'top {n}'] = comment.id
+        parent = ids['top 0']
+        for depth in range(1, 5):
+            comment = Comment(post_id=post.id, parent_comment_id=parent, content=f'reply {depth}')
+            db.session.add(comment)
+            db.session.commit()
+            ids[f'reply {depth}'] = parent = comment.id
+        return post.id, ids
+
+def get_tree(client, post_id, **args):
+    query = '&'.join(f'{name}={value}' for name, value in args.items())
+    response = client.get(f'/api/posts/{post_id}/comments?{query}')
+    assert response.status_code == 200
+    return response.get_json()
+
+def comment_ids(nodes):
+    # Every comment in a tree, depth first, leaving out the "more" nodes
+    ids = []
+    for node in nodes:
+        if node.get('type') != 'more':
+            ids.append(node['id'])
+            ids += comment_ids(node['children'])
+    return ids
+
+def more_nodes(nodes):
+    found = []
+    for node in nodes:
+        if node.get('type') == 'more':
+            found.append(node)
+        else:
+            found += more_nodes(node['children'])
+    return found
+
+
+def test_limits_leave_more_nodes_with_counts(app, thread):
+    post_id, ids = thread
+    tree = get_tree(app.test_client(), post_id, max_depth=2, max_children=2)
+
+    assert [node.get('id') for node in tree] == [ids['top 0'], ids['top 1'], None]
+    siblings = tree[-1]
+    assert siblings['type'] == 'more' and siblings['count'] == 3
+    assert siblings['parent_comment_id'] is None and siblings['level'] == 0
+
+    # Two levels are shown; what lies below the second is one "more" node
+    reply = tree[0]['children'][0]
+    assert reply['id'] == ids['reply 1'] and reply['level'] == 1
+    assert reply['children'] == [{
+        'type': 'more', 'post_id': post_id, 'parent_comment_id': ids['reply 1'], 'count': 1,
+        'cursor': reply['children'][0]['cursor'], 'level': 2,
+    }]
+    assert tree[1]['children'] == []
+
+
+def test_following_continuations_returns_the_missing_comments(app, thread):
+    post_id, ids = thread
+    client = app.test_client()
+    tree = get_tree(client, post_id, max_depth=2, max_children=2)
+    seen = comment_ids(tree)
+    pending = more_nodes(tree)
+
+    while pending:
+        more = pending.pop()
+        page = get_tree(client, post_id, max_depth=2, max_children=2, cursor=more['cursor'])
+        # A continuation picks up at the level it was cut off at
+        assert {node['level'] for node in page} == {more['level']}
+        new = comment_ids(page)
+        assert not set(new) & set(seen)
+        seen += new
+        pending += more_nodes(page)
+
+    assert sorted(seen) == sorted(ids.values())
+
+    # The depth continuation under reply 1 is exactly the rest of the chain
+    cursor = encode_cursor([ids['reply 1'], 0, 2])
+    assert comment_ids(get_tree(client, post_id, cursor=cursor)) == [ids['reply 2'], ids['reply 3'], ids['reply 4']]
+
+
+def test_continuation_loads_only_its_subtree(app, thread):
+    post_id, ids = thread
+    loaded = []
+    def on_load(comment, context):
+        loaded.append(comment.id)
+    event.listen(Comment, 'load', on_load)
+    try:
+        # The sibling continuation after top 0 and top 1, two at a time
+        cursor = encode_cursor([None, 2, 0])
+        tree = get_tree(app.test_client(), post_id, max_children=2, cursor=cursor)
+    finally:
+        event.remove(Comment, 'load', on_load)
+
+    assert comment_ids(tree) == [ids['top 2'], ids['top 3']]
+    assert sorted(loaded) == [ids['top 2'], ids['top 3']]
+    assert tree[-1]['type'] == 'more' and tree[-1]['count'] == 1
+
+
+@pytest.mark.parametrize('values', [
+    ['1', 0, 0],        # parent_id must be an id or null
+    [[1], 0, 0],
+    [1.5, 0, 0],
+    [None, -1, 0],      # offsets and levels can't be negative
+    [None, 0, -2],
+    [None, 'x', 0],
+    [None, 0],          # three values, no more, no fewer
+    {'parent_id': None},
+])
+def test_bad_cursors_are_rejected(app, thread, values):
+    post_id, _ = thread
+    response = app.test_client().get(f'/api/posts/{post_id}/comments?cursor={encode_cursor(values)}')
+    assert response.status_code == 400
+
+
+def test_garbled_cursor_is_rejected(app, thread):
+    post_id, _ = thread
+    assert app.test_client().get(f'/api/posts/{post_id}/comments?cursor=not-a-cursor').status_code == 400
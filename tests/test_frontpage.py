@@ -0,0 +1,122 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from app import db, Post, Subllmit
+from frontpage import PER_SUBLLMIT, rebuild_frontpage
+
+# A subllmit with more posts than the frontpage keeps, and three quiet ones
+GROUPS = {'science': PER_SUBLLMIT + 15, 'books': 3, 'funny': 2, 'art': 2}
+
+
+@pytest.fixture
+def posts(app):
+    # Returns {post id: subllmit}; votes are drawn from a few values so ranks tie
+    rng = random.Random(5)
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.session.add_all([Subllmit(name=name) for name in GROUPS])
+        for name, count in GROUPS.items():
+            for _ in range(count):
+                db.session.add(Post(group_name=name, title=f'{name} post', upvotes=rng.choice((0, 3, 3, 8)),
+                                    downvotes=0, timestamp=start + timedelta(hours=rng.randint(0, 3))))
+        db.session.commit()
+        return {post.id: post.group_name for post in Post.query}
+
+def frontpage_rows(connection):
+    return connection.exec_driver_sql(
+        'SELECT sort, post_id, group_name, rank, tier FROM frontpage ORDER BY sort, post_id').fetchall()
+
+def listed(rows, sort, group):
+    return [post_id for row_sort, post_id, row_group, _, _ in rows if (row_sort, row_group) == (sort, group)]
+
+def assert_matches_rebuild(engine):
+    with engine.begin() as connection:
+        maintained = frontpage_rows(connection)
+        rebuild_frontpage(connection)
+        assert frontpage_rows(connection) == maintained
+
+def vote(post_id, upvotes=0, downvotes=0):
+    post = db.session.get(Post, post_id)
+    post.upvotes += upvotes
+    post.downvotes += downvotes
+    db.session.commit()
+
+def walk(client, sort, limit):
+    ids, cursor = [], ''
+    while cursor is not None:
+        page = client.get(f'/api/posts?sort={sort}&limit={limit}&cursor={cursor}').get_json()
+        ids += [post['id'] for post in page['posts']]
+        cursor = page['next_cursor']
+    return ids
+
+
+def test_triggers_keep_the_table_in_step_with_a_rebuild(app, engine, posts):
+    with engine.begin() as connection:
+        rebuild_frontpage(connection)
+    science = [post_id for post_id, group in posts.items() if group == 'science']
+    books = [post_id for post_id, group in posts.items() if group == 'books']
+
+    with app.app_context():
+        # New posts, in the crowded subllmit and a quiet one
+        db.session.add_all([Post(group_name='science', title='Late but loved', upvotes=50, downvotes=0),
+                            Post(group_name='art', title='New art', upvotes=1, downvotes=0)])
+        db.session.commit()
+        assert_matches_rebuild(engine)
+
+        # Upvotes anywhere, downvotes where nothing was trimmed
+        vote(science[-1], upvotes=100)
+        vote(science[0], upvotes=1)
+        vote(books[0], downvotes=20)
+        assert_matches_rebuild(engine)
+
+        # A deleted post leaves, and its subllmit's tiers close up
+        db.session.delete(db.session.get(Post, books[1]))
+        db.session.commit()
+        assert_matches_rebuild(engine)
+
+
+def test_rebuild_promotes_posts_the_triggers_trimmed(app, engine, posts):
+    with engine.begin() as connection:
+        rebuild_frontpage(connection)
+        top = connection.exec_driver_sql(
+            "SELECT post_id FROM frontpage WHERE sort = 'top' AND group_name = 'science' "
+            "ORDER BY rank DESC, post_id DESC LIMIT 1").scalar()
+    with app.app_context():
+        vote(top, downvotes=100)
+    # The triggers keep the sunk post, as they can't bring back a post they
+    # trimmed earlier to take its place; the periodic rebuild does
+    with engine.begin() as connection:
+        maintained = frontpage_rows(connection)
+        rebuild_frontpage(connection)
+        rebuilt = frontpage_rows(connection)
+    maintained, rebuilt = listed(maintained, 'top', 'science'), listed(rebuilt, 'top', 'science')
+    assert top in maintained and top not in rebuilt
+    assert len(maintained) == len(rebuilt) == PER_SUBLLMIT
+
+
+@pytest.mark.parametrize('sort', ['top', 'hot'])
+def test_no_subllmit_fills_a_page(app, engine, posts, sort):
+    client = app.test_client()
+    ids = walk(client, sort, limit=len(GROUPS))
+    shown = [posts[post_id] for post_id in ids]
+    assert shown.count('science') == PER_SUBLLMIT
+    for name in GROUPS:
+        assert shown.count(name) == min(GROUPS[name], PER_SUBLLMIT)
+
+    # Every subllmit gets a post per round while it has posts left
+    rounds = [shown[n:n + len(GROUPS)] for n in range(0, 2 * len(GROUPS), len(GROUPS))]
+    assert all(sorted(page) == sorted(GROUPS) for page in rounds)
+    assert shown[2 * len(GROUPS):].count('science') > 0
+    assert 'funny' not in shown[2 * len(GROUPS):]
+
+
+@pytest.mark.parametrize('sort', ['top', 'hot'])
+@pytest.mark.parametrize('limit', [1, 3, 10])
+def test_cursor_walks_the_whole_table_once(app, engine, posts, sort, limit):
+    with engine.connect() as connection:
+        table = [row[0] for row in connection.exec_driver_sql(
+            'SELECT post_id FROM frontpage WHERE sort = ? ORDER BY tier DESC, rank DESC, post_id DESC',
+            (sort,))]
+    ids = walk(app.test_client(), sort, limit)
+    assert len(table) == PER_SUBLLMIT + 3 + 2 + 2
+    assert ids == table
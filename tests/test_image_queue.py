@@ -0,0 +1,86 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+import image_queue
+from image_queue import enqueue, lease, fail
+
+
+class Clock(datetime):
+    # Stands in for image_queue's datetime so leases expire when the test says
+    current = datetime(2024, 1, 1)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(image_queue, 'datetime', Clock)
+    Clock.current = datetime(2024, 1, 1)
+    return Clock
+
+def add_jobs(engine, count):
+    with engine.begin() as connection:
+        enqueue(connection, [(post_id, f'prompt {post_id}') for post_id in range(1, count + 1)])
+
+def job(engine, job_id):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql(
+            'SELECT status, attempts, worker FROM image_jobs WHERE id = ?', (job_id,)).one()
+
+
+def test_expired_lease_goes_to_another_worker(engine, clock):
+    add_jobs(engine, 1)
+    [leased] = lease(engine, 'worker-a', 5, lease_seconds=60)
+    assert lease(engine, 'worker-b', 5, lease_seconds=60) == []
+
+    clock.current += timedelta(seconds=61)
+    [released] = lease(engine, 'worker-b', 5, lease_seconds=60)
+    assert released['id'] == leased['id'] and released['attempts'] == 2
+    assert job(engine, leased['id']) == ('running', 2, 'worker-b')
+
+    # A job whose last lease runs out is failed rather than leased a fourth time
+    clock.current += timedelta(seconds=61)
+    assert len(lease(engine, 'worker-c', 5, lease_seconds=60)) == 1
+    clock.current += timedelta(seconds=61)
+    assert lease(engine, 'worker-a', 5, lease_seconds=60, max_attempts=3) == []
+    assert job(engine, leased['id'])[0] == 'failed'
+
+
+def test_failures_are_retried_up_to_the_limit(engine, clock):
+    add_jobs(engine, 1)
+    for attempt in range(1, 4):
+        [leased] = lease(engine, 'worker-a', 5, max_attempts=3)
+        assert leased['attempts'] == attempt
+        fail(engine, leased['id'], RuntimeError('out of memory'), max_attempts=3)
+        assert job(engine, leased['id'])[:2] == ('queued' if attempt < 3 else 'failed', attempt)
+
+    assert lease(engine, 'worker-a', 5, max_attempts=3) == []
+    with engine.connect() as connection:
+        assert image_queue.queue_stats(connection)['failed'] == 1
+
+
+def test_concurrent_workers_never_share_a_job(engine):
+    add_jobs(engine, 300)
+    leased = {}
+    errors = []
+
+    def work(name):
+        try:
+            while True:
+                jobs = lease(engine, name, 7)
+                if not jobs:
+                    return
+                leased.setdefault(name, []).extend(job['id'] for job in jobs)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=work, args=(f'worker-{n}',)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    ids = [job_id for jobs in leased.values() for job_id in jobs]
+    assert len(ids) == len(set(ids)) == 300
@@ -0,0 +1,41 @@
+import time
+import pytest
+from app import db, live_feed, Post, Subllmit
+
+
+@pytest.fixture
+def app_config():
+    # Poll and send keepalives often enough for the test to see them
+    return {'LIVE_POLL_INTERVAL': 0.05, 'LIVE_KEEPALIVE': 0.1}
+
+def next_event(chunks, kind, timeout=10):
+    # The next SSE message of type `kind`, skipping keepalives and other events
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if f"event: {kind}\n" in chunk:
+            return chunk
+    raise AssertionError(f"no {kind} event within {timeout}s")
+
+
+def test_frontpage_stream_delivers_new_posts(app):
+    with app.app_context():
+        db.session.add(Subllmit(name='science'))
+        existing = Post(group_name='science', title='Already on the page')
+        db.session.add(existing)
+        db.session.commit()
+        existing_id = existing.id
+
+    # The frontpage sends the ids of the posts it shows, for their comments and votes
+    response = app.test_client().get(f'/api/stream?group=frontpage&post_id={existing_id}', buffered=False)
+    chunks = iter(response.response)
+    assert 'connected' in next(chunks).decode()
+
+    with app.app_context():
+        db.session.add(Post(group_name='science', title='Brand new post'))
+        db.session.commit()
+    live_feed.notify_written()
+
+    assert 'Brand new post' in next_event(chunks, 'post')
+    response.close()
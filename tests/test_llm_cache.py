@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+import pytest
+from openai.types.chat import ChatCompletion
+from llm_cache import LLMCache, CacheMiss, request_key
+
+REQUEST = {'model': 'local', 'messages': [{'role': 'user', 'content': 'Write a post'}], 'temperature': 0.9}
+
+
+def completion(content):
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "local",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    })
+
+def counting_client():
+    # Answers "answer 0", "answer 1", ... and keeps the requests it was sent
+    sent = []
+    def create(**request):
+        sent.append(request)
+        return completion(f'answer {len(sent) - 1}')
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))), sent
+
+def answer(cache, client, request=REQUEST):
+    return cache.complete(client, dict(request)).choices[0].message.content
+
+
+def test_replay_miss_raises_without_calling_the_server(tmp_path):
+    client, sent = counting_client()
+    cache = LLMCache('replay', tmp_path / 'cache.db')
+    with pytest.raises(CacheMiss):
+        cache.complete(client, dict(REQUEST))
+    assert sent == []
+    assert cache.stats()['misses'] == 1
+
+
+def test_replay_returns_what_was_recorded_sample_by_sample(tmp_path):
+    client, sent = counting_client()
+    recording = LLMCache('record', tmp_path / 'cache.db')
+    assert [answer(recording, client) for _ in range(3)] == ['answer 0', 'answer 1', 'answer 2']
+    recording.close()
+
+    # A new run sends the same requests and gets the same sequence back
+    replay = LLMCache('replay', tmp_path / 'cache.db')
+    assert [answer(replay, client) for _ in range(3)] == ['answer 0', 'answer 1', 'answer 2']
+    assert len(sent) == 3
+    with pytest.raises(CacheMiss):
+        answer(replay, client)
+    assert replay.stats()['hits'] == 3
+
+
+def test_keys_depend_on_sample_number_but_not_transport_options(tmp_path):
+    assert request_key(REQUEST, 0) != request_key(REQUEST, 1)
+    assert request_key(REQUEST, 0) == request_key({**REQUEST, 'timeout': 30}, 0)
+    assert request_key(REQUEST, 0) != request_key({**REQUEST, 'temperature': 0.5}, 0)
+
+    # At temperature 0 every repeat is sample 0, so it is answered from the cache
+    client, sent = counting_client()
+    cache = LLMCache('record', tmp_path / 'cache.db')
+    deterministic = {**REQUEST, 'temperature': 0}
+    assert [answer(cache, client, deterministic) for _ in range(2)] == ['answer 0', 'answer 0']
+    assert len(sent) == 1
@@ -0,0 +1,77 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from app import db, Post, Subllmit
+from frontpage import PER_SUBLLMIT
+
+GROUPS = {'science': 30, 'books': 4, 'funny': 3}
+
+
+@pytest.fixture(scope='module')
+def listing(make_app, tmp_path_factory):
+    # Posts with many tied keys: few distinct scores, hot ranks and times
+    app = make_app(tmp_path_factory.mktemp('cursors') / 'llmit.db')
+    rng = random.Random(3)
+    start = datetime(2024, 1, 1)
+    rows = []
+    with app.app_context():
+        db.session.add_all([Subllmit(name=name) for name in GROUPS])
+        for name, count in GROUPS.items():
+            for _ in range(count):
+                timestamp = start + timedelta(hours=rng.randint(0, 2))
+                db.session.add(Post(group_name=name, title=f'{name} post', score=rng.choice((0, 5, 5, 10)),
+                                    hot=rng.choice((1.5, 2.5, 2.5)), timestamp=timestamp,
+                                    last_activity_at=timestamp + timedelta(minutes=rng.choice((0, 30)))))
+        db.session.commit()
+        rows = [{'id': post.id, 'group': post.group_name, 'top': post.score, 'hot': post.hot,
+                 'new': post.timestamp, 'active': post.last_activity_at} for post in Post.query]
+    return app.test_client(), rows
+
+def walk(client, group, sort, limit):
+    # Every page of a listing, following next_cursor; returns the post ids in order
+    ids, cursor = [], ''
+    while cursor is not None:
+        response = client.get(f'/api/posts?group={group}&sort={sort}&limit={limit}&cursor={cursor}')
+        assert response.status_code == 200
+        page = response.get_json()
+        ids += [post['id'] for post in page['posts']]
+        cursor = page['next_cursor']
+    return ids
+
+def expected(rows, group, sort):
+    if group != 'frontpage':
+        rows = [row for row in rows if row['group'] == group]
+    ordered = sorted(rows, key=lambda row: (row[sort], row['id']), reverse=True)
+    if group != 'frontpage' or sort not in ('top', 'hot'):
+        return [row['id'] for row in ordered]
+    # Frontpage top/hot: each subllmit's best PER_SUBLLMIT, dealt out a round at a time
+    dealt = []
+    for name in GROUPS:
+        best = [row for row in ordered if row['group'] == name][:PER_SUBLLMIT]
+        dealt += [(PER_SUBLLMIT - n, row[sort], row['id']) for n, row in enumerate(best)]
+    return [post_id for _, _, post_id in sorted(dealt, reverse=True)]
+
+
+@pytest.mark.parametrize('sort', ['top', 'hot', 'new', 'active'])
+@pytest.mark.parametrize('group', ['frontpage', 'science'])
+@pytest.mark.parametrize('limit', [1, 4])
+def test_cursor_pages_follow_the_listing_order(listing, group, sort, limit):
+    client, rows = listing
+    ids = walk(client, group, sort, limit)
+    assert len(ids) == len(set(ids))
+    assert ids == expected(rows, group, sort)
+
+
+@pytest.mark.parametrize('sort', ['top', 'hot'])
+def test_frontpage_gives_every_subllmit_a_post_per_round(listing, sort):
+    client, _ = listing
+    first_round = client.get(f'/api/posts?sort={sort}&limit={len(GROUPS)}&cursor=').get_json()['posts']
+    assert sorted(post['group'] for post in first_round) == sorted(GROUPS)
+
+
+def test_cursor_from_another_listing_is_rejected(listing):
+    client, _ = listing
+    top_cursor = client.get('/api/posts?group=science&sort=top&limit=2&cursor=').get_json()['next_cursor']
+    assert client.get(f'/api/posts?group=science&sort=hot&cursor={top_cursor}').status_code == 400
+    # A subllmit's top cursor is (score, id); the frontpage's is (tier, rank, id)
+    assert client.get(f'/api/posts?group=frontpage&sort=top&cursor={top_cursor}').status_code == 400
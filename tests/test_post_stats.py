@@ -0,0 +1,80 @@
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from app import db, Comment, Post, Subllmit
+from post_stats import record_comments
+
+
+@pytest.fixture
+def posts(app):
+    # Two posts, the first with three comments recorded the way the app records them
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.session.add(Subllmit(name='science'))
+        first = Post(group_name='science', title='Busy', timestamp=start)
+        second = Post(group_name='science', title='Quiet', timestamp=start)
+        db.session.add_all([first, second])
+        db.session.commit()
+        times = [start + timedelta(minutes=minutes) for minutes in (5, 30, 10)]
+        assert record_comments(db.session.connection(), [(first.id, at) for at in times]) == {'science'}
+        db.session.add_all([Comment(post_id=first.id, content='hi', timestamp=at) for at in times])
+        db.session.commit()
+        return first.id, second.id
+
+def summary(db_path, post_id):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute('SELECT comment_count, last_activity_at FROM posts WHERE id = ?',
+                                  (post_id,)).fetchone()
+
+
+def test_drift_is_reported_and_fixed(app, db_path, posts):
+    busy, quiet = posts
+    recorded = summary(db_path, busy)
+    assert recorded == (3, '2024-01-01 00:30:00.000000')
+    runner = app.test_cli_runner()
+    assert 'Comment counts are consistent.' in runner.invoke(args=['check-comment-counts']).output
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("UPDATE posts SET comment_count = 7, last_activity_at = '2023-06-01 00:00:00.000000' "
+                           "WHERE id = ?", (busy,))
+        connection.execute('UPDATE posts SET comment_count = 2 WHERE id = ?', (quiet,))
+
+    output = runner.invoke(args=['check-comment-counts']).output
+    assert f'post {busy}: comment_count 7, comments 3' in output
+    assert f'post {quiet}: comment_count 2, comments 0' in output
+    assert '2 posts disagree' in output
+    # Reporting alone changes nothing
+    assert summary(db_path, busy)[0] == 7
+
+    assert 'Fixed 2 posts.' in runner.invoke(args=['check-comment-counts', '--fix']).output
+    assert summary(db_path, busy) == recorded
+    assert summary(db_path, quiet) == (0, '2024-01-01 00:00:00.000000')
+    assert 'Comment counts are consistent.' in runner.invoke(args=['check-comment-counts']).output
+
+
+def test_active_listing_pages_through_posts_without_last_activity(app, db_path):
+    # Rows as an upgraded database has them: last_activity_at added, but NULL
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("INSERT INTO subllmits (name) VALUES ('old')")
+        connection.executemany(
+            "INSERT INTO posts (group_name, title, score, hot, comment_count, timestamp) "
+            "VALUES ('old', ?, 0, 0, 0, ?)",
+            [(f'post {n}', f'2024-01-0{n} 00:00:00.000000') for n in range(1, 5)])
+    client = app.test_client()
+
+    def walk():
+        ids, cursor = [], ''
+        while cursor is not None:
+            response = client.get(f'/api/posts?group=old&sort=active&limit=1&cursor={cursor}')
+            assert response.status_code == 200
+            ids += [post['id'] for post in response.get_json()['posts']]
+            cursor = response.get_json()['next_cursor']
+        return ids
+
+    # The cursor falls back to the post's timestamp instead of failing
+    assert len(walk()) == 1
+    # Upgrading fills the column, after which the listing is complete and newest first
+    app.test_cli_runner().invoke(args=['backfill-scores'])
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM posts WHERE last_activity_at IS NULL').fetchone() == (0,)
+    assert walk() == [4, 3, 2, 1]
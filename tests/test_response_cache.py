@@ -0,0 +1,67 @@
+import sqlite3
+import pytest
+from app import db, Subllmit, User
+
+
+@pytest.fixture
+def app_config():
+    return {'RESPONSE_CACHE_ENABLED': True, 'RESPONSE_CACHE_TTL': 3600}
+
+@pytest.fixture
+def client(app):
+    # A client logged in as alice, with one subllmit to post in
+    with app.app_context():
+        db.session.add(Subllmit(name='science'))
+        user = User(username='alice', password='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+def titles(client, group):
+    return [post['title'] for post in client.get(f'/api/posts?group={group}&sort=new').get_json()]
+
+
+def test_writes_invalidate_the_cached_listings(client, db_path):
+    assert titles(client, 'science') == []
+    assert [group['name'] for group in client.get('/api/subllmits/all').get_json()] == ['science']
+
+    # Rows written behind the app's back stay hidden until the TTL runs out...
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("INSERT INTO subllmits (name) VALUES ('books')")
+        connection.execute("INSERT INTO posts (group_name, title, score, hot, comment_count, timestamp) "
+                           "VALUES ('science', 'Written elsewhere', 0, 0, 0, '2024-01-01 00:00:00.000000')")
+    assert titles(client, 'science') == []
+    assert len(client.get('/api/subllmits/all').get_json()) == 1
+
+    # ...while a write through the app bumps the tags it touches
+    response = client.post('/api/posts', json={'group': 'science', 'title': 'Posted through the app'})
+    assert response.status_code == 201
+    assert sorted(titles(client, 'science')) == ['Posted through the app', 'Written elsewhere']
+    assert sorted(titles(client, 'frontpage')) == ['Posted through the app', 'Written elsewhere']
+
+    client.post('/create_subllmit', data={'subllmit_name': 'funny'})
+    assert sorted(group['name'] for group in client.get('/api/subllmits/all').get_json()) == \
+        ['books', 'funny', 'science']
+
+
+def test_matching_etag_gets_an_empty_304(client):
+    first = client.get('/api/posts?group=science&sort=new')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'no-cache'
+
+    repeat = client.get('/api/posts?group=science&sort=new', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b''
+    assert repeat.headers['ETag'] == etag
+
+    # Once the listing changes the old ETag no longer matches
+    client.post('/api/posts', json={'group': 'science', 'title': 'Something new'})
+    changed = client.get('/api/posts?group=science&sort=new', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert [post['title'] for post in changed.get_json()] == ['Something new']
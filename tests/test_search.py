@@ -0,0 +1,75 @@
+import sqlite3
+import pytest
+from app import db, Comment, Post, Subllmit
+from search import drop_search_triggers
+
+
+@pytest.fixture
+def post_ids(app):
+    # A post and a comment on it; returns their ids
+    with app.app_context():
+        db.session.add(Subllmit(name='science'))
+        post = Post(group_name='science', title='Volcanoes <erupt> loudly', content='Lava everywhere')
+        db.session.add(post)
+        db.session.commit()
+        comment = Comment(post_id=post.id, content='Great volcano photos')
+        db.session.add(comment)
+        db.session.commit()
+        return post.id, comment.id
+
+def search(client, query, kind='posts'):
+    response = client.get(f'/api/search?q={query}&type={kind}')
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+def ids(results, key='post_id'):
+    return [result[key] for result in results]
+
+
+def test_index_follows_edits_and_deletes(app, post_ids):
+    post_id, comment_id = post_ids
+    client = app.test_client()
+
+    # The last word matches as a prefix; matches are marked in the escaped snippet
+    [post] = search(client, 'volcan')
+    assert post['post_id'] == post_id
+    assert post['snippet'].startswith('<mark>Volcanoes</mark> &lt;erupt&gt;')
+    assert ids(search(client, 'volcano', 'comments'), 'comment_id') == [comment_id]
+    assert '<mark>volcano</mark>' in search(client, 'volcano', 'comments')[0]['snippet']
+
+    with app.app_context():
+        db.session.get(Post, post_id).title = 'Glaciers melting'
+        db.session.get(Comment, comment_id).content = 'Great glacier photos'
+        db.session.commit()
+    assert search(client, 'volcanoes') == []
+    assert search(client, 'volcano', 'comments') == []
+    assert ids(search(client, 'glaciers melting')) == [post_id]
+    assert ids(search(client, 'glacier', 'comments'), 'comment_id') == [comment_id]
+    # The untouched content is still indexed
+    assert ids(search(client, 'lava')) == [post_id]
+
+    with app.app_context():
+        db.session.delete(db.session.get(Comment, comment_id))
+        db.session.delete(db.session.get(Post, post_id))
+        db.session.commit()
+    assert search(client, 'glacier') == []
+    assert search(client, 'lava') == []
+    assert search(client, 'glacier', 'comments') == []
+
+
+def test_rebuild_search_indexes_rows_written_without_triggers(app, engine, db_path, post_ids):
+    post_id, _ = post_ids
+    with engine.begin() as connection:
+        drop_search_triggers(connection)
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("UPDATE posts SET title = 'Bulk loaded title' WHERE id = ?", (post_id,))
+    client = app.test_client()
+    assert search(client, 'bulk') == []
+
+    assert 'Search index rebuilt.' in app.test_cli_runner().invoke(args=['rebuild-search']).output
+    assert ids(search(client, 'bulk loaded')) == [post_id]
+    assert search(client, 'volcanoes') == []
+    # The triggers are back too
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("UPDATE posts SET title = 'Triggered again' WHERE id = ?", (post_id,))
+    assert ids(search(client, 'triggered')) == [post_id]
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from seed_db import checked_transaction, seed
+
+
+def test_chunks_check_foreign_keys_at_commit(engine):
+    seed(engine, users=3, subllmits=2, posts=4, comments_per_post=2, progress=False)
+    statement = 'INSERT INTO comments (id, post_id, parent_comment_id, content) VALUES (?, ?, ?, ?)'
+    # A reply may come before its parent within a chunk...
+    with checked_transaction(engine) as connection:
+        connection.exec_driver_sql(statement, [(1001, 1, 1002, 'reply'), (1002, 1, None, 'parent')])
+    # ...but a comment on a post that doesn't exist fails the whole chunk
+    with pytest.raises(IntegrityError):
+        with checked_transaction(engine) as connection:
+            connection.exec_driver_sql(statement, [(1003, 1, None, 'fine'), (1004, 999, None, 'orphan')])
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT COUNT(*) FROM comments WHERE id > 1000').scalar() == 2
+        # The app's own connections still run without foreign keys
+        assert connection.exec_driver_sql('PRAGMA foreign_keys').scalar() == 0
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+from structured_output import JSONScanner, StructuredStats, generate_json
+
+
+class FakeStream:
+    # A streamed completion, one chunk per piece of text; remembers how far it was read
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    def close(self):
+        self.closed = True
+
+def fake_client(*answers):
+    # Hands out one FakeStream per request, answers given as lists of pieces
+    streams = [FakeStream(pieces) for pieces in answers]
+    queued = iter(streams)
+    create = lambda **request: next(queued)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))), streams
+
+
+def test_scanner_finds_the_end_of_a_nested_value_across_chunks():
+    scanner = JSONScanner()
+    pieces = ['Sure! Here it is: {"title": "A } in', ' a string", "tags": ["x",', ' {"y": "\\"}"}]', '} Hope this helps {']
+    done = [scanner.feed(piece) for piece in pieces]
+    assert done == [False, False, False, True]
+    assert scanner.value_text() == '{"title": "A } in a string", "tags": ["x", {"y": "\\"}"}]}'
+    # Anything fed after the end is ignored
+    assert scanner.feed('"more"}') and scanner.complete
+
+
+def test_scanner_for_arrays_skips_text_before_the_bracket():
+    scanner = JSONScanner('[')
+    assert not scanner.feed('Comments: ')
+    assert scanner.value_text() is None
+    assert scanner.feed('[{"comment": "a]b"}, {"comment": "c"}] and then')
+    assert scanner.value_text() == '[{"comment": "a]b"}, {"comment": "c"}]'
+
+
+def test_stream_is_closed_at_the_closing_brace():
+    client, (stream,) = fake_client(['{"title": ', '"Hi"}', ' Here is', ' another one:', ' {"title": "x"}'])
+    stats = StructuredStats()
+    assert generate_json(client, stats, required=('title',)) == {"title": "Hi"}
+    assert stream.read == 2 and stream.closed
+    assert stats.early_stops == 1 and stats.tokens == 2 and stats.wasted_tokens == 0
+
+
+def test_missing_field_is_asked_for_again():
+    client, streams = fake_client(['{"title": " "}'], ['{"title": "Second try"}'])
+    stats = StructuredStats()
+    assert generate_json(client, stats, required=('title',), retries=1) == {"title": "Second try"}
+    assert all(stream.closed for stream in streams)
+    assert (stats.attempts, stats.invalid, stats.wasted_tokens, stats.succeeded) == (2, 1, 1, 1)
+
+
+def test_gives_up_after_the_retries():
+    client, _ = fake_client(['no json here'], ['{"title": "cut off'], ['{"content": "no title"}'])
+    stats = StructuredStats()
+    assert generate_json(client, stats, required=('title',), retries=2) is None
+    assert (stats.parse_failures, stats.invalid, stats.gave_up) == (2, 1, 1)
+
+
+def test_array_items_missing_a_field_keep_their_position():
+    client, _ = fake_client(['[{"comment": "a"}, {"user": 2}, {"comment": "c", "reply_to": 2}]'])
+    items = generate_json(client, required=('comment',), opening='[')
+    assert items == [{"comment": "a"}, None, {"comment": "c", "reply_to": 2}]
+
+
+def test_array_without_a_usable_item_is_retried():
+    client, _ = fake_client(['[{"user": 1}]'], ['[{"comment": "ok"}]'])
+    stats = StructuredStats()
+    assert generate_json(client, stats, required=('comment',), retries=1, opening='[') == [{"comment": "ok"}]
+    assert stats.invalid == 1
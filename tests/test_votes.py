@@ -0,0 +1,90 @@
+import sqlite3
+import pytest
+from app import db, Post, Subllmit, User
+from votes import VoteBuffer, VOTE_VALUES
+
+
+@pytest.fixture
+def post_id(app):
+    # Two users and a post for them to vote on
+    with app.app_context():
+        db.session.add(Subllmit(name='science'))
+        db.session.add_all([User(username='alice', password='x'), User(username='bob', password='x')])
+        post = Post(group_name='science', title='Votes please')
+        db.session.add(post)
+        db.session.commit()
+        return post.id
+
+def make_buffer(app):
+    # Flushed by hand only: a long interval keeps the background thread out of the way
+    buffer = VoteBuffer(app, db)
+    buffer.flush_interval = 3600
+    return buffer
+
+def counts(app, post_id):
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        return post.upvotes, post.downvotes, post.score
+
+
+def test_repeated_votes_change_nothing(app, post_id):
+    buffer = make_buffer(app)
+
+    assert buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+    # Known from the pending ledger...
+    assert not buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+    assert buffer.flush() == 1
+    # ...and, once flushed, from the votes table
+    assert not buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+    assert buffer.pending() == 0
+    assert counts(app, post_id) == (1, 0, 1)
+
+    # Switching sides moves the vote instead of adding one
+    assert buffer.record(1, 'post', post_id, VOTE_VALUES['downvote'])
+    assert buffer.flush() == 1
+    assert counts(app, post_id) == (0, 1, -1)
+
+
+def test_failed_flush_is_put_back_and_retried(app, db_path, post_id):
+    buffer = make_buffer(app)
+    buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+    buffer.record(2, 'post', post_id, VOTE_VALUES['upvote'])
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('ALTER TABLE votes RENAME TO votes_away')
+    with pytest.raises(Exception):
+        buffer.flush()
+    assert buffer.pending() == 2
+    assert counts(app, post_id) == (0, 0, 0)
+
+    # The batch is back in the ledger: a repeat is still recognised, a newer vote wins
+    assert not buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+    assert buffer.record(2, 'post', post_id, VOTE_VALUES['clear'])
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('ALTER TABLE votes_away RENAME TO votes')
+    assert buffer.flush() == 2
+    assert counts(app, post_id) == (1, 0, 1)
+    with sqlite3.connect(db_path) as connection:
+        assert sorted(connection.execute('SELECT user_id, value FROM votes')) == [(1, 1), (2, 0)]
+
+
+def test_vote_flushed_while_reading_the_ledger_is_not_counted_twice(app, post_id):
+    buffer = make_buffer(app)
+    stored_vote = buffer._stored_vote
+    raced = []
+
+    def read_then_race(*key):
+        # The votes table is read, then another request from the same user
+        # votes the same way and is flushed before this one takes the lock
+        value = stored_vote(*key)
+        if not raced:
+            raced.append(True)
+            assert buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+            assert buffer.flush() == 1
+        return value
+
+    buffer._stored_vote = read_then_race
+    assert not buffer.record(1, 'post', post_id, VOTE_VALUES['upvote'])
+    assert buffer.pending() == 0
+    assert counts(app, post_id) == (1, 0, 1)
@@ -0,0 +1,126 @@
+import sqlite3
+import pytest
+import world_dump
+from app import db
+from image_queue import enqueue
+from seed_db import seed
+from world_dump import TABLES, export_world, import_world
+
+
+@pytest.fixture
+def world(engine):
+    # A small synthetic world: a few users and subllmits, posts with comment threads
+    return seed(engine, users=6, subllmits=3, posts=25, comments_per_post=3, progress=False)
+
+@pytest.fixture
+def dump(engine, db_path, tmp_path, world):
+    # The world plus some votes, queued image jobs and an uploaded image
+    with sqlite3.connect(db_path) as connection:
+        connection.executemany(
+            "INSERT INTO votes (user_id, target_type, target_id, value) VALUES (?, 'post', ?, 1)",
+            [(user_id, post_id) for user_id in range(1, 7) for post_id in range(1, 6)])
+    with engine.begin() as connection:
+        enqueue(connection, [(post_id, f'a picture for post {post_id}') for post_id in (3, 7, 11)])
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    (uploads / 'cat.png').write_bytes(b'not really a png')
+    dump_dir = tmp_path / 'dump'
+    export_world(engine, dump_dir, uploads)
+    return dump_dir
+
+@pytest.fixture
+def target(make_app, tmp_path):
+    # An empty database to import into; returns its engine and path
+    path = tmp_path / 'imported.db'
+    with make_app(path).app_context():
+        return db.engine, path
+
+def table_rows(path, table, order_by):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(f'SELECT * FROM {table} ORDER BY {order_by}').fetchall()
+
+def assert_same_world(source, imported):
+    for table, order_by in TABLES:
+        assert table_rows(imported, table, order_by) == table_rows(source, table, order_by)
+
+
+def test_export_reads_every_table_from_one_snapshot(engine, db_path, tmp_path, world, monkeypatch):
+    export_table = world_dump.export_table
+
+    def export_then_write(connection, table, order_by, path):
+        info = export_table(connection, table, order_by, path)
+        if table == 'users':
+            # The populator adds a post and a comment on it between two tables
+            with sqlite3.connect(db_path) as other:
+                post_id = other.execute(
+                    "INSERT INTO posts (group_name, title, score, hot, comment_count) "
+                    "SELECT name, 'Written during the export', 0, 0, 1 FROM subllmits LIMIT 1"
+                ).lastrowid
+                other.execute("INSERT INTO comments (post_id, content) VALUES (?, 'So was this')", (post_id,))
+        return info
+
+    monkeypatch.setattr(world_dump, 'export_table', export_then_write)
+    manifest = export_world(engine, tmp_path / 'dump', tmp_path / 'uploads')
+
+    assert manifest['tables']['posts']['rows'] == world['posts']
+    assert manifest['tables']['comments']['rows'] == world['comments']
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM posts').fetchone() == (world['posts'] + 1,)
+
+
+def test_import_restores_the_exported_world(db_path, tmp_path, dump, target):
+    engine, path = target
+    assert import_world(engine, dump, tmp_path / 'imported_uploads') == {}
+
+    assert all(table_rows(db_path, table, order_by) for table, order_by in TABLES)
+    assert_same_world(db_path, path)
+    assert (tmp_path / 'imported_uploads' / 'cat.png').read_bytes() == b'not really a png'
+    # The frontpage and search index are rebuilt from the imported rows
+    with sqlite3.connect(path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM frontpage').fetchone()[0] > 0
+        assert connection.execute('SELECT COUNT(*) FROM posts_fts').fetchone()[0] == 25
+
+
+@pytest.mark.parametrize('table', ['posts', 'comments', 'votes'])
+def test_interrupted_import_resumes_without_duplicates_or_gaps(db_path, tmp_path, dump, target, table,
+                                                               monkeypatch):
+    engine, path = target
+    monkeypatch.setattr(world_dump, 'BATCH_SIZE', 10)
+    write_batch = world_dump.write_batch
+    batches = []
+
+    def interrupt_second_batch(engine, statement, batch):
+        # The second batch of `table` never lands: the import stops there
+        if statement.startswith(f'INSERT OR IGNORE INTO {table} '):
+            batches.append(batch)
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+        write_batch(engine, statement, batch)
+
+    monkeypatch.setattr(world_dump, 'write_batch', interrupt_second_batch)
+    with pytest.raises(KeyboardInterrupt):
+        import_world(engine, dump, tmp_path / 'imported_uploads')
+    with sqlite3.connect(path) as connection:
+        assert connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone() == (10,)
+
+    monkeypatch.setattr(world_dump, 'write_batch', write_batch)
+    with pytest.raises(world_dump.DumpError):
+        import_world(engine, dump, tmp_path / 'imported_uploads')
+    import_world(engine, dump, tmp_path / 'imported_uploads', resume=True)
+    assert_same_world(db_path, path)
+
+
+def test_dangling_references_are_imported_and_reported(engine, db_path, tmp_path, world, target):
+    # As create_bots.py used to leave things: posts and comments by users that are gone
+    with sqlite3.connect(db_path) as connection:
+        posts, comments = connection.execute(
+            'SELECT (SELECT COUNT(*) FROM posts WHERE user_id = 1), '
+            '(SELECT COUNT(*) FROM comments WHERE user_id = 1)').fetchone()
+        connection.execute('DELETE FROM users WHERE id = 1')
+    export_world(engine, tmp_path / 'dump', tmp_path / 'uploads')
+
+    imported, path = target
+    dangling = import_world(imported, tmp_path / 'dump', tmp_path / 'imported_uploads')
+    assert dangling == {key: rows for key, rows in
+                        {('posts', 'users'): posts, ('comments', 'users'): comments}.items() if rows}
+    assert_same_world(db_path, path)
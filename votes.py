@@ -0,0 +1,187 @@
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import text
+
+# Vote values as stored in the votes ledger
+VOTE_VALUES = {'upvote': 1, 'downvote': -1, 'clear': 0}
+
+# Counter columns live on these tables; posts also carry score/hot rankings
+TARGET_TABLES = {'post': 'posts', 'comment': 'comments'}
+
+UPSERT_VOTE = text('''
+    INSERT INTO votes (user_id, target_type, target_id, value, updated_at)
+    VALUES (:user_id, :target_type, :target_id, :value, :updated_at)
+    ON CONFLICT (user_id, target_type, target_id)
+    DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+''')
+
+# SET expressions all see the pre-update row, so hot is ranked from the new score
+APPLY_POST_DELTA = text('''
+    UPDATE posts
+    SET upvotes = upvotes + :up,
+        downvotes = downvotes + :down,
+        score = score + :up - :down,
+        hot = hot_rank(score + :up - :down, timestamp)
+    WHERE id = :id
+''')
+
+APPLY_COMMENT_DELTA = text('''
+    UPDATE comments
+    SET upvotes = upvotes + :up, downvotes = downvotes + :down
+    WHERE id = :id
+''')
+
+
+# Collects votes in memory and writes them as atomic SQL increments.
+# Repeated votes on the same post/comment merge into one delta, and a whole
+# batch of votes costs a single transaction, flushed either every
+# VOTE_FLUSH_INTERVAL seconds or as soon as VOTE_BUFFER_SIZE votes are pending.
+# The pending ledger is per process: two server processes each buffering votes
+# can't see each other's, so the same vote could be counted by both. Run one
+# process (threads are fine) or route vote writes to a single writer.
+class VoteBuffer:
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.max_pending = 500
+        self.flush_interval = 1.0
+        self.on_flush = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._ledger = {}
+        self._in_flight = {}
+        self._deltas = {}
+        # Bumped as each flush ends, so record() can tell its read of the votes table went stale
+        self._flushes = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.max_pending = app.config.get('VOTE_BUFFER_SIZE', self.max_pending)
+        self.flush_interval = app.config.get('VOTE_FLUSH_INTERVAL', self.flush_interval)
+        atexit.register(self.close)
+
+    def _stored_vote(self, user_id, target_type, target_id):
+        with self.app.app_context():
+            row = self.db.session.execute(
+                text('SELECT value FROM votes WHERE user_id = :user_id '
+                     'AND target_type = :target_type AND target_id = :target_id'),
+                {'user_id': user_id, 'target_type': target_type, 'target_id': target_id}
+            ).first()
+        return row[0] if row else 0
+
+    def _known_vote(self, key):
+        if key in self._ledger:
+            return self._ledger[key]
+        return self._in_flight.get(key)
+
+    def record(self, user_id, target_type, target_id, value):
+        # Returns False when the vote does not change anything (e.g. a double upvote)
+        key = (user_id, target_type, target_id)
+        with self._lock:
+            previous = self._known_vote(key)
+            flushes = self._flushes
+        while True:
+            if previous is None:
+                previous = self._stored_vote(user_id, target_type, target_id)
+
+            with self._lock:
+                # Another request from the same user may have voted in the meantime
+                known = self._known_vote(key)
+                if known is None and self._flushes != flushes:
+                    # ...and been flushed already, after the votes table was read
+                    previous, flushes = None, self._flushes
+                    continue
+                if known is not None:
+                    previous = known
+                if previous == value:
+                    return False
+                self._ledger[key] = value
+                delta = self._deltas.setdefault((target_type, target_id), [0, 0])
+                delta[0] += (value == 1) - (previous == 1)
+                delta[1] += (value == -1) - (previous == -1)
+                full = len(self._ledger) >= self.max_pending
+                break
+
+        if full:
+            self.flush()
+        else:
+            self._ensure_thread()
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._ledger)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                ledger, deltas = self._ledger, self._deltas
+                self._ledger, self._deltas = {}, {}
+                self._in_flight = ledger
+            if not ledger:
+                return 0
+
+            now = datetime.utcnow()
+            votes = [{'user_id': user_id, 'target_type': target_type, 'target_id': target_id,
+                      'value': value, 'updated_at': now}
+                     for (user_id, target_type, target_id), value in ledger.items()]
+            post_deltas = [{'id': target_id, 'up': up, 'down': down}
+                           for (target_type, target_id), (up, down) in deltas.items()
+                           if target_type == 'post' and (up or down)]
+            comment_deltas = [{'id': target_id, 'up': up, 'down': down}
+                              for (target_type, target_id), (up, down) in deltas.items()
+                              if target_type == 'comment' and (up or down)]
+            try:
+                with self.app.app_context():
+                    with self.db.engine.begin() as connection:
+                        connection.execute(UPSERT_VOTE, votes)
+                        if post_deltas:
+                            connection.execute(APPLY_POST_DELTA, post_deltas)
+                        if comment_deltas:
+                            connection.execute(APPLY_COMMENT_DELTA, comment_deltas)
+            except Exception:
+                self._restore(ledger, deltas)
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight = {}
+                    self._flushes += 1
+
+        for callback in self.on_flush:
+            callback(deltas)
+        return len(ledger)
+
+    def _restore(self, ledger, deltas):
+        # Put a failed batch back so the next flush retries it; newer votes win
+        with self._lock:
+            for key, value in ledger.items():
+                self._ledger.setdefault(key, value)
+            for target, (up, down) in deltas.items():
+                delta = self._deltas.setdefault(target, [0, 0])
+                delta[0] += up
+                delta[1] += down
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vote-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._wake.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing votes: {e}")
+
+    def close(self):
+        self._wake.set()
+        self.flush()
@@ -0,0 +1,231 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+from datetime import datetime
+from search import create_search_schema, drop_search_triggers, rebuild_search_index
+from frontpage import create_frontpage_schema, drop_frontpage_triggers, rebuild_frontpage
+
+# Streaming export and import of the generated world.
+#
+# A dump is a directory:
+#
+#   manifest.json              format version, row counts and columns per table
+#   users.ndjson.gz            one JSON object per row, in primary key order
+#   subllmits.ndjson.gz
+#   posts.ndjson.gz
+#   comments.ndjson.gz
+#   votes.ndjson.gz
+#   image_jobs.ndjson.gz       the image queue, so prompts still waiting for
+#                              image_worker.py move with the posts
+#   uploads.ndjson.gz          name, size and sha256 of every file in static/uploads
+#   uploads/                   copies of those files
+#
+# Export reads every table inside one read transaction, so a dump taken while
+# populate_db.py is writing is still a consistent snapshot (WAL lets the
+# writer carry on). pysqlite sends no BEGIN before a SELECT, so the export
+# issues its own; otherwise each table would be read at a different moment.
+# Rows are streamed straight from the cursor to gzip; no table is ever held
+# in memory.
+#
+# Import bulk-inserts BATCH_SIZE rows per executemany and transaction, with
+# the full-text search triggers dropped until the end, when the index is
+# rebuilt in one pass. Each batch is committed as it goes, so an interrupted
+# import can be resumed: rows at or below a table's current highest id are
+# skipped. Foreign keys are not enforced, as in the app: older databases have
+# posts and comments by users that no longer exist (create_bots.py used to
+# recreate the users table), and such a world still imports. What dangles is
+# counted with PRAGMA foreign_key_check and reported at the end.
+
+DUMP_VERSION = 1
+
+# Parents before children, so the rows already imported always reference rows
+# that exist. Each table is written in the order of its key.
+TABLES = [
+    ('users', 'id'),
+    ('subllmits', 'id'),
+    ('posts', 'id'),
+    ('comments', 'id'),
+    ('votes', 'user_id, target_type, target_id'),
+    ('image_jobs', 'id'),
+]
+
+BATCH_SIZE = 5000
+COPY_CHUNK = 1024 * 1024
+
+
+class DumpError(Exception):
+    pass
+
+
+def table_columns(connection, table):
+    return [row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({table})')]
+
+def row_count(connection, table):
+    return connection.exec_driver_sql(f'SELECT COUNT(*) FROM {table}').scalar()
+
+def export_table(connection, table, order_by, path):
+    columns = table_columns(connection, table)
+    result = connection.execution_options(yield_per=BATCH_SIZE).exec_driver_sql(
+        f'SELECT {", ".join(columns)} FROM {table} ORDER BY {order_by}'
+    )
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        for row in result:
+            f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+            rows += 1
+    return {"file": os.path.basename(path), "columns": columns, "rows": rows}
+
+def copy_file(source, target):
+    # Copies source to target and returns its sha256
+    digest = hashlib.sha256()
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while True:
+            chunk = src.read(COPY_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+def export_uploads(uploads_dir, dump_dir):
+    target_dir = os.path.join(dump_dir, 'uploads')
+    os.makedirs(target_dir, exist_ok=True)
+    files = 0
+    with gzip.open(os.path.join(dump_dir, 'uploads.ndjson.gz'), 'wt', encoding='utf-8') as manifest:
+        if os.path.isdir(uploads_dir):
+            for entry in sorted(os.scandir(uploads_dir), key=lambda entry: entry.name):
+                if not entry.is_file():
+                    continue
+                sha256 = copy_file(entry.path, os.path.join(target_dir, entry.name))
+                manifest.write(json.dumps({"name": entry.name, "size": entry.stat().st_size, "sha256": sha256}) + '\n')
+                files += 1
+    return files
+
+def export_world(engine, dump_dir, uploads_dir):
+    os.makedirs(dump_dir, exist_ok=True)
+    manifest = {"version": DUMP_VERSION, "created_at": datetime.utcnow().isoformat(), "tables": {}}
+    with engine.connect() as connection:
+        # One transaction for every table: the snapshot starts at the first SELECT
+        with connection.begin():
+            connection.exec_driver_sql('BEGIN')
+            for table, order_by in TABLES:
+                started = time.monotonic()
+                info = export_table(connection, table, order_by, os.path.join(dump_dir, f'{table}.ndjson.gz'))
+                manifest["tables"][table] = info
+                print(f"Exported {info['rows']} {table} in {time.monotonic() - started:.1f}s")
+    manifest["uploads"] = export_uploads(uploads_dir, dump_dir)
+    print(f"Exported {manifest['uploads']} uploaded files")
+    # Written last: a dump without manifest.json is incomplete
+    with open(os.path.join(dump_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def read_manifest(dump_dir):
+    path = os.path.join(dump_dir, 'manifest.json')
+    if not os.path.exists(path):
+        raise DumpError(f"{dump_dir} has no manifest.json (missing or unfinished export)")
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != DUMP_VERSION:
+        raise DumpError(f"Unsupported dump version {manifest.get('version')}")
+    return manifest
+
+def write_batch(engine, statement, batch):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(statement, batch)
+
+def dangling_references(connection):
+    # {(table, referenced table): rows} for rows whose foreign keys point nowhere
+    dangling = {}
+    for table, _, parent, _ in connection.exec_driver_sql('PRAGMA foreign_key_check'):
+        dangling[(table, parent)] = dangling.get((table, parent), 0) + 1
+    return dangling
+
+def import_table(engine, dump_dir, table, info):
+    with engine.connect() as connection:
+        target_columns = set(table_columns(connection, table))
+        last_id = None
+        if 'id' in target_columns:
+            last_id = connection.exec_driver_sql(f'SELECT MAX(id) FROM {table}').scalar()
+    # Columns the dump has but this database doesn't (or the reverse) are left out
+    columns = [column for column in info["columns"] if column in target_columns]
+    statement = (f'INSERT OR IGNORE INTO {table} ({", ".join(columns)}) '
+                 f'VALUES ({", ".join("?" for _ in columns)})')
+
+    started = time.monotonic()
+    batch = []
+    imported = skipped = 0
+    with gzip.open(os.path.join(dump_dir, info["file"]), 'rt', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            # Already imported by an earlier, interrupted run
+            if last_id is not None and row['id'] <= last_id:
+                skipped += 1
+                continue
+            batch.append(tuple(row.get(column) for column in columns))
+            if len(batch) >= BATCH_SIZE:
+                write_batch(engine, statement, batch)
+                imported += len(batch)
+                batch = []
+    if batch:
+        write_batch(engine, statement, batch)
+        imported += len(batch)
+
+    elapsed = time.monotonic() - started
+    resumed = f", {skipped} already present" if skipped else ""
+    print(f"Imported {imported} {table} in {elapsed:.1f}s "
+          f"({imported / max(elapsed, 1e-9):.0f} rows/s{resumed})")
+    return imported
+
+def import_uploads(dump_dir, uploads_dir):
+    os.makedirs(uploads_dir, exist_ok=True)
+    copied = 0
+    with gzip.open(os.path.join(dump_dir, 'uploads.ndjson.gz'), 'rt', encoding='utf-8') as manifest:
+        for line in manifest:
+            entry = json.loads(line)
+            name = os.path.basename(entry["name"])
+            target = os.path.join(uploads_dir, name)
+            if os.path.exists(target) and os.path.getsize(target) == entry["size"]:
+                continue
+            if copy_file(os.path.join(dump_dir, 'uploads', name), target) != entry["sha256"]:
+                os.remove(target)
+                raise DumpError(f"Checksum mismatch for uploads/{name}")
+            copied += 1
+    return copied
+
+def import_world(engine, dump_dir, uploads_dir, resume=False):
+    manifest = read_manifest(dump_dir)
+    with engine.connect() as connection:
+        occupied = [table for table, _ in TABLES if row_count(connection, table)]
+    if occupied and not resume:
+        raise DumpError(f"Tables {', '.join(occupied)} already have rows; import into a fresh "
+                        "database, or pass --resume to continue an interrupted import")
+
+    with engine.begin() as connection:
+        drop_search_triggers(connection)
+        drop_frontpage_triggers(connection)
+    try:
+        for table, _ in TABLES:
+            if table in manifest["tables"]:
+                import_table(engine, dump_dir, table, manifest["tables"][table])
+    finally:
+        # Put the triggers back even if the import stopped half way
+        with engine.begin() as connection:
+            create_search_schema(connection)
+            create_frontpage_schema(connection)
+    started = time.monotonic()
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+        rebuild_frontpage(connection)
+    print(f"Rebuilt the search index and the frontpage in {time.monotonic() - started:.1f}s")
+    copied = import_uploads(dump_dir, uploads_dir)
+    print(f"Copied {copied} uploaded files")
+
+    with engine.connect() as connection:
+        dangling = dangling_references(connection)
+    for (table, parent), rows in sorted(dangling.items()):
+        print(f"Warning: {rows} {table} rows reference {parent} rows that don't exist")
+    return dangling
@@ -0,0 +1,185 @@
+import time
+import bisect
+from sqlalchemy import text
+
+# What populate_db.py knows about the world, kept in memory between batches.
+#
+# The bot roster, the subllmit list and a ring buffer of recent posts are
+# loaded once and then topped up from a high-water mark: each refresh asks
+# only for rows with an id above the highest one already seen, so a refresh
+# with nothing new costs three index lookups. Picking a bot, a subllmit or a
+# recent post to comment on is then a list index, with no SQL at all.
+#
+# Refreshes happen at most every refresh_interval seconds and pick up bots,
+# subllmits and posts added by other processes (create_bots.py, people using
+# the site). Each refresh also checks that what is held still matches the
+# database: initialize_db.py recreates the tables, so ids start again from 1
+# and a high-water mark alone would never see the new rows. A roster with
+# fewer bots up to the mark, or a different bot at it, is reloaded whole, and
+# so are subllmits and recent posts when their highest id went down. An
+# edited bot keeps its old profile here until the populator restarts.
+
+NEW_BOTS = text('''
+    SELECT id, username, background, goal FROM users
+    WHERE user_type = 'bot' AND id > :after
+    ORDER BY id
+''')
+
+# Bots up to the high-water mark, and the username of the one at it
+ROSTER_CHECK = text('''
+    SELECT COUNT(*), (SELECT username FROM users WHERE id = :after AND user_type = 'bot') FROM users
+    WHERE user_type = 'bot' AND id <= :after
+''')
+
+HIGHEST_IDS = text('SELECT (SELECT COALESCE(MAX(id), 0) FROM subllmits), (SELECT COALESCE(MAX(id), 0) FROM posts)')
+
+NEW_SUBLLMITS = text('SELECT id, name FROM subllmits WHERE id > :after ORDER BY id')
+
+# Only the newest :limit are wanted; the ring buffer would drop the rest anyway
+NEW_POSTS = text('''
+    SELECT id, group_name, title FROM posts
+    WHERE id > :after
+    ORDER BY id DESC
+    LIMIT :limit
+''')
+
+REFRESH_INTERVAL = 30.0
+RECENT_POSTS = 500
+
+
+class Bot:
+    __slots__ = ('id', 'username', 'background', 'goal')
+
+    def __init__(self, id, username, background, goal):
+        self.id = id
+        self.username = username
+        self.background = background
+        self.goal = goal
+
+
+class BotRoster:
+    # Kept ordered by username rather than id, so the same roster created in
+    # another order (create_bots.py saves bots as they finish) gives the same
+    # picks for the same random numbers
+    def __init__(self):
+        self.bots = []
+        self._usernames = []
+        self._by_id = {}
+
+    def add(self, bot):
+        index = bisect.bisect(self._usernames, bot.username)
+        self._usernames.insert(index, bot.username)
+        self.bots.insert(index, bot)
+        self._by_id[bot.id] = bot
+
+    def choice(self, rng):
+        return self.bots[rng.randrange(len(self.bots))]
+
+    def __contains__(self, bot):
+        # The very same Bot, not just one with its id: ids repeat after a reset
+        return self._by_id.get(bot.id) is bot
+
+    def __len__(self):
+        return len(self.bots)
+
+
+class SubllmitSet:
+    def __init__(self):
+        self.names = []
+        self._known = set()
+
+    def add(self, name):
+        # Returns False for a name already present
+        if name in self._known:
+            return False
+        self._known.add(name)
+        self.names.append(name)
+        return True
+
+    def pick(self, n):
+        # Round robin: the n-th post goes to the n-th subllmit, wrapping around
+        return self.names[n % len(self.names)]
+
+    def __contains__(self, name):
+        return name in self._known
+
+    def __len__(self):
+        return len(self.names)
+
+
+class RecentPosts:
+    # Fixed-size ring of (post_id, group_name, title); the oldest entry is overwritten
+    def __init__(self, capacity=RECENT_POSTS):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._next = 0
+        self._count = 0
+
+    def add(self, post_id, group_name, title):
+        self._slots[self._next] = (post_id, group_name, title)
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def choice(self, rng):
+        return self._slots[rng.randrange(self._count)]
+
+    def __len__(self):
+        return self._count
+
+
+class WorldState:
+    def __init__(self, engine, refresh_interval=REFRESH_INTERVAL, recent_posts=RECENT_POSTS):
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.bots = BotRoster()
+        self.subllmits = SubllmitSet()
+        self.recent_posts = RecentPosts(recent_posts)
+        self.refreshes = 0
+        self.resets = 0
+        self._last_bot_id = 0
+        self._last_bot_username = None
+        self._last_subllmit_id = 0
+        self._last_post_id = 0
+        self._refreshed_at = None
+
+    def refresh(self):
+        with self.engine.connect() as connection:
+            if self._last_bot_id:
+                count, username = connection.execute(ROSTER_CHECK, {'after': self._last_bot_id}).one()
+                if count != len(self.bots) or username != self._last_bot_username:
+                    self.bots = BotRoster()
+                    self._last_bot_id = 0
+                    self._last_bot_username = None
+                    self.resets += 1
+            highest_subllmit, highest_post = connection.execute(HIGHEST_IDS).one()
+            if highest_subllmit < self._last_subllmit_id:
+                self.subllmits = SubllmitSet()
+                self._last_subllmit_id = 0
+                self.resets += 1
+            if highest_post < self._last_post_id:
+                self.recent_posts = RecentPosts(self.recent_posts.capacity)
+                self._last_post_id = 0
+                self.resets += 1
+            bots = connection.execute(NEW_BOTS, {'after': self._last_bot_id}).all()
+            subllmits = connection.execute(NEW_SUBLLMITS, {'after': self._last_subllmit_id}).all()
+            posts = connection.execute(NEW_POSTS, {'after': self._last_post_id,
+                                                   'limit': self.recent_posts.capacity}).all()
+        for bot_id, username, background, goal in bots:
+            self.bots.add(Bot(bot_id, username, background, goal))
+            self._last_bot_id = bot_id
+            self._last_bot_username = username
+        for subllmit_id, name in subllmits:
+            self.subllmits.add(name)
+            self._last_subllmit_id = subllmit_id
+        for post_id, group_name, title in reversed(posts):
+            self.recent_posts.add(post_id, group_name, title)
+            self._last_post_id = post_id
+        self.refreshes += 1
+        self._refreshed_at = time.monotonic()
+        return len(bots), len(subllmits), len(posts)
+
+    def maybe_refresh(self):
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+            return True
+        return False